@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from variables import (
+    admission_user_rate,
+    admission_user_burst,
+    admission_global_rate,
+    admission_global_burst,
+    admission_max_queued_per_user,
+    admission_max_queued,
+)
+from send_scheduler import TokenBucket
+
+MAX_TRACKED_USERS = 100000
+
+
+class AdmissionRejected(Exception):
+    """
+    The user (or everyone together) already has as many downloads queued as allowed.
+    """
+
+
+class AdmissionController:
+    """
+    Token buckets per user and over all users in front of every download, shared by the bot
+    handlers and /api/submit. A download costs one token per post.
+
+    admit() lets a download through right away when the user has nothing queued, nobody queued is
+    waiting on the global bucket and both buckets have the tokens. Otherwise it is queued: every
+    user has their own queue and queued users take turns, so one user's hundred links delay that
+    user rather than everyone sending a link after them. A queued download's run_later() is called
+    from the admission thread once it's admitted; it should only hand the work off (to a pool or
+    an event loop).
+
+    A rate of 0 turns that bucket off.
+    """
+    def __init__(self, user_rate: float, user_burst: float, global_rate: float, global_burst: float,
+                 max_queued_per_user: int, max_queued: int):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self._global = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self._users = OrderedDict() # user id -> TokenBucket, least recently used first
+        self._queues = {} # user id -> deque of (cost, run_later)
+        self._turns = deque() # users with queued downloads, whose turn is next first
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def _user_bucket(self, user_id):
+        if self.user_rate <= 0:
+            return None
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self._users) > MAX_TRACKED_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    @staticmethod
+    def _wait_time(bucket, now: float, cost: int) -> float:
+        # a download bigger than the burst waits for a full bucket, not forever
+        return bucket.wait_time(now, min(cost, bucket.burst)) if bucket is not None else 0.0
+
+    @staticmethod
+    def _take(bucket, now: float, cost: int):
+        if bucket is not None:
+            bucket.take(now, min(cost, bucket.burst))
+
+    def _waiting_on_global(self, now: float) -> bool:
+        """
+        Whether a queued user is only waiting for the global bucket, in which case newcomers go
+        behind them instead of taking the tokens as they refill.
+        """
+        if self._global is None:
+            return False
+        for user_id in self._turns:
+            cost, _ = self._queues[user_id][0]
+            if self._wait_time(self._user_bucket(user_id), now, cost) == 0:
+                return True
+        return False
+
+    def admit(self, user_id: int, cost: int, run_later) -> int:
+        """
+        Returns 0 when the download may start now (the caller runs it), else its position in the
+        queue, run_later() being called when its turn comes. Raises AdmissionRejected when the
+        queue is full.
+        """
+        cost = max(1, cost)
+        with self._cond:
+            now = time.monotonic()
+            user_bucket = self._user_bucket(user_id)
+            queue = self._queues.get(user_id)
+            if (not queue and not self._waiting_on_global(now)
+                    and self._wait_time(user_bucket, now, cost) == 0 and self._wait_time(self._global, now, cost) == 0):
+                self._take(user_bucket, now, cost)
+                self._take(self._global, now, cost)
+                self.stats["admitted"] += 1
+                return 0
+
+            if (queue and len(queue) >= self.max_queued_per_user) or self._queued >= self.max_queued:
+                self.stats["rejected"] += 1
+                raise AdmissionRejected(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+                self._turns.append(user_id)
+            queue.append((cost, run_later))
+            self._queued += 1
+            self.stats["queued"] += 1
+            # users take turns: everyone else's first len(queue) downloads go before this one
+            position = sum(min(len(other), len(queue)) for other in self._queues.values())
+            self._ensure_started()
+            self._cond.notify()
+            return position
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="admission", daemon=True)
+            self._thread.start()
+
+    def _next_admitted(self):
+        """
+        Takes the next download that can start from the queues, or returns the seconds to wait.
+        """
+        now = time.monotonic()
+        wait = None
+        for _ in range(len(self._turns)):
+            user_id = self._turns[0]
+            queue = self._queues[user_id]
+            cost, run_later = queue[0]
+            user_bucket = self._user_bucket(user_id)
+            user_wait = self._wait_time(user_bucket, now, cost)
+            if user_wait > 0:
+                # this user is over their own rate, the next one may go
+                self._turns.rotate(-1)
+                wait = user_wait if wait is None else min(wait, user_wait)
+                continue
+            global_wait = self._wait_time(self._global, now, cost)
+            if global_wait > 0:
+                # the user keeps their turn for when the global bucket refills
+                return None, global_wait if wait is None else min(wait, global_wait)
+
+            self._take(user_bucket, now, cost)
+            self._take(self._global, now, cost)
+            queue.popleft()
+            self._queued -= 1
+            self._turns.popleft()
+            if queue:
+                self._turns.append(user_id)
+            else:
+                del self._queues[user_id]
+            self.stats["admitted"] += 1
+            return run_later, 0.0
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._turns:
+                    self._cond.wait()
+                run_later, wait = self._next_admitted()
+                if run_later is None:
+                    self._cond.wait(wait)
+                    continue
+            try:
+                run_later()
+            except Exception as e:
+                print("Admission run error:", repr(e))
+
+    def queued(self) -> int:
+        with self._cond:
+            return self._queued
+
+
+admission = AdmissionController(
+    admission_user_rate,
+    admission_user_burst,
+    admission_global_rate,
+    admission_global_burst,
+    admission_max_queued_per_user,
+    admission_max_queued,
+)
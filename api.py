@@ -13,18 +13,16 @@ from variables import bot
 BOT_TOKEN = (os.getenv("BEST_INSTAGRAM_DOWNLOADER_BOT_API") or "").strip()
 if not BOT_TOKEN:
     raise RuntimeError("Missing BEST_INSTAGRAM_DOWNLOADER_BOT_API env var")
-from functions import (
-    get_post_or_reel_shortcode_from_link,
-    try_to_delete_message,
-)
-from riad_azz import get_instagram_media_links
-from best_instagram_downloader import (
-    wrong_pattern_msg,
+from functions import log
+from jobs import job_queue, FAILED
+from send_scheduler import send_scheduler
+from membership import is_user_joined_updates_channel
+from admission import admission, AdmissionRejected
+from link_router import route_text, route_post_count
+from variables import (
     fail_msg,
-    end_msg,
-    caption_trail,
     bot_username,
-    log,
+    max_links_per_message,
 )
 
 api = Blueprint("api", __name__)
@@ -32,8 +30,8 @@ api = Blueprint("api", __name__)
 # ---------------------------
 # Join-gate configuration
 # ---------------------------
-UPDATES_CHANNEL = "@quickgram_downloader"  # TODO: change this
 JOIN_REQUIRED_ERROR = "Please join the updates channel first, then tap Download again."    
+RATE_LIMITED_ERROR = "You've sent a lot of links in a short time. Wait a minute and try again."
 
 # ---------------------------
 # Telegram Mini App security
@@ -69,24 +67,6 @@ def verify_init_data(init_data: str, max_age: int = 3600) -> int:
     user = json.loads(parsed["user"])
     return int(user["id"])
     
-# Join Gate 
-def is_user_joined_updates_channel(user_id: int) -> bool:
-    """
-    Returns True if user is a member/admin/creator in the updates channel.
-    Note: for reliable checks, the bot should be an admin in the channel.
-    """
-    try:
-        member = bot.get_chat_member(UPDATES_CHANNEL, user_id)
-        status = getattr(member, "status", None)
-        return status in ("member", "administrator", "creator")
-    except Exception as e:
-        # If we can't verify, treat as not joined (safe default)
-        try:
-            log(f"{bot_username} join-gate check error:\n{repr(e)}\nuser: {user_id}")
-        except:
-            pass
-        return False
-
 # ---------------------------
 # Routes (LIVE HERE)
 # ---------------------------
@@ -99,6 +79,9 @@ def mini_app():
 def submit_download():
     body = request.get_json(silent=True) or {}
     link = body.get("link", "").strip()
+    links = body.get("links")
+    if isinstance(links, list):
+        link = "\n".join([link] + [str(l) for l in links]).strip()
     init_data = body.get("initData", "").strip()
 
     if not link:
@@ -114,8 +97,17 @@ def submit_download():
                 "join_required": True
             }), 403
 
-        process_link(user_id, link)
-        return jsonify({"ok": True})
+        # the download runs on the job pool once admission lets it through, the mini app polls /api/jobs/<id>
+        job_id = job_queue.create(user_id)
+        try:
+            position = admission.admit(user_id, route_post_count(route_text(link), max_links_per_message),
+                                       lambda: job_queue.start(job_id, download_job, user_id, link))
+        except AdmissionRejected:
+            job_queue.store.update(job_id, FAILED, "queue full")
+            return jsonify({"error": RATE_LIMITED_ERROR}), 429
+        if not position:
+            job_queue.start(job_id, download_job, user_id, link)
+        return jsonify({"ok": True, "job_id": job_id, "position": position}), 202
 
     except ValueError as e:
         # Auth/signature problems or expired initData
@@ -132,45 +124,35 @@ def submit_download():
             pass
         return jsonify({"error": "Download failed. Try again later."}), 500
 
+@api.get("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+
+    result = {"job_id": job["id"], "status": job["status"]}
+    if job["status"] == FAILED:
+        result["error"] = "Download failed. Try again later."
+    return jsonify(result)
+
 # ---------------------------
 # Shared download logic
 # ---------------------------
 
-def process_link(chat_id: int, link: str):
-    guide = bot.send_message(chat_id, "Ok wait a few moments...")
-
-    shortcode = get_post_or_reel_shortcode_from_link(link)
-    if not shortcode:
-        try_to_delete_message(chat_id, guide.message_id)
-        bot.send_message(chat_id, wrong_pattern_msg, parse_mode="HTML")
-        return
-
-    media_links, caption = get_instagram_media_links(shortcode)
-    if not media_links:
-        try_to_delete_message(chat_id, guide.message_id)
-        bot.send_message(chat_id, fail_msg, parse_mode="HTML")
-        return
-
-    caption = caption or ""
-    while len(caption) + len(caption_trail) > 1024:
-        caption = caption[:-1]
-    caption += caption_trail
-
-    media = []
-    for i, item in enumerate(media_links):
-        if item["type"] == "video":
-            m = types.InputMediaVideo(item["url"], caption if i == 0 else None)
-        else:
-            m = types.InputMediaPhoto(item["url"], caption if i == 0 else None)
-        media.append(m)
-
-    for i in range(0, len(media), 10):
-        bot.send_media_group(chat_id, media[i:i+10])
-
-    bot.send_message(
-    chat_id,
-    end_msg,
-    parse_mode="HTML",
-    disable_web_page_preview=True
-)
-    try_to_delete_message(chat_id, guide.message_id)
\ No newline at end of file
+def download_job(user_id: int, link: str):
+    # the download pipeline isn't imported with the web routes, the webhook server loads it
+    # alongside the bot handlers once it's up (see webhook_server.load_handlers)
+    from api_downloads import process_link
+
+    try:
+        process_link(user_id, link)
+    except Exception as e:
+        try:
+            log(f"{bot_username} miniapp error:\n{repr(e)}")
+        except:
+            pass
+        try:
+            send_scheduler.send_message(user_id, fail_msg, parse_mode="HTML")
+        except:
+            pass
+        raise
@@ -0,0 +1,41 @@
+from functions import get_all_post_or_reel_shortcodes_from_text
+from media_sender import deliver_posts
+from send_scheduler import send_scheduler
+from metrics import timed
+from variables import (
+    wrong_pattern_msg,
+    fail_msg,
+    bulk_partial_fail_msg,
+    end_msg,
+)
+
+# the mini app's downloads (api.download_job), kept out of api so the web routes load without
+# the download pipeline
+
+@timed("process_link", track_in_flight=True)
+def process_link(chat_id: int, link: str):
+    guide = send_scheduler.submit_message(chat_id, "Ok wait a few moments...")
+
+    # a submission can carry several links, they are looked up concurrently and sent in order
+    shortcodes = get_all_post_or_reel_shortcodes_from_text(link)
+    if not shortcodes:
+        send_scheduler.delete_later(chat_id, guide)
+        send_scheduler.send_message(chat_id, wrong_pattern_msg, parse_mode="HTML")
+        return
+
+    results = deliver_posts(chat_id, chat_id, shortcodes, wait_for=guide, source="api")
+    failed = [result for result in results if not isinstance(result, int) or not result]
+    if len(failed) == len(shortcodes):
+        send_scheduler.delete_later(chat_id, guide)
+        send_scheduler.send_message(chat_id, fail_msg, parse_mode="HTML")
+        return
+    if failed:
+        send_scheduler.send_message(chat_id, bulk_partial_fail_msg.format(failed=len(failed), total=len(shortcodes)))
+
+    send_scheduler.delete_later(chat_id, guide)
+    send_scheduler.send_message(
+    chat_id,
+    end_msg,
+    parse_mode="HTML",
+    disable_web_page_preview=True
+)
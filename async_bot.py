@@ -0,0 +1,377 @@
+import asyncio
+import time
+import weakref
+
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+
+from functions import *
+from membership import (
+    UPDATES_CHANNEL,
+    UPDATES_CHANNEL_URL,
+    membership_cache,
+    remember_membership,
+)
+from media_sender import (
+    build_caption,
+    build_input_media,
+    cached_post,
+    remember_file_ids,
+)
+from media_upload import upload_media_items, is_url_fetch_error
+from caching import file_id_cache
+from renditions import QUALITIES, quality_store, select_rendition, user_quality
+from riad_azz_async import lookup_media_links_async
+from ledger import FILE_ID, CACHE_HIT, CACHE_MISS, OK, EMPTY, ERROR, record_request
+from async_http_client import close_sessions
+from profile_export import parse_username, profile_exporter, submit_profile_export
+from link_router import POST, REEL, TV, SHARE, STORY, SPOTIFY, routed, route_message, route_post_count
+from share_resolver import route_post_shortcodes
+from admission import admission, AdmissionRejected
+
+# asyncio mode: same handlers as best_instagram_downloader.py, but every network wait is a coroutine,
+# so one process can have thousands of downloads in flight instead of one per thread.
+# start with: python best_instagram_downloader.py --async
+
+# the same bot api server as the sync bot (TELEGRAM_API_URL), asyncio_helper keeps its own urls
+if telegram_api_url:
+    asyncio_helper.API_URL = telegram_api_url + "/bot{0}/{1}"
+    asyncio_helper.FILE_URL = telegram_file_url
+
+async_bot = AsyncTeleBot(bot_token, parse_mode="HTML")
+
+# ----------------------------
+# Join gate
+# ----------------------------
+async def is_user_joined_updates_channel_async(user_id: int, use_cache: bool = True) -> bool:
+    if use_cache:
+        joined = membership_cache.get(user_id)
+        if joined is not None:
+            return joined
+
+    try:
+        member = await async_bot.get_chat_member(UPDATES_CHANNEL, user_id)
+        return remember_membership(user_id, getattr(member, "status", None))
+    except Exception as e:
+        log(f"{bot_username} log:\n\njoin-check error: {repr(e)}\nuser: {user_id}")
+        return False
+
+async def send_join_gate(chat_id: int):
+    kb = types.InlineKeyboardMarkup(row_width=1)
+    kb.add(
+        types.InlineKeyboardButton("Join updates channel", url=UPDATES_CHANNEL_URL),
+        types.InlineKeyboardButton("Refresh", callback_data="refresh_join_gate"),
+    )
+    await async_bot.send_message(chat_id, join_gate_msg, parse_mode="HTML", disable_web_page_preview=True, reply_markup=kb)
+
+async def require_join_or_gate(message) -> bool:
+    if await is_user_joined_updates_channel_async(message.from_user.id):
+        return True
+    await send_join_gate(message.chat.id)
+    return False
+
+async def try_to_delete_message_async(chat_id, message_id):
+    try:
+        await async_bot.delete_message(chat_id, message_id)
+    except:
+        pass # ignore errors if user has already deleted the message
+
+@async_bot.callback_query_handler(func=lambda call: call.data == "refresh_join_gate")
+async def refresh_join_gate_handler(call):
+    try:
+        await async_bot.answer_callback_query(call.id)
+    except:
+        pass
+
+    chat_id = call.message.chat.id
+    if await is_user_joined_updates_channel_async(call.from_user.id, use_cache=False):
+        await try_to_delete_message_async(chat_id, call.message.message_id)
+        await async_bot.send_message(chat_id, start_msg, parse_mode="HTML", disable_web_page_preview=True)
+        log(f"{bot_username} log:\n\nuser: {chat_id}\n\nrefresh success (joined)")
+    else:
+        try:
+            await async_bot.answer_callback_query(call.id, "You still need to join the updates channel first.", show_alert=True)
+        except:
+            pass
+        log(f"{bot_username} log:\n\nuser: {chat_id}\n\nrefresh denied (not joined)")
+
+@async_bot.chat_member_handler(func=lambda update: (update.chat.username or "").lower() == UPDATES_CHANNEL.lstrip("@").lower())
+async def updates_channel_member_handler(update):
+    remember_membership(update.new_chat_member.user.id, update.new_chat_member.status)
+
+# ----------------------------
+# Sending
+# ----------------------------
+async def send_media_chunk_async(chat_id: int, items, caption: str, by_url: bool):
+    try:
+        if len(items) == 1:
+            media_type, media = items[0]
+            if media_type == "video":
+                return [await async_bot.send_video(chat_id, media, caption=caption)]
+            return [await async_bot.send_photo(chat_id, media, caption=caption)]
+        return await async_bot.send_media_group(chat_id, build_input_media(items, caption))
+    except ApiTelegramException as e:
+        if not (by_url and is_url_fetch_error(e)):
+            raise
+        # the streamed upload is blocking io, keep it off the event loop
+        return await asyncio.to_thread(upload_media_items, chat_id, items, caption)
+
+async def send_media_items_async(chat_id: int, items, caption: str, by_url: bool = True, messages: list = None):
+    if messages is None:
+        messages = []
+    for i in range(0, len(items), 10):
+        messages.extend(await send_media_chunk_async(chat_id, items[i:i + 10], caption if i == 0 else None, by_url))
+    return messages
+
+async def timed_lookup_async(shortcode: str):
+    """
+    Async media_sender.timed_lookup.
+    """
+    started = time.perf_counter()
+    media_links, caption, cache_hit = await lookup_media_links_async(shortcode)
+    return media_links, caption, CACHE_HIT if cache_hit else CACHE_MISS, (time.perf_counter() - started) * 1000
+
+async def deliver_post_async(chat_id: int, shortcode: str, lookup=None, user_id: int = None) -> int:
+    """
+    Async media_sender.deliver_post, lookup can be an already started timed_lookup_async task.
+    """
+    count, cache, upstream_ms, send_ms, outcome, error = 0, FILE_ID, None, None, ERROR, None
+    # the settings and file_id caches have sqlite tiers, their calls run off the event loop
+    quality = await asyncio.to_thread(user_quality, user_id)
+    sent = [] # messages of a file_id resend, kept when it fails partway
+    try:
+        cached = await asyncio.to_thread(cached_post, shortcode, quality)
+        if cached:
+            items = [tuple(item) for item in cached["media"]]
+            try:
+                started = time.perf_counter()
+                await send_media_items_async(chat_id, items, build_caption(cached["caption"]), by_url=False, messages=sent)
+                count, send_ms, outcome = len(items), (time.perf_counter() - started) * 1000, OK
+                return count
+            except ApiTelegramException as e:
+                print("Cached file_id send failed:", repr(e))
+                await asyncio.to_thread(file_id_cache.delete, shortcode)
+
+        cache = CACHE_MISS # until the lookup says otherwise
+        media_links, caption, cache, upstream_ms = await (lookup if lookup is not None else timed_lookup_async(shortcode))
+        if not media_links:
+            outcome = EMPTY
+            return 0
+
+        started = time.perf_counter()
+        items = [(item.type, select_rendition(item, quality)) for item in media_links]
+        if sent:
+            # only the groups the failed resend didn't get to
+            await send_media_items_async(chat_id, items[len(sent):], None)
+        else:
+            messages = await send_media_items_async(chat_id, items, build_caption(caption))
+            await asyncio.to_thread(remember_file_ids, shortcode, items, messages, caption, quality)
+        send_ms = (time.perf_counter() - started) * 1000
+        count, outcome = len(items), OK
+        return count
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record_request("async", user_id, chat_id, shortcode, count, cache, upstream_ms, send_ms, outcome, error)
+
+# user id -> semaphore capping that user's concurrent lookups, across all their messages
+user_lookup_slots = weakref.WeakValueDictionary()
+
+def user_slots(user_id: int) -> asyncio.Semaphore:
+    slots = user_lookup_slots.get(user_id)
+    if slots is None:
+        slots = user_lookup_slots[user_id] = asyncio.Semaphore(bulk_per_user_lookups)
+    return slots
+
+async def deliver_posts_async(chat_id: int, user_id: int, shortcodes):
+    """
+    Async media_sender.deliver_posts: lookups run concurrently (at most bulk_per_user_lookups at a time
+    per user), posts are sent in link order. Returns, per shortcode, the number of items sent or the exception.
+    """
+    slots = user_slots(user_id)
+
+    async def lookup(shortcode):
+        async with slots:
+            return await timed_lookup_async(shortcode)
+
+    quality = await asyncio.to_thread(user_quality, user_id)
+    uncached = await asyncio.to_thread(lambda: [shortcode for shortcode in shortcodes if not cached_post(shortcode, quality)])
+    lookups = {shortcode: asyncio.ensure_future(lookup(shortcode)) for shortcode in uncached}
+    results = []
+    for shortcode in shortcodes:
+        try:
+            results.append(await deliver_post_async(chat_id, shortcode, lookups.get(shortcode), user_id))
+        except Exception as e:
+            results.append(e)
+    return results
+
+# ----------------------------
+# Commands
+# ----------------------------
+@async_bot.message_handler(commands=['start'])
+async def start_command_handler(message):
+    if not await require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nstart blocked (not joined)")
+        return
+
+    await async_bot.send_message(message.chat.id, start_msg, parse_mode="HTML", disable_web_page_preview=True)
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nstart command")
+
+@async_bot.message_handler(commands=['help'])
+async def help_command_handler(message):
+    await async_bot.send_message(message.chat.id, help_msg, parse_mode="HTML", disable_web_page_preview=True)
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nhelp command")
+
+@async_bot.message_handler(commands=['privacy'])
+async def privacy_message_handler(message):
+    await async_bot.send_message(message.chat.id, privacy_msg, parse_mode="HTML", disable_web_page_preview=True)
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprivacy command")
+
+@async_bot.message_handler(commands=['lystaria_bot'])
+async def lystaria_message_handler(message):
+    await async_bot.send_message(message.chat.id, lystaria_msg, parse_mode="HTML", disable_web_page_preview=True)
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlystaria command")
+
+@async_bot.message_handler(commands=['profile'])
+async def profile_command_handler(message):
+    if not await require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile blocked (not joined)")
+        return
+
+    username = parse_username(message.text.partition(" ")[2])
+    if not username:
+        await async_bot.send_message(message.chat.id, profile_usage_msg)
+        return
+    if not profile_exporter.try_start(message.chat.id):
+        await async_bot.send_message(message.chat.id, profile_busy_msg)
+        return
+
+    # an export costs its post budget in the admission buckets, like that many links would
+    try:
+        position = admission.admit(
+            message.from_user.id, profile_export_max_posts,
+            lambda: submit_profile_export(message.chat.id, message.from_user.id, username),
+        )
+    except AdmissionRejected:
+        profile_exporter.finish(message.chat.id)
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile refused (queue full)")
+        await async_bot.send_message(message.chat.id, rate_limited_msg)
+        return
+    if position:
+        await async_bot.send_message(message.chat.id, queued_msg.format(position=position))
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile command queued: {username}")
+        return
+
+    try:
+        await async_bot.send_message(message.chat.id, profile_started_msg.format(username=username))
+        # an export is long-running blocking work, it goes to the job pool like mini app downloads
+        await asyncio.to_thread(submit_profile_export, message.chat.id, message.from_user.id, username)
+    except Exception:
+        # the job didn't start, so it won't release the chat itself
+        profile_exporter.finish(message.chat.id)
+        raise
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile command: {username}")
+
+@async_bot.message_handler(commands=['quality'])
+async def quality_command_handler(message):
+    if not await require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nquality blocked (not joined)")
+        return
+
+    quality = message.text.partition(" ")[2].strip().lower()
+    if quality not in QUALITIES:
+        current = await asyncio.to_thread(user_quality, message.from_user.id)
+        await async_bot.send_message(message.chat.id, quality_msg.format(quality=current), parse_mode="HTML")
+        return
+
+    await asyncio.to_thread(quality_store.set, message.from_user.id, quality)
+    await async_bot.send_message(message.chat.id, quality_set_msg.format(quality=quality), parse_mode="HTML")
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nquality command: {quality}")
+
+# ----------------------------
+# Link handlers
+# ----------------------------
+@async_bot.message_handler(func=routed(SPOTIFY))
+async def spotify_link_handler(message):
+    await async_bot.send_message(
+        message.chat.id,
+        "This bot only supports Instagram links. Please send an Instagram post link.\n\n"
+        "If you want to download from Spotify you can check out my other bot: @SpotSeekBot"
+    )
+
+@async_bot.message_handler(func=routed(POST, REEL, TV, SHARE))
+async def post_or_reel_link_handler(message):
+    # Gate check MUST be first to prevent bypass
+    if not await require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlink blocked (not joined)")
+        return
+
+    # downloads over the user's or everyone's rate wait their turn, then start on this event loop
+    loop = asyncio.get_running_loop()
+    cost = route_post_count(route_message(message), max_links_per_message)
+    try:
+        position = admission.admit(message.from_user.id, cost, lambda: asyncio.run_coroutine_threadsafe(download_links_async(message), loop))
+    except AdmissionRejected:
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlinks refused (queue full)")
+        await async_bot.send_message(message.chat.id, rate_limited_msg)
+        return
+    if position:
+        await async_bot.send_message(message.chat.id, queued_msg.format(position=position))
+        return
+    await download_links_async(message)
+
+async def download_links_async(message):
+    guide_msg_1 = None
+    try:
+        guide_msg_1 = await async_bot.send_message(message.chat.id, "Ok wait a few moments...")
+
+        # share link resolving is blocking io (cached, so usually without a request)
+        post_shortcodes = await asyncio.to_thread(route_post_shortcodes, route_message(message), max_links_per_message)
+        if not post_shortcodes:
+            log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 error in getting post_shortcode")
+            await try_to_delete_message_async(message.chat.id, guide_msg_1.message_id)
+            return
+
+        results = await deliver_posts_async(message.chat.id, message.from_user.id, post_shortcodes)
+        failed = [(shortcode, result) for shortcode, result in zip(post_shortcodes, results) if not isinstance(result, int) or not result]
+
+        if len(failed) == len(post_shortcodes):
+            raise failed[0][1] if isinstance(failed[0][1], Exception) else Exception("riad_azz returned nothing")
+        if failed:
+            log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 failed posts: {', '.join(f'{sc} ({r!r})' for sc, r in failed)}")
+            await async_bot.send_message(message.chat.id, bulk_partial_fail_msg.format(failed=len(failed), total=len(post_shortcodes)))
+
+        await async_bot.send_message(message.chat.id, end_msg, parse_mode="HTML", disable_web_page_preview=True)
+        await try_to_delete_message_async(message.chat.id, guide_msg_1.message_id)
+
+    except Exception as e:
+        if guide_msg_1:
+            await try_to_delete_message_async(message.chat.id, guide_msg_1.message_id)
+
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 error in main body: {str(e)}")
+        await async_bot.send_message(message.chat.id, fail_msg, parse_mode="HTML", disable_web_page_preview=True)
+
+@async_bot.message_handler(func=routed(STORY))
+async def unsupported_link_handler(message):
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nunsupported link: {route_message(message).kind}")
+    await async_bot.send_message(message.chat.id, unsupported_link_msg, parse_mode="HTML", disable_web_page_preview=True)
+
+# ----------------------------
+# Fallback handler
+# ----------------------------
+@async_bot.message_handler(func=lambda message: True)
+async def wrong_pattern_handler(message):
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n❌wrong pattern: {message.text}")
+    await async_bot.send_message(message.chat.id, wrong_pattern_msg, parse_mode="HTML", disable_web_page_preview=True)
+
+async def run_polling():
+    try:
+        await async_bot.infinity_polling(allowed_updates=["message", "edited_message", "callback_query", "chat_member"])
+    finally:
+        await close_sessions()
+        await async_bot.close_session()
+
+def main():
+    asyncio.run(run_polling())
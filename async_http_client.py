@@ -0,0 +1,82 @@
+import asyncio
+
+import aiohttp
+
+try:
+    from aiohttp_socks import ProxyConnector
+except ImportError:
+    ProxyConnector = None # only needed for socks proxies
+
+from variables import (
+    http_pool_size,
+    http_connect_timeout,
+    http_read_timeout,
+    http_max_retries,
+)
+from http_client import RETRY_STATUSES, backoff_delay
+
+# proxy url ("" for direct) -> aiohttp session, aiohttp ties a socks proxy to the connector
+_sessions = {}
+
+
+def _make_connector(proxy_url: str):
+    if proxy_url.startswith("socks"):
+        if ProxyConnector is None:
+            raise RuntimeError("socks proxies in async mode need aiohttp-socks (pip install aiohttp-socks)")
+        # python-socks doesn't know the socks5h scheme, rdns is the same thing
+        rdns = proxy_url.startswith("socks5h://")
+        if rdns:
+            proxy_url = "socks5://" + proxy_url[len("socks5h://"):]
+        return ProxyConnector.from_url(proxy_url, rdns=rdns, limit=http_pool_size)
+    return aiohttp.TCPConnector(limit=http_pool_size)
+
+def _session_for(proxy) -> tuple:
+    """
+    Returns (session, proxy url for aiohttp's proxy= argument) for a pool Proxy or None.
+    """
+    proxy_url = (proxy.proxies.get("https") or proxy.proxies.get("http") or "") if proxy else ""
+    session = _sessions.get(proxy_url)
+    if session is None or session.closed:
+        timeout = aiohttp.ClientTimeout(sock_connect=http_connect_timeout, sock_read=http_read_timeout)
+        session = aiohttp.ClientSession(connector=_make_connector(proxy_url), timeout=timeout)
+        _sessions[proxy_url] = session
+    http_proxy = proxy_url if proxy_url.startswith("http") else None
+    return session, http_proxy
+
+async def request_with_retries_async(method: str, url: str, retries: int = http_max_retries, proxy_pool=None, **kwargs):
+    """
+    Async counterpart of http_client.request_with_retries. Returns (status, headers, body bytes).
+    """
+    for attempt in range(retries + 1):
+        proxy = proxy_pool.acquire() if proxy_pool else None
+        session, http_proxy = _session_for(proxy)
+        try:
+            async with session.request(method, url, proxy=http_proxy, **kwargs) as response:
+                body = await response.read()
+                status, headers = response.status, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if proxy_pool:
+                proxy_pool.release(proxy, error=e)
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except asyncio.CancelledError:
+            if proxy_pool:
+                proxy_pool.abandon(proxy)
+            raise
+        except Exception as e:
+            if proxy_pool:
+                proxy_pool.release(proxy, error=e)
+            raise
+        if proxy_pool:
+            proxy_pool.release(proxy, status)
+
+        if status not in RETRY_STATUSES or attempt == retries:
+            return status, headers, body
+        await asyncio.sleep(backoff_delay(attempt, headers.get("Retry-After")))
+
+async def close_sessions():
+    for session in list(_sessions.values()):
+        await session.close()
+    _sessions.clear()
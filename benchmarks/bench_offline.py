@@ -0,0 +1,232 @@
+"""
+Offline end-to-end benchmark of the webhook server. Instagram and the telegram bot api are replaced
+by local stand-ins (fake_services.py), the server runs unmodified as a subprocess pointed at them
+through INSTAGRAM_GRAPHQL_URL and TELEGRAM_API_URL, and the benchmark drives it like telegram
+and the mini app would: webhook updates with post links, and signed /api/submit calls.
+
+A request's latency runs from sending it until the bot's closing message (end_msg, or fail_msg)
+reaches the telegram stand-in. Each request comes from a new chat, so per-chat pacing doesn't
+hide the server's own throughput. Reports p50/p90/p99 latency and requests per second, and exits
+with status 1 when --max-p99-ms is exceeded.
+
+    python benchmarks/bench_offline.py --requests 500 --concurrency 16 --distinct 50
+    python benchmarks/bench_offline.py --target api --instagram-ms 0 --telegram-ms 0
+    python benchmarks/bench_offline.py --payload-dir debug_captures
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from argparse import ArgumentParser
+
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+BOT_TOKEN = "123456:offline-benchmark"
+os.environ.setdefault("BEST_INSTAGRAM_DOWNLOADER_BOT_API", BOT_TOKEN)
+
+from variables import end_msg, fail_msg, wrong_pattern_msg
+from shortcode import media_id_to_code
+from fake_services import FakeServices, load_payloads
+
+ENTRY_MODULE = "webhook_server"
+DONE_TEXTS = {end_msg: "ok", fail_msg: "failed", wrong_pattern_msg: "failed"}
+FIRST_CHAT_ID = 7_000_000_000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def server_env(services_url: str, port: int, data_dir: str, args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "BEST_INSTAGRAM_DOWNLOADER_BOT_API": BOT_TOKEN,
+        "PORT": str(port),
+        "PUBLIC_URL": "", # no setWebhook
+        "TELEGRAM_API_URL": services_url,
+        "INSTAGRAM_GRAPHQL_URL": services_url + "/graphql/query",
+        "INSTAGRAM_DOWNLOADER_LOG_CHANNEL_ID": "",
+        "WARP_PROXIES": "[]",
+        "TELEGRAM_GLOBAL_RATE": str(args.telegram_rate),
+        "ADMISSION_GLOBAL_RATE": str(args.admission_rate),
+        "MEDIA_CACHE_DB": "",
+        "JOB_STORE_DB": "",
+        "LEDGER_DB": os.path.join(data_dir, "ledger.db") if args.ledger else "",
+        "PROFILE_EXPORT_DB": os.path.join(data_dir, "profile_exports.db"),
+        "USER_SETTINGS_DB": os.path.join(data_dir, "user_settings.db"),
+        "DEBUG_CAPTURE_DIR": os.path.join(data_dir, "debug_captures"),
+        "DEBUG_CAPTURE_SAMPLE": "0",
+        "DEBUG_CAPTURE_ON_FAILURE": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+def start_server(env: dict, verbose: bool, timeout: float = 30.0):
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, f"{ENTRY_MODULE}.py"], cwd=REPO_DIR, env=env, stdout=output, stderr=output)
+    base_url = f"http://127.0.0.1:{env['PORT']}"
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"{ENTRY_MODULE} exited with {process.returncode}, rerun with --verbose")
+        try:
+            if requests.get(base_url + "/", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.05)
+    process.terminate()
+    raise TimeoutError("server didn't answer in time")
+
+def sign_init_data(user_id: int) -> str:
+    """
+    Mini app initData for user_id, signed the way telegram does it (see api.verify_init_data).
+    """
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id, "first_name": "bench"})}
+    data_check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_check.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+def webhook_request(session, base_url: str, chat_id: int, link: str):
+    update = {
+        "update_id": chat_id - FIRST_CHAT_ID + 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+            "text": link,
+        },
+    }
+    response = session.post(f"{base_url}/webhook/{BOT_TOKEN}", json=update, timeout=30)
+    return response.status_code == 200
+
+def api_request(session, base_url: str, chat_id: int, link: str):
+    response = session.post(f"{base_url}/api/submit", json={"link": link, "initData": sign_init_data(chat_id)}, timeout=30)
+    return response.status_code == 202
+
+TARGETS = {"webhook": webhook_request, "api": api_request}
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def run_load(services, base_url: str, send, links: list, count: int, concurrency: int, chat_ids, timeout: float):
+    """
+    Closed loop: concurrency workers each send a request and wait for it to finish before the next.
+    Returns (latencies in ms of finished requests, outcome counts, elapsed seconds).
+    """
+    latencies = []
+    outcomes = {"ok": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+    lock = threading.Lock()
+    jobs = iter(range(count))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(jobs, None)
+                chat_id = next(chat_ids)
+            if i is None:
+                return
+            services.expect(chat_id)
+            started = time.perf_counter()
+            try:
+                accepted = send(session, base_url, chat_id, links[i % len(links)])
+            except requests.RequestException:
+                accepted = False
+            outcome = services.wait_done(chat_id, timeout) if accepted else "rejected"
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                outcomes[outcome or "timed_out"] += 1
+                if outcome:
+                    latencies.append(elapsed_ms)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, outcomes, time.perf_counter() - started
+
+def report(name: str, latencies: list, outcomes: dict, elapsed: float, services_before: dict, services_after: dict):
+    latencies = sorted(latencies)
+    finished = outcomes["ok"] + outcomes["failed"]
+    print(f"{name}: {sum(outcomes.values())} requests in {elapsed:.2f} s, {finished / elapsed:.1f} req/s")
+    print(f"  latency p50 {percentile(latencies, 50):8.1f} ms  p90 {percentile(latencies, 90):8.1f} ms  "
+          f"p99 {percentile(latencies, 99):8.1f} ms  max {latencies[-1] if latencies else float('nan'):8.1f} ms")
+    print(f"  ok {outcomes['ok']}, failed {outcomes['failed']}, rejected {outcomes['rejected']}, timed out {outcomes['timed_out']}")
+    print(f"  upstream calls: instagram {services_after['instagram'] - services_before['instagram']}, "
+          f"telegram {services_after['telegram'] - services_before['telegram']}")
+    return percentile(latencies, 99)
+
+def main():
+    p = ArgumentParser()
+    p.add_argument("--target", choices=["webhook", "api", "both"], default="both")
+    p.add_argument("--requests", type=int, default=300, help="measured requests per target")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--distinct", type=int, default=50, help="distinct posts, repeats hit the caches")
+    p.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each target")
+    p.add_argument("--instagram-ms", type=float, default=150, help="stand-in graphql response time")
+    p.add_argument("--telegram-ms", type=float, default=30, help="stand-in bot api response time")
+    p.add_argument("--telegram-rate", type=float, default=100000, help="TELEGRAM_GLOBAL_RATE of the server")
+    p.add_argument("--admission-rate", type=float, default=0, help="ADMISSION_GLOBAL_RATE of the server, 0 for no limit")
+    p.add_argument("--payload-dir", help="replay recorded graphql bodies (*.json) instead of generated posts")
+    p.add_argument("--ledger", action="store_true", help="keep the request ledger on (temp file)")
+    p.add_argument("--timeout", type=float, default=60, help="seconds a request may take to finish")
+    p.add_argument("--max-p99-ms", type=float, help="fail when a target's p99 is above this")
+    p.add_argument("--verbose", action="store_true", help="show the server's output")
+    args = p.parse_args()
+
+    services = FakeServices(
+        DONE_TEXTS, args.instagram_ms / 1000, args.telegram_ms / 1000,
+        load_payloads(args.payload_dir) if args.payload_dir else None,
+    ).start()
+    # shortcodes of made-up media ids, the same set every run
+    links = [f"https://www.instagram.com/p/{media_id_to_code(3_000_000_000_000_000_000 + i * 7919)}/" for i in range(args.distinct)]
+    warmup_links = [f"https://www.instagram.com/reel/{media_id_to_code(2_000_000_000_000_000_000 + i)}/" for i in range(args.warmup)]
+    chat_ids = itertools.count(FIRST_CHAT_ID)
+    targets = ["webhook", "api"] if args.target == "both" else [args.target]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        process, base_url = start_server(server_env(services.url, free_port(), data_dir, args), args.verbose)
+        try:
+            print(f"{args.requests} requests per target, concurrency {args.concurrency}, {args.distinct} distinct posts, "
+                  f"instagram {args.instagram_ms:g} ms, telegram {args.telegram_ms:g} ms")
+            over_budget = []
+            for name in targets:
+                send = TARGETS[name]
+                if args.warmup:
+                    run_load(services, base_url, send, warmup_links, args.warmup, min(args.concurrency, args.warmup), chat_ids, args.timeout)
+                before = dict(services.stats)
+                latencies, outcomes, elapsed = run_load(services, base_url, send, links, args.requests, args.concurrency, chat_ids, args.timeout)
+                p99 = report(name, latencies, outcomes, elapsed, before, services.stats)
+                if args.max_p99_ms is not None and not p99 <= args.max_p99_ms:
+                    over_budget.append(f"{name} p99 {p99:.1f} ms > {args.max_p99_ms:g} ms")
+        finally:
+            process.terminate()
+            process.wait()
+            services.stop()
+
+    if over_budget:
+        print("over budget:", "; ".join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
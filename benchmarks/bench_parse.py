@@ -0,0 +1,125 @@
+"""
+Benchmark of graphql post parsing: media_parser (bytes parsed as they are, orjson when installed,
+MediaItem records) against the old path (response.json() on the decoded text, then a dict per
+media item). Reports the median parse time per payload, the peak memory of one parse and the
+memory the parsed result keeps, over generated payloads (see fake_services.py) or recorded ones.
+
+The gain comes from orjson. With the stdlib backend both paths run the same json.loads, and
+media_parser then does a little more work; its records also keep every rendition of a media (see
+renditions.py), so they aren't smaller than the old one-url dicts.
+
+    python benchmarks/bench_parse.py --repeat 200 --runs 5
+    python benchmarks/bench_parse.py --payload-dir debug_captures
+"""
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import media_parser
+from fake_services import post_payload, load_payloads
+
+
+def old_extract_media_links(json_response, media_links):
+    # riad_azz.extract_media_links before media_parser
+    media = json_response['data']['xdt_shortcode_media']
+    caption = media.get('edge_media_to_caption', {}).get('edges', [{}])[0].get('node', {}).get('text', '')
+    if media.get('__typename') == 'XDTGraphSidecar' and 'edge_sidecar_to_children' in media:
+        nodes = [edge['node'] for edge in media['edge_sidecar_to_children']['edges']]
+    else:
+        nodes = [media]
+    for node in nodes:
+        media_type = 'video' if node.get('is_video', False) else 'image'
+        if media_type == 'video':
+            url = node.get('video_url')
+        else:
+            display_resources = node.get('display_resources', [])
+            url = display_resources[-1]['src'] if display_resources else node.get('display_url')
+        media_links.append({'type': media_type, 'url': url})
+    return caption
+
+def old_parse(body: bytes):
+    # response.json() decodes the body to text first
+    media_links = []
+    caption = old_extract_media_links(json.loads(body.decode("utf-8")), media_links)
+    return media_links, caption
+
+def new_parse(body: bytes):
+    return media_parser.extract_media(media_parser.loads(body))
+
+def with_backend(fn, use_orjson: bool):
+    orjson = media_parser.orjson
+    def run(body):
+        media_parser.orjson = orjson if use_orjson else None
+        try:
+            return fn(body)
+        finally:
+            media_parser.orjson = orjson
+    return run
+
+def median_us(fn, bodies, repeat: int, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for body in bodies:
+                fn(body)
+        times.append((time.perf_counter() - started) * 1e6 / (repeat * len(bodies)))
+    return statistics.median(times)
+
+def memory_kb(fn, bodies):
+    """
+    (mean peak KB during a parse, mean KB the results keep).
+    """
+    peaks, kept = [], []
+    for body in bodies:
+        tracemalloc.start()
+        result = fn(body)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak / 1024)
+        kept.append(current / 1024)
+        del result
+    return statistics.mean(peaks), statistics.mean(kept)
+
+def main():
+    p = ArgumentParser()
+    p.add_argument("--repeat", type=int, default=200, help="passes over the payloads per run")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--payload-dir", help="recorded graphql bodies (*.json) instead of generated ones")
+    args = p.parse_args()
+
+    if args.payload_dir:
+        bodies = load_payloads(args.payload_dir)
+    else:
+        bodies = [json.dumps(post_payload(f"BENCH{kind[:4]}{i:03d}", kind)).encode()
+                  for kind in ("image", "video", "sidecar") for i in range(4)]
+    candidates = [("old: response.json() + dicts", old_parse), ("media_parser, json", with_backend(new_parse, False))]
+    if media_parser.orjson is not None:
+        candidates.append(("media_parser, orjson", with_backend(new_parse, True)))
+    else:
+        print("orjson isn't installed, only the json backend is measured")
+
+    for name, fn in candidates[1:]:
+        for body in bodies:
+            old_links, old_caption = old_parse(body)
+            links, caption = fn(body)
+            assert [tuple(item.values()) for item in old_links] == [(item.type, item.url) for item in links] and old_caption == caption, name
+
+    print(f"{len(bodies)} payloads, {statistics.mean(map(len, bodies)) / 1024:.1f} KB on average, median of {args.runs} runs")
+    baseline = None
+    for name, fn in candidates:
+        us = median_us(fn, bodies, args.repeat, args.runs)
+        peak, kept = memory_kb(fn, bodies)
+        baseline = baseline or us
+        print(f"  {name:30} {us:8.1f} us/payload  x{baseline / us:4.1f}  peak {peak:7.1f} KB  kept {kept:5.2f} KB")
+
+
+if __name__ == "__main__":
+    main()
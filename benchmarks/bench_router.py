@@ -0,0 +1,95 @@
+"""
+Benchmark of message routing: link_router (one compiled pass per message) against the old path,
+where pyTelegramBotAPI ran every `regexp=` handler filter with an uncompiled pattern and the
+handler then searched the text again for the shortcodes.
+
+    python benchmarks/bench_router.py --repeat 2000 --runs 5
+"""
+import os
+import re
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import link_router
+
+# the patterns and flow the bot used before link_router
+OLD_SPOTIFY_REG = r'(?:https?://)?open\.spotify\.com/(track|album|playlist|artist)/[a-zA-Z0-9]+'
+OLD_POST_REG = r'(?:https?://www\.)?instagram\.com\S*?/(p|reel)/([a-zA-Z0-9_-]{11})/?'
+
+# message texts the way users send them: copied links with tracking parameters, text around links,
+# several links, links the old pattern missed, and plain chatter
+CORPUS = [
+    "https://www.instagram.com/p/DFx_jLuACs3/?utm_source=ig_web_copy_link&igsh=MzRlODBiNWFlZA==",
+    "https://www.instagram.com/reel/C59DWpvOpgF/?igsh=MWQ1ZGUxMzBkMA==",
+    "https://www.instagram.com/reel/DJx51PyxMpy/?utm_source=ig_web_button_share_sheet",
+    "https://instagram.com/p/DMLLAxNsWFL",
+    "check this out!! https://www.instagram.com/p/C0KuSEuI_JU/ so good",
+    "https://www.instagram.com/reels/DAbCdEfGhIj/",
+    "https://www.instagram.com/therock/p/DJx51PyxMpy/",
+    "https://m.instagram.com/tv/B_abcdefgh1/",
+    "instagr.am/p/DJx51PyxMpy",
+    "https://www.instagram.com/share/p/BAbC123xyz/",
+    "https://www.instagram.com/share/reel/_AbCdEfGh1/",
+    "https://www.instagram.com/stories/natgeo/3412345678901234567?utm_source=ig_story_item_share",
+    "https://www.instagram.com/p/DFx_jLuACs3/\nhttps://www.instagram.com/p/C0KuSEuI_JU/\nhttps://www.instagram.com/reel/C59DWpvOpgF/",
+    "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC?si=2f0c1a",
+    "https://open.spotify.com/intl-de/album/1ATL5GLyefJaxhQzSPVrLX",
+    "https://www.instagram.com/natgeo/",
+    "hi",
+    "how do I download reels?",
+    "/start",
+    "why doesn't this work " + "lorem ipsum dolor sit amet " * 20,
+]
+
+
+def old_route(text: str):
+    # telebot ran the filters in registration order with re.IGNORECASE, then the handler searched again
+    if re.search(OLD_SPOTIFY_REG, text, re.IGNORECASE):
+        return "spotify", []
+    if re.search(OLD_POST_REG, text, re.IGNORECASE):
+        shortcodes = []
+        for match in re.finditer(OLD_POST_REG, text):
+            if match.group(2) not in shortcodes:
+                shortcodes.append(match.group(2))
+        return "post", shortcodes
+    return "unknown", []
+
+def new_route(text: str):
+    route = link_router.route_text(text)
+    return route.kind, link_router.route_shortcodes(route)
+
+def median_ms(fn, texts, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        for text in texts:
+            fn(text)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def main():
+    p = ArgumentParser()
+    p.add_argument("--repeat", type=int, default=2000, help="passes over the corpus per run")
+    p.add_argument("--runs", type=int, default=5)
+    args = p.parse_args()
+
+    texts = CORPUS * args.repeat
+    old_ms = median_ms(old_route, texts, args.runs)
+    new_ms = median_ms(new_route, texts, args.runs)
+    print(f"{len(texts)} messages, median of {args.runs} runs")
+    print(f"  old regexp filters + re-search  {old_ms:9.2f} ms  {old_ms * 1e6 / len(texts):7.0f} ns/message")
+    print(f"  link_router                     {new_ms:9.2f} ms  {new_ms * 1e6 / len(texts):7.0f} ns/message  x{old_ms / new_ms:.1f}")
+
+    old_kinds = [old_route(text)[0] for text in CORPUS]
+    new_kinds = [new_route(text)[0] for text in CORPUS]
+    print(f"  recognized links: old {sum(kind != 'unknown' for kind in old_kinds)}/{len(CORPUS)}, "
+          f"new {sum(kind != 'unknown' for kind in new_kinds)}/{len(CORPUS)}")
+
+
+if __name__ == "__main__":
+    main()
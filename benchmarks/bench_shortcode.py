@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the shortcode <-> media id codec (shortcode.py) against the old
+implementation in archived_codes.py.
+
+The archived media_id_to_code divides with `/`, so after the first digit it indexes the
+alphabet with a float and fails for any id above 63; its encode is checked, not timed.
+
+    python benchmarks/bench_shortcode.py --count 10000 --runs 5
+"""
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import shortcode
+
+# the archived module prints a couple of sample values when imported
+with contextlib.redirect_stdout(io.StringIO()):
+    import archived_codes
+
+
+def sample_ids(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    # current instagram media ids are ~62 bit
+    return [rng.getrandbits(62) for _ in range(count)]
+
+def median_ms(fn, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def archived_encode_status(media_id: int) -> str:
+    try:
+        code = archived_codes.media_id_to_code(media_id)
+    except Exception as e:
+        return f"fails ({type(e).__name__})"
+    return "ok" if code == shortcode.media_id_to_code(media_id) else "wrong result"
+
+def main():
+    p = ArgumentParser()
+    p.add_argument("--count", type=int, default=10000, help="ids per run")
+    p.add_argument("--runs", type=int, default=5)
+    args = p.parse_args()
+
+    ids = sample_ids(args.count)
+    codes = shortcode.media_ids_to_codes(ids)
+    assert [archived_codes.code_to_media_id(code) for code in codes] == ids
+    assert shortcode.codes_to_media_ids(codes) == ids
+
+    # speedups are relative to the first case of each group
+    groups = {
+        "decode": [
+            ("archived code_to_media_id", lambda: [archived_codes.code_to_media_id(c) for c in codes]),
+            ("code_to_media_id", lambda: [shortcode.code_to_media_id(c) for c in codes]),
+            ("codes_to_media_ids (batch)", lambda: shortcode.codes_to_media_ids(codes)),
+        ],
+        "encode": [
+            ("media_id_to_code", lambda: [shortcode.media_id_to_code(i) for i in ids]),
+            ("media_ids_to_codes (batch)", lambda: shortcode.media_ids_to_codes(ids)),
+        ],
+    }
+    print(f"{args.count} ids, median of {args.runs} runs")
+    for group, cases in groups.items():
+        print(group)
+        baseline = None
+        for name, fn in cases:
+            ms = median_ms(fn, args.runs)
+            baseline = baseline or ms
+            print(f"  {name:<32} {ms:9.2f} ms  {ms * 1e6 / args.count:7.0f} ns/id  x{baseline / ms:5.1f}")
+    print(f"  archived media_id_to_code: {archived_encode_status(ids[0])}")
+
+
+if __name__ == "__main__":
+    main()
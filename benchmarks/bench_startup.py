@@ -0,0 +1,113 @@
+"""
+Cold start benchmark for the webhook server.
+
+Reports import time per module (python -X importtime) and the time from process start
+until GET / answers 200. Exits with status 1 when a --max-* budget is exceeded, so it can
+guard against startup regressions in CI or before deploying.
+
+    python benchmarks/bench_startup.py --runs 5 --max-first-200-ms 1500
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULE = "webhook_server"
+
+
+def bench_env():
+    env = dict(os.environ)
+    # a syntactically valid token is enough, nothing talks to telegram during startup
+    env.setdefault("BEST_INSTAGRAM_DOWNLOADER_BOT_API", "123456:benchmark")
+    env["PUBLIC_URL"] = ""
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+def repo_modules():
+    return {name[:-3] for name in os.listdir(REPO_DIR) if name.endswith(".py")}
+
+def import_times():
+    """
+    Returns {module: cumulative import time in ms} for one fresh interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY_MODULE}"],
+        cwd=REPO_DIR, env=bench_env(), capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package" (name is indented by depth)
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_to_first_200(timeout: float = 30.0):
+    port = free_port()
+    env = bench_env()
+    env["PORT"] = str(port)
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, f"{ENTRY_MODULE}.py"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server didn't answer in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    p = ArgumentParser()
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--top", type=int, default=15, help="slowest third-party imports to list")
+    p.add_argument("--max-import-ms", type=float, help=f"budget for importing {ENTRY_MODULE}")
+    p.add_argument("--max-first-200-ms", type=float, help="budget for process start to first 200")
+    args = p.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    median = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[0]}
+    ours = repo_modules()
+
+    print(f"import time, median of {args.runs} runs (cumulative ms)")
+    print(f"  {ENTRY_MODULE:<32} {median[ENTRY_MODULE]:8.1f}")
+    for name in sorted((n for n in median if n in ours and n != ENTRY_MODULE), key=median.get, reverse=True):
+        print(f"  {name:<32} {median[name]:8.1f}")
+    print("slowest third-party top-level imports")
+    third_party = [n for n in median if n not in ours and "." not in n]
+    for name in sorted(third_party, key=median.get, reverse=True)[:args.top]:
+        print(f"  {name:<32} {median[name]:8.1f}")
+
+    first_200 = statistics.median(time_to_first_200() for _ in range(args.runs))
+    print(f"time to first 200 on /, median of {args.runs} runs: {first_200:.1f} ms")
+
+    failed = False
+    if args.max_import_ms is not None and median[ENTRY_MODULE] > args.max_import_ms:
+        print(f"FAIL: import {median[ENTRY_MODULE]:.1f} ms > {args.max_import_ms} ms")
+        failed = True
+    if args.max_first_200_ms is not None and first_200 > args.max_first_200_ms:
+        print(f"FAIL: first 200 {first_200:.1f} ms > {args.max_first_200_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
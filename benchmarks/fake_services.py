@@ -0,0 +1,290 @@
+"""
+Local stand-ins for instagram's graphql endpoint and the telegram bot api, used by the offline
+benchmarks. Both answer from one threaded http server:
+
+    POST /graphql/query          a post payload for the shortcode in the "variables" form field
+    POST /bot<token>/<method>    {"ok": true, "result": ...} for the methods the bot calls
+
+Payloads are generated (single image, single video, sidecar) with the fields and padding of real
+responses, or replayed from recorded response bodies (e.g. DEBUG_CAPTURE_DIR files).
+"""
+import glob
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CDN_HOST = "https://scontent-fra5-1.cdninstagram.com"
+CDN_LIFETIME = 3 * 24 * 3600 # seconds, like instagram's "oe" expiry
+
+# share of generated posts per kind, the rest are single images
+VIDEO_SHARE = 0.3
+SIDECAR_SHARE = 0.2
+SIDECAR_SIZE = 10
+COMMENTS_PER_POST = 24
+
+
+def cdn_url(media_id: int, ext: str, size: str) -> str:
+    expires = int(time.time()) + CDN_LIFETIME
+    return (
+        f"{CDN_HOST}/v/t51.29350-15/{media_id}_{media_id % 999983}_n.{ext}"
+        f"?stp=dst-{ext}_e35_{size}&_nc_ht=scontent-fra5-1.cdninstagram.com&_nc_cat=1"
+        f"&_nc_ohc=Q9vHLdQ3kJ0Q7kNvgE8pR2x&_nc_gid=c2b3f0a1d9e84b7c&edm=APs17CUBAAAA&ccb=7-5"
+        f"&oh=00_AYC{media_id % 10 ** 12:012d}Xw&oe={expires:08X}&_nc_sid=10d13b"
+    )
+
+def owner_node(rng) -> dict:
+    user_id = rng.randrange(10 ** 9, 10 ** 11)
+    return {
+        "id": str(user_id),
+        "username": f"user_{user_id % 100000}",
+        "full_name": "Bench Mark",
+        "is_verified": rng.random() < 0.1,
+        "is_private": False,
+        "profile_pic_url": cdn_url(user_id, "jpg", "s150x150"),
+        "edge_followed_by": {"count": rng.randrange(10 ** 6)},
+        "edge_owner_to_timeline_media": {"count": rng.randrange(5000)},
+        "blocked_by_viewer": False,
+        "has_blocked_viewer": False,
+        "is_embeds_disabled": False,
+    }
+
+def media_node(rng, is_video: bool) -> dict:
+    media_id = rng.randrange(10 ** 18, 4 * 10 ** 18)
+    node = {
+        "__typename": "XDTGraphVideo" if is_video else "XDTGraphImage",
+        "id": str(media_id),
+        "dimensions": {"height": 1350, "width": 1080},
+        "display_url": cdn_url(media_id, "jpg", "p1080x1080"),
+        "display_resources": [
+            {"src": cdn_url(media_id, "jpg", size), "config_width": width, "config_height": width * 5 // 4}
+            for size, width in (("s640x640", 640), ("s750x750", 750), ("p1080x1080", 1080))
+        ],
+        "is_video": is_video,
+        "accessibility_caption": "Photo by Bench Mark. May be an image of text.",
+        "tracking_token": "eyJ2ZXJzaW9uIjo1LCJwYXlsb2FkIjp7ImlzX2FuYWx5dGljc190cmFja2VkIjp0cnVlfX0=",
+        "edge_media_to_tagged_user": {"edges": []},
+    }
+    if is_video:
+        node["video_url"] = cdn_url(media_id, "mp4", "720p")
+        node["video_duration"] = round(rng.uniform(5, 90), 3)
+        node["video_view_count"] = rng.randrange(10 ** 7)
+        node["has_audio"] = True
+        node["dash_info"] = {"is_dash_eligible": True, "number_of_qualities": 3, "video_dash_manifest": "".join(
+            f'<Representation id="{media_id}v{height}" mimeType="video/mp4" codecs="avc1.4d401f" width="{height * 9 // 16}" '
+            f'height="{height}" bandwidth="{bandwidth}" frameRate="30"><BaseURL>{cdn_url(media_id, "mp4", f"dash{height}")}</BaseURL></Representation>'
+            for height, bandwidth in ((640, 380000), (1280, 1600000), (1920, 3800000))
+        )}
+    return node
+
+def post_payload(shortcode: str, kind: str = None) -> dict:
+    """
+    A graphql response for shortcode. kind is "image", "video" or "sidecar", picked from the
+    shortcode when not given, so the same shortcode always gets the same post.
+    """
+    rng = random.Random(shortcode)
+    if kind is None:
+        roll = rng.random()
+        kind = "sidecar" if roll < SIDECAR_SHARE else "video" if roll < SIDECAR_SHARE + VIDEO_SHARE else "image"
+
+    if kind == "sidecar":
+        media = media_node(rng, False)
+        media["__typename"] = "XDTGraphSidecar"
+        media["edge_sidecar_to_children"] = {"edges": [
+            {"node": media_node(rng, rng.random() < VIDEO_SHARE)} for _ in range(SIDECAR_SIZE)
+        ]}
+    else:
+        media = media_node(rng, kind == "video")
+
+    owner = owner_node(rng)
+    media.update({
+        "shortcode": shortcode,
+        "owner": owner,
+        "taken_at_timestamp": int(time.time()) - rng.randrange(10 ** 7),
+        "edge_media_to_caption": {"edges": [{"node": {"text": f"bench post {shortcode} " + "#caption " * 20}}]},
+        "edge_media_preview_like": {"count": rng.randrange(10 ** 6), "edges": []},
+        "edge_media_to_parent_comment": {
+            "count": COMMENTS_PER_POST,
+            "page_info": {"has_next_page": True, "end_cursor": "QVFE" + "x" * 80},
+            "edges": [{"node": {
+                "id": str(rng.randrange(10 ** 17)),
+                "text": "so good " * rng.randrange(1, 12),
+                "created_at": int(time.time()),
+                "owner": {"id": str(rng.randrange(10 ** 10)), "username": f"fan_{i}",
+                          "profile_pic_url": cdn_url(i + 1, "jpg", "s150x150"), "is_verified": False},
+                "edge_liked_by": {"count": rng.randrange(1000)},
+                "edge_threaded_comments": {"count": 0, "edges": []},
+            }} for i in range(COMMENTS_PER_POST)],
+        },
+        "edge_related_profiles": {"edges": [{"node": owner_node(rng)} for _ in range(6)]},
+        "comments_disabled": False,
+        "like_and_view_counts_disabled": False,
+        "is_ad": False,
+        "location": None,
+    })
+    return {"data": {"xdt_shortcode_media": media}, "extensions": {"is_final": True}, "status": "ok"}
+
+def load_payloads(directory: str) -> list:
+    """
+    Recorded response bodies (*.json) from directory, failed captures left out.
+    """
+    bodies = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if path.endswith("-failed.json"):
+            continue
+        with open(path, "rb") as f:
+            bodies.append(f.read())
+    if not bodies:
+        raise ValueError(f"No recorded payloads in {directory}")
+    return bodies
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass # the server under test hung up a keep-alive connection, e.g. when it stops
+
+
+class FakeServices:
+    """
+    The instagram and telegram stand-in. Each kind of request waits instagram_delay/telegram_delay
+    seconds before answering, like the network would.
+
+    A sendMessage whose text is in done_texts marks that chat done: wait_done(chat_id) returns
+    the text's outcome, which is how the benchmarks see a download finish end to end.
+    """
+    def __init__(self, done_texts: dict = None, instagram_delay: float = 0.0, telegram_delay: float = 0.0,
+                 recorded: list = None):
+        self.done_texts = done_texts or {}
+        self.instagram_delay = instagram_delay
+        self.telegram_delay = telegram_delay
+        self.recorded = recorded
+        self._payloads = {} # shortcode -> encoded body
+        self._waiters = {} # chat_id -> [Event, outcome]
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.stats = {"instagram": 0, "telegram": 0}
+        self.server = _Server(("127.0.0.1", 0), self._handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ---- completion tracking ----
+    def expect(self, chat_id: int):
+        with self._lock:
+            self._waiters[chat_id] = [threading.Event(), None]
+
+    def wait_done(self, chat_id: int, timeout: float):
+        """
+        The outcome of chat_id's download, None if it didn't finish in time.
+        """
+        waiter = self._waiters[chat_id]
+        waiter[0].wait(timeout)
+        with self._lock:
+            self._waiters.pop(chat_id, None)
+        return waiter[1]
+
+    def _done(self, chat_id, outcome):
+        with self._lock:
+            waiter = self._waiters.get(chat_id)
+        if waiter and not waiter[0].is_set():
+            waiter[1] = outcome
+            waiter[0].set()
+
+    # ---- instagram ----
+    def graphql_body(self, shortcode: str) -> bytes:
+        body = self._payloads.get(shortcode)
+        if body is None:
+            if self.recorded:
+                body = self.recorded[random.Random(shortcode).randrange(len(self.recorded))]
+            else:
+                body = json.dumps(post_payload(shortcode)).encode()
+            self._payloads[shortcode] = body
+        return body
+
+    # ---- telegram ----
+    def message(self, chat_id, **content) -> dict:
+        return dict(message_id=next(self._ids), date=int(time.time()), chat={"id": int(chat_id), "type": "private"}, **content)
+
+    def media_message(self, chat_id, media_type: str) -> dict:
+        file_id = f"bench-{media_type}-{next(self._ids)}"
+        if media_type == "video":
+            return self.message(chat_id, video={"file_id": file_id, "file_unique_id": file_id, "width": 720, "height": 1280, "duration": 10})
+        return self.message(chat_id, photo=[{"file_id": file_id, "file_unique_id": file_id, "width": 1080, "height": 1350}])
+
+    def bot_api_result(self, method: str, params: dict):
+        chat_id = params.get("chat_id")
+        if method == "sendMessage":
+            outcome = self.done_texts.get(params.get("text"))
+            if outcome is not None:
+                self._done(int(chat_id), outcome)
+            return self.message(chat_id, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self.media_message(chat_id, "photo")
+        if method in ("sendVideo", "sendAnimation"):
+            return self.media_message(chat_id, "video")
+        if method == "sendMediaGroup":
+            return [self.media_message(chat_id, item.get("type")) for item in json.loads(params.get("media", "[]"))]
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "bench"}}
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        return True # deleteMessage, setWebhook, answerCallbackQuery...
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real endpoints
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                parts = urllib.parse.urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                # telebot sends parameters in the query string, requests' data= in a form body
+                params = dict(urllib.parse.parse_qsl(parts.query))
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update(urllib.parse.parse_qsl(body.decode()))
+
+                if parts.path == "/graphql/query":
+                    with services._lock:
+                        services.stats["instagram"] += 1
+                    time.sleep(services.instagram_delay)
+                    shortcode = json.loads(params.get("variables", "{}")).get("shortcode", "")
+                    return self.reply(services.graphql_body(shortcode))
+
+                if parts.path.startswith("/bot"):
+                    with services._lock:
+                        services.stats["telegram"] += 1
+                    time.sleep(services.telegram_delay)
+                    method = parts.path.rsplit("/", 1)[1]
+                    result = services.bot_api_result(method, params)
+                    return self.reply(json.dumps({"ok": True, "result": result}).encode())
+
+                self.reply(b'{"ok": false, "error_code": 404, "description": "Not Found"}', 404)
+
+            def reply(self, body: bytes, status: int = 200):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -1,37 +1,22 @@
 from functions import *
-from riad_azz import get_instagram_media_links
-
+from media_sender import deliver_posts
+from membership import UPDATES_CHANNEL_URL, is_user_joined_updates_channel
+from send_scheduler import send_scheduler
+from profile_export import parse_username, profile_exporter, submit_profile_export
+from metrics import timed
+from link_router import POST, REEL, TV, SHARE, STORY, SPOTIFY, routed, route_message, route_post_count
+from share_resolver import route_post_shortcodes
+from admission import admission, AdmissionRejected
+from renditions import QUALITIES, quality_store, user_quality
+
+import sys
 import telebot
+from concurrent.futures import ThreadPoolExecutor
 from telebot import types
 
 # ----------------------------
-# Join-gate configuration
+# Join gate
 # ----------------------------
-UPDATES_CHANNEL = "@quickgram_downloader"  # TODO: set your channel username (must start with @)
-UPDATES_CHANNEL_URL = "https://t.me/quickgram_downloader"  # TODO: set your channel URL
-
-JOIN_GATE_MSG = """<b>Join Gate Entry</b>
-
-Please join the updates channel. After joining, tap Refresh to unlock the bot.
-"""
-
-def is_user_joined_updates_channel(user_id: int) -> bool:
-    """
-    Returns True if user is a member/admin/creator in the updates channel.
-    Note: For reliable checks, the bot should be an admin in the channel.
-    """
-    try:
-        member = bot.get_chat_member(UPDATES_CHANNEL, user_id)
-        status = getattr(member, "status", None)
-        return status in ("member", "administrator", "creator")
-    except Exception as e:
-        # If we can't verify, treat as not joined (safe default)
-        try:
-            log(f"{bot_username} log:\n\njoin-check error: {repr(e)}\nuser: {user_id}")
-        except:
-            pass
-        return False
-
 def send_join_gate(chat_id: int):
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
@@ -40,7 +25,7 @@ def send_join_gate(chat_id: int):
     )
     bot.send_message(
         chat_id,
-        JOIN_GATE_MSG,
+        join_gate_msg,
         parse_mode="HTML",
         disable_web_page_preview=True,
         reply_markup=kb
@@ -68,7 +53,8 @@ def refresh_join_gate_handler(call):
     user_id = call.from_user.id
     chat_id = call.message.chat.id
 
-    if is_user_joined_updates_channel(user_id):
+    # skip the cache here, the user most likely just joined
+    if is_user_joined_updates_channel(user_id, use_cache=False):
         # Optional: remove the gate message to reduce clutter
         try:
             bot.delete_message(chat_id, call.message.message_id)
@@ -121,10 +107,64 @@ def lystaria_message_handler(message):
     bot.send_message(message.chat.id, lystaria_msg, parse_mode="HTML", disable_web_page_preview=True)
     log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlystaria command")
 
+@bot.message_handler(commands=['profile'])
+def profile_command_handler(message):
+    if not require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile blocked (not joined)")
+        return
+
+    username = parse_username(message.text.partition(" ")[2])
+    if not username:
+        bot.send_message(message.chat.id, profile_usage_msg)
+        return
+    if not profile_exporter.try_start(message.chat.id):
+        bot.send_message(message.chat.id, profile_busy_msg)
+        return
+
+    # an export costs its post budget in the admission buckets, like that many links would
+    try:
+        position = admission.admit(
+            message.from_user.id, profile_export_max_posts,
+            lambda: submit_profile_export(message.chat.id, message.from_user.id, username),
+        )
+    except AdmissionRejected:
+        profile_exporter.finish(message.chat.id)
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile refused (queue full)")
+        send_scheduler.send_message(message.chat.id, rate_limited_msg)
+        return
+    if position:
+        send_scheduler.send_message(message.chat.id, queued_msg.format(position=position))
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile command queued: {username}")
+        return
+
+    try:
+        bot.send_message(message.chat.id, profile_started_msg.format(username=username))
+        submit_profile_export(message.chat.id, message.from_user.id, username)
+    except Exception:
+        # the job didn't start, so it won't release the chat itself
+        profile_exporter.finish(message.chat.id)
+        raise
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nprofile command: {username}")
+
+@bot.message_handler(commands=['quality'])
+def quality_command_handler(message):
+    if not require_join_or_gate(message):
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nquality blocked (not joined)")
+        return
+
+    quality = message.text.partition(" ")[2].strip().lower()
+    if quality not in QUALITIES:
+        bot.send_message(message.chat.id, quality_msg.format(quality=user_quality(message.from_user.id)), parse_mode="HTML")
+        return
+
+    quality_store.set(message.from_user.id, quality)
+    bot.send_message(message.chat.id, quality_set_msg.format(quality=quality), parse_mode="HTML")
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nquality command: {quality}")
+
 # ----------------------------
 # Link handlers
 # ----------------------------
-@bot.message_handler(regexp=spotify_link_reg)
+@bot.message_handler(func=routed(SPOTIFY))
 def spotify_link_handler(message):
     bot.send_message(
         message.chat.id,
@@ -132,83 +172,73 @@ def spotify_link_handler(message):
         "If you want to download from Spotify you can check out my other bot: @SpotSeekBot"
     )
 
-@bot.message_handler(regexp=insta_post_or_reel_reg)
+# bot downloads that waited in the admission queue, kept apart from the job pool (mini app, /profile exports)
+admitted_pool = ThreadPoolExecutor(max_workers=admission_workers, thread_name_prefix="admitted")
+
+@bot.message_handler(func=routed(POST, REEL, TV, SHARE))
 def post_or_reel_link_handler(message):
     # Gate check MUST be first to prevent bypass
     if not require_join_or_gate(message):
         log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlink blocked (not joined)")
         return
 
+    # downloads over the user's or everyone's rate wait their turn, then run on admitted_pool
+    cost = route_post_count(route_message(message), max_links_per_message)
+    try:
+        position = admission.admit(message.from_user.id, cost, lambda: admitted_pool.submit(download_links, message))
+    except AdmissionRejected:
+        log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nlinks refused (queue full)")
+        send_scheduler.send_message(message.chat.id, rate_limited_msg)
+        return
+    if position:
+        send_scheduler.send_message(message.chat.id, queued_msg.format(position=position))
+        return
+    download_links(message)
+
+@timed("link_handler", track_in_flight=True)
+def download_links(message):
     guide_msg_1 = None
 
     try:
-        guide_msg_1 = bot.send_message(message.chat.id, "Ok wait a few moments...")
+        # the guide message goes out while the post is being looked up
+        guide_msg_1 = send_scheduler.submit_message(message.chat.id, "Ok wait a few moments...")
 
-        post_shortcode = get_post_or_reel_shortcode_from_link(message.text)
-        print(post_shortcode)
+        # every link in the message, looked up concurrently and sent in order
+        # share links are resolved to their post here (cached, so usually without a request)
+        post_shortcodes = route_post_shortcodes(route_message(message), max_links_per_message)
 
-        if not post_shortcode:
+        if not post_shortcodes:
             log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 error in getting post_shortcode")
-            try_to_delete_message(message.chat.id, guide_msg_1.message_id)
+            send_scheduler.delete_later(message.chat.id, guide_msg_1)
             return
 
-        media_links, caption = get_instagram_media_links(post_shortcode)
-
-        # If both empty, treat as failure
-        if (not media_links) and (not caption):
-            raise Exception("riad_azz returned nothing")
-
-        # Caption handling
-        if caption is None:
-            caption = ''
-        while len(caption) + len(caption_trail) > 1024:
-            caption = caption[:-1]
-        caption = caption + caption_trail
-
-        media_list = []
-        for idx, item in enumerate(media_links):
-            if item.get('type') == 'video':
-                if idx == 0:
-                    media = telebot.types.InputMediaVideo(item['url'], caption=caption)
-                else:
-                    media = telebot.types.InputMediaVideo(item['url'])
-            else:
-                if idx == 0:
-                    media = telebot.types.InputMediaPhoto(item['url'], caption=caption)
-                else:
-                    media = telebot.types.InputMediaPhoto(item['url'])
-            media_list.append(media)
-
-        def chunk_list(lst, n):
-            for i in range(0, len(lst), n):
-                yield lst[i:i + n]
-
-        if len(media_list) == 1:
-            media = media_list[0]
-            if isinstance(media, telebot.types.InputMediaPhoto):
-                bot.send_photo(message.chat.id, media.media, caption=media.caption)
-            else:
-                bot.send_video(message.chat.id, media.media, caption=media.caption)
-        else:
-            for chunk in chunk_list(media_list, 10):
-                bot.send_media_group(message.chat.id, chunk)
-
-        bot.send_message(message.chat.id, end_msg, parse_mode="HTML", disable_web_page_preview=True)
+        results = deliver_posts(message.chat.id, message.from_user.id, post_shortcodes, wait_for=guide_msg_1)
+        failed = [(shortcode, result) for shortcode, result in zip(post_shortcodes, results) if not isinstance(result, int) or not result]
 
-        if guide_msg_1:
-            try_to_delete_message(message.chat.id, guide_msg_1.message_id)
+        # If nothing could be sent, treat as failure
+        if len(failed) == len(post_shortcodes):
+            raise failed[0][1] if isinstance(failed[0][1], Exception) else Exception("riad_azz returned nothing")
+        if failed:
+            log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 failed posts: {', '.join(f'{sc} ({r!r})' for sc, r in failed)}")
+            send_scheduler.send_message(message.chat.id, bulk_partial_fail_msg.format(failed=len(failed), total=len(post_shortcodes)))
+
+        # deleting the guide message doesn't need to hold up the end message
+        send_scheduler.delete_later(message.chat.id, guide_msg_1)
+        send_scheduler.send_message(message.chat.id, end_msg, parse_mode="HTML", disable_web_page_preview=True)
 
         return
 
     except Exception as e:
-        try:
-            if guide_msg_1:
-                try_to_delete_message(message.chat.id, guide_msg_1.message_id)
-        except:
-            pass
+        if guide_msg_1:
+            send_scheduler.delete_later(message.chat.id, guide_msg_1)
 
         log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n🛑 error in main body: {str(e)}")
-        bot.send_message(message.chat.id, fail_msg, parse_mode="HTML", disable_web_page_preview=True)
+        send_scheduler.send_message(message.chat.id, fail_msg, parse_mode="HTML", disable_web_page_preview=True)
+
+@bot.message_handler(func=routed(STORY))
+def unsupported_link_handler(message):
+    log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\nunsupported link: {route_message(message).kind}")
+    bot.send_message(message.chat.id, unsupported_link_msg, parse_mode="HTML", disable_web_page_preview=True)
 
 # ----------------------------
 # Fallback handler
@@ -216,4 +246,13 @@ def post_or_reel_link_handler(message):
 @bot.message_handler(func=lambda message: True)
 def wrong_pattern_handler(message):
     log(f"{bot_username} log:\n\nuser: {message.chat.id}\n\n❌wrong pattern: {message.text}")
-    bot.send_message(message.chat.id, wrong_pattern_msg, parse_mode="HTML", disable_web_page_preview=True)
\ No newline at end of file
+    bot.send_message(message.chat.id, wrong_pattern_msg, parse_mode="HTML", disable_web_page_preview=True)
+
+
+if __name__ == "__main__":
+    # polling mode: python best_instagram_downloader.py [--async]
+    if "--async" in sys.argv[1:]:
+        import async_bot
+        async_bot.main()
+    else:
+        bot.infinity_polling(allowed_updates=["message", "edited_message", "callback_query", "chat_member"])
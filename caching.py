@@ -0,0 +1,214 @@
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+from variables import (
+    media_cache_size,
+    media_cache_max_ttl,
+    media_cache_db,
+    file_id_cache_size,
+    file_id_cache_ttl,
+)
+from shortcode import shortcode_key
+
+# instagram cdn urls stop working a bit before their `oe` timestamp in practice
+CDN_EXPIRY_MARGIN = 300
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache where every entry carries its own expiry.
+    """
+    def __init__(self, max_size: int, default_ttl: float):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.default_ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Persistent key/value tier with per-entry expiry, so cached entries survive restarts.
+    Values must be JSON serializable.
+    """
+    def __init__(self, path: str, table: str = "cache"):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            # key is left untyped so both str and int keys keep their own type
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            value, expires_at = row
+            if expires_at <= time.time():
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return default
+        return json.loads(value)
+
+    def get_with_expiry(self, key):
+        """
+        Returns (value, expires_at) or None, used to promote entries into memory with the right ttl.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+
+
+class TieredCache:
+    """
+    Memory tier in front of an optional SQLite tier. Hits on disk get promoted to memory.
+    key, when given, maps the keys callers use to the keys actually stored.
+    """
+    def __init__(self, memory: TTLCache, disk: SQLiteCache = None, key=None):
+        self.memory = memory
+        self.disk = disk
+        self.key = key
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock() # get() runs on many threads at once
+
+    def _count(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def get(self, key, default=None):
+        if self.key is not None:
+            key = self.key(key)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            try:
+                found = self.disk.get_with_expiry(key)
+            except sqlite3.Error as e:
+                print("Cache disk read error:", repr(e))
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self.memory.set(key, value, expires_at - time.time())
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return default
+
+    def set(self, key, value, ttl=None):
+        if self.key is not None:
+            key = self.key(key)
+        if ttl is None:
+            ttl = self.memory.default_ttl
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl)
+            except sqlite3.Error as e:
+                print("Cache disk write error:", repr(e))
+
+    def delete(self, key):
+        if self.key is not None:
+            key = self.key(key)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+
+def cdn_url_expiry(url: str):
+    """
+    Returns the unix timestamp encoded in the `oe` (hex) query parameter of an instagram cdn url, or None.
+    """
+    try:
+        oe = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get("oe")
+        return int(oe[0], 16) if oe else None
+    except (ValueError, TypeError):
+        return None
+
+def cdn_links_ttl(media_links, max_ttl: float = media_cache_max_ttl) -> float:
+    """
+    How long a resolved post can be cached: until the first of its cdn urls expires (minus a margin),
+    capped at max_ttl. Returns 0 when something is already expired.
+    """
+    expiries = [cdn_url_expiry(item.url or "") for item in media_links]
+    expiries = [e for e in expiries if e is not None]
+    if not expiries:
+        return max_ttl
+    ttl = min(expiries) - CDN_EXPIRY_MARGIN - time.time()
+    return max(0, min(ttl, max_ttl))
+
+
+# shortcode -> [media_links, caption], stored under the post's media id
+media_cache = TieredCache(
+    TTLCache(media_cache_size, media_cache_max_ttl),
+    SQLiteCache(media_cache_db, "media_links") if media_cache_db else None,
+    key=shortcode_key,
+)
+
+# shortcode -> {"media": [[type, telegram file_id], ...], "caption": caption}, stored under the post's media id
+file_id_cache = TieredCache(
+    TTLCache(file_id_cache_size, file_id_cache_ttl),
+    SQLiteCache(media_cache_db, "file_ids") if media_cache_db else None,
+    key=shortcode_key,
+)
@@ -0,0 +1,84 @@
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+
+from variables import (
+    debug_capture_dir,
+    debug_capture_sample,
+    debug_capture_on_failure,
+    debug_capture_max_files,
+    debug_capture_max_bytes,
+)
+
+
+class DebugCapture:
+    """
+    Opt-in capture of raw upstream responses for debugging.
+
+    Responses are kept when sampled (1 in sample_every) or when parsing failed, written by a
+    background thread into a ring directory holding at most max_files files of max_bytes each.
+    With both options off nothing is ever queued or written.
+    """
+    def __init__(self, directory: str, sample_every: int, on_failure: bool, max_files: int, max_bytes: int):
+        self.directory = directory
+        self.sample_every = sample_every
+        self.on_failure = on_failure
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._counter = itertools.count()
+        self._queue = queue.Queue(maxsize=32)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def capture(self, name: str, body: bytes, failed: bool = False):
+        """
+        Called once per response: failed ones are kept when on_failure is set, the rest (and
+        failed ones otherwise) are sampled.
+        """
+        if not (failed and self.on_failure):
+            if not self.sample_every or next(self._counter) % self.sample_every:
+                return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((name, body[:self.max_bytes], failed))
+        except queue.Full:
+            pass # debugging aid only, never slow down a request for it
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="debug-capture", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        written = itertools.count()
+        while True:
+            name, body, failed = self._queue.get()
+            safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", name)
+            file_name = f"{int(time.time() * 1000)}-{next(written) % 1000000:06d}-{safe_name}{'-failed' if failed else ''}.json"
+            try:
+                with open(os.path.join(self.directory, file_name), "wb") as f:
+                    f.write(body)
+                self._prune()
+            except OSError as e:
+                print("Debug capture write error:", repr(e))
+
+    def _prune(self):
+        # file names start with a millisecond timestamp and a sequence number, so sorting them sorts by age
+        files = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+        for f in files[:max(0, len(files) - self.max_files)]:
+            os.remove(os.path.join(self.directory, f))
+
+
+debug_capture = DebugCapture(
+    debug_capture_dir,
+    debug_capture_sample,
+    debug_capture_on_failure,
+    debug_capture_max_files,
+    debug_capture_max_bytes,
+)
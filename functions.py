@@ -1,4 +1,8 @@
 from variables import *
+from log_shipper import LogShipper
+from link_router import route_text, route_shortcodes
+
+import atexit
 
 
 
@@ -16,22 +20,16 @@ from variables import *
 
 # functions
 
+log_shipper = LogShipper(bot_token, log_channel_id, log_queue_size, log_min_interval, telegram_api_url or "https://api.telegram.org") if log_channel_id else None
+if log_shipper:
+    atexit.register(log_shipper.flush)
+
 def log(log_message):
-    if not log_channel_id:
+    if not log_shipper:
         return # set to False log channel means it is not needed
 
-    log_bot_url = "https://api.telegram.org/bot" + bot_token + "/"
-
-    log = requests.post(log_bot_url + "sendMessage", data={
-        "chat_id": log_channel_id,
-        "text": log_message
-    })
-    
-    # Check if the log was sent successfully
-    if log.status_code == 200:
-        print('log registered')
-    else:
-        print('Error in registering log:', log.status_code)
+    # queued and sent in batches by a background thread, never blocks the caller
+    log_shipper.ship(log_message)
 
 def try_to_delete_message(chat_id, message_id):
     try:
@@ -71,9 +69,18 @@ def try_to_delete_message(chat_id, message_id):
 #     post = Post.from_shortcode(L.context, post_shortcode)
 #     L.download_post(post, target=folder)
 
+def get_all_post_or_reel_shortcodes_from_text(text, limit=max_links_per_message):
+    """
+    All distinct shortcodes in a message, in the order they appear, at most limit of them.
+    Share links are resolved to the post they lead to.
+    """
+    # imported here, the resolver's http client and caches aren't needed by everything importing functions
+    from share_resolver import route_post_shortcodes
+    return route_post_shortcodes(route_text(text), limit)
+
 def get_post_or_reel_shortcode_from_link(link):
-    match = re.search(insta_post_or_reel_reg, link)
-    if match:
-        return match.group(2)
+    shortcodes = route_shortcodes(route_text(link), 1)
+    if shortcodes:
+        return shortcodes[0]
     else:
         return False
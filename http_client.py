@@ -0,0 +1,83 @@
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from variables import (
+    http_pool_size,
+    http_connect_timeout,
+    http_read_timeout,
+    http_max_retries,
+)
+from metrics import upstream_responses
+
+# upstream answers worth another try
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_BASE = 0.5 # seconds
+BACKOFF_CAP = 8.0 # seconds
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """
+    Session with keep-alive connection pools sized for our worker threads.
+    Retries are done by request_with_retries, not by urllib3.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# one long-lived session per process, shared by all threads
+session = make_session(http_pool_size)
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """
+    Full-jitter exponential backoff, or the server's Retry-After when it sent one.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP * 4)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def request_with_retries(method: str, url: str, retries: int = http_max_retries, proxy_pool=None, **kwargs) -> requests.Response:
+    """
+    session.request with default timeouts, retrying connection errors, timeouts, 429 and 5xx.
+    With a proxy_pool every attempt goes out through the pool's best proxy and reports back to it.
+    The last response (or exception) is returned (raised) once retries are used up.
+    """
+    kwargs.setdefault("timeout", (http_connect_timeout, http_read_timeout))
+    for attempt in range(retries + 1):
+        proxy = proxy_pool.acquire() if proxy_pool else None
+        if proxy is not None:
+            kwargs["proxies"] = proxy.proxies
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            upstream_responses.inc("error")
+            if proxy_pool:
+                proxy_pool.release(proxy, error=e)
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        except requests.RequestException as e:
+            # not worth another try (no socks support, broken chunked body, redirect loop), the proxy is still released
+            upstream_responses.inc("error")
+            if proxy_pool:
+                proxy_pool.release(proxy, error=e)
+            raise
+        upstream_responses.inc(response.status_code)
+        if proxy_pool:
+            proxy_pool.release(proxy, response.status_code)
+
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        if proxy is not None and response.status_code == 429 and len(proxy_pool.proxies) > 1:
+            delay = min(delay, BACKOFF_BASE) # the next attempt goes out through another proxy
+        response.close()
+        time.sleep(delay)
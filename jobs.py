@@ -0,0 +1,142 @@
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from variables import job_workers, job_store_db
+
+# job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# finished jobs are only kept around long enough for the mini app to poll them
+FINISHED_JOB_TTL = 3600
+
+
+class MemoryJobStore:
+    """
+    Job records in a dict. Only visible to the process that created them.
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, user_id: int):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "user_id": user_id,
+                "status": QUEUED,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._prune(now)
+
+    def update(self, job_id: str, status: str, error: str = None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=status, error=error, updated_at=time.time())
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in (DONE, FAILED) and now - job["updated_at"] > FINISHED_JOB_TTL
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """
+    Job records in a sqlite file, so every gunicorn worker can answer status polls for any job.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, user_id INTEGER, status TEXT, error TEXT, created_at REAL, updated_at REAL)"
+            )
+
+    def create(self, job_id: str, user_id: int):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, NULL, ?, ?)", (job_id, user_id, QUEUED, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, now - FINISHED_JOB_TTL)
+            )
+
+    def update(self, job_id: str, status: str, error: str = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, user_id, status, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "user_id", "status", "error", "created_at", "updated_at"), row))
+
+
+class JobQueue:
+    """
+    Runs jobs on a fixed-size worker pool and tracks their status in a store.
+    Any object with create/update/get like the stores above can be plugged in.
+    """
+    def __init__(self, store, workers: int):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, user_id: int, fn, *args) -> str:
+        job_id = self.create(user_id)
+        self.start(job_id, fn, *args)
+        return job_id
+
+    def create(self, user_id: int) -> str:
+        """
+        Records a queued job without running it yet, start() runs it (e.g. once admission lets it through).
+        """
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, user_id)
+        return job_id
+
+    def start(self, job_id: str, fn, *args):
+        self._executor.submit(self._run, job_id, fn, args)
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def _run(self, job_id, fn, args):
+        self.store.update(job_id, RUNNING)
+        try:
+            fn(*args)
+        except Exception as e:
+            self.store.update(job_id, FAILED, repr(e))
+            return
+        self.store.update(job_id, DONE)
+
+
+job_queue = JobQueue(
+    SQLiteJobStore(job_store_db) if job_store_db else MemoryJobStore(),
+    job_workers,
+)
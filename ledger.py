@@ -0,0 +1,127 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+from variables import ledger_db, ledger_queue_size
+
+# where a post's media came from
+FILE_ID = "file_id" # resent by telegram file_id, no lookup
+CACHE_HIT = "hit" # media links from media_cache
+CACHE_MISS = "miss" # fetched from instagram
+
+# outcomes
+OK = "ok"
+EMPTY = "empty" # instagram returned no media
+ERROR = "error"
+
+BATCH_SIZE = 500
+
+COLUMNS = (
+    "ts", "source", "user_id", "chat_id", "shortcode", "media_count",
+    "cache", "upstream_ms", "send_ms", "outcome", "error",
+)
+
+
+class RequestLedger:
+    """
+    Append-only sqlite (WAL) table with one row per post download.
+
+    record() only puts a tuple on a queue; a background thread writes rows in batches, one
+    transaction each. When the queue is full rows are dropped (and counted) instead of waiting.
+    """
+    def __init__(self, path: str, max_queue: int = 10000):
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock() # writer thread and flush() take turns
+        self._thread = None
+        self.dropped = 0
+        self.written = 0
+
+    def record(self, source: str, user_id, chat_id, shortcode: str, media_count: int, cache: str,
+               upstream_ms, send_ms, outcome: str, error: str = None):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((
+                time.time(), source, user_id, chat_id, shortcode, media_count,
+                cache, upstream_ms, send_ms, outcome, error,
+            ))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ledger", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only fsyncs at checkpoints, fine for analytics rows
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS requests ("
+            "ts REAL, source TEXT, user_id INTEGER, chat_id INTEGER, shortcode TEXT, media_count INTEGER, "
+            "cache TEXT, upstream_ms REAL, send_ms REAL, outcome TEXT, error TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS requests_ts ON requests (ts)")
+        return conn
+
+    def _drain(self, first=None) -> list:
+        rows = [first] if first is not None else []
+        while len(rows) < BATCH_SIZE:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, conn, rows):
+        with conn:
+            conn.executemany(f"INSERT INTO requests VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        self.written += len(rows)
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            first = self._queue.get()
+            with self._write_lock:
+                try:
+                    self._write(conn, self._drain(first))
+                except sqlite3.Error as e:
+                    print("Ledger write error:", repr(e))
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Writes whatever is still queued, used at exit.
+        """
+        if self._thread is None or not self._write_lock.acquire(timeout=timeout):
+            return
+        try:
+            conn = self._connect()
+            while True:
+                rows = self._drain()
+                if not rows:
+                    break
+                self._write(conn, rows)
+            conn.close()
+        except sqlite3.Error as e:
+            print("Ledger write error:", repr(e))
+        finally:
+            self._write_lock.release()
+
+
+request_ledger = RequestLedger(ledger_db, ledger_queue_size) if ledger_db else None
+if request_ledger:
+    atexit.register(request_ledger.flush)
+
+def record_request(*args, **kwargs):
+    if not request_ledger:
+        return # no LEDGER_DB means no ledger
+    request_ledger.record(*args, **kwargs)
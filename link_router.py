@@ -0,0 +1,103 @@
+import re
+from collections import namedtuple
+
+# Every incoming text is scanned once by one compiled pattern. The result is kept on the message,
+# so the handler filters and the handler itself share a single parse.
+
+# link kinds
+POST = "post"
+REEL = "reel"
+TV = "tv"
+STORY = "stories"
+SHARE = "share"
+SPOTIFY = "spotify"
+UNKNOWN = "unknown"
+
+# kinds that resolve straight to a shortcode
+MEDIA_KINDS = (POST, REEL, TV)
+# url path segment -> link kind
+MEDIA_PATHS = {"p": POST, "reel": REEL, "reels": REEL, "tv": TV}
+# a message with several kinds of links is routed by the first of these it has
+ROUTE_PRIORITY = (POST, REEL, TV, SHARE, STORY, SPOTIFY)
+
+# Matches start at the host. Host names and path keywords match in any case (Instagram.com/Reel/ as
+# phones autocapitalize them), shortcodes, tokens and usernames keep their case. Share and stories
+# come before posts, so their path isn't mistaken for a username prefix.
+LINK_REG = re.compile(r'''
+    (?:
+        (?i:instagram\.com|instagr\.am)/
+        (?:
+            (?i:share)/(?:(?i:p|reels?|tv)/)?(?P<share>[A-Za-z0-9_-]+)
+          | (?i:stories)/(?P<story>[A-Za-z0-9._]{1,30}(?:/\d+)?)
+          | (?:[A-Za-z0-9._]{1,30}/)?(?P<media_kind>(?i:p|reels?|tv))/(?P<shortcode>[A-Za-z0-9_-]{8,64})
+        )
+      | (?i:open\.spotify\.com)/(?:intl-[a-z]{2}/)?(?P<spotify>(?:track|album|playlist|artist)/[A-Za-z0-9]+)
+    )
+''', re.VERBOSE)
+
+Link = namedtuple("Link", "kind value url")
+Route = namedtuple("Route", "kind links")
+
+NO_ROUTE = Route(UNKNOWN, ())
+
+
+def parse_links(text: str) -> list:
+    """
+    All recognized links in a text, in order: Link(kind, value, url), value being the shortcode
+    for posts/reels/tv, the share token, "username[/story id]" for stories, "type/id" for spotify.
+    """
+    links = []
+    for match in LINK_REG.finditer(text or ""):
+        shortcode = match.group("shortcode")
+        if shortcode:
+            links.append(Link(MEDIA_PATHS[match.group("media_kind").lower()], shortcode, match.group(0)))
+        elif match.group("share"):
+            links.append(Link(SHARE, match.group("share"), match.group(0)))
+        elif match.group("story"):
+            links.append(Link(STORY, match.group("story"), match.group(0)))
+        else:
+            links.append(Link(SPOTIFY, match.group("spotify"), match.group(0)))
+    return links
+
+def route_text(text: str) -> Route:
+    links = parse_links(text)
+    if not links:
+        return NO_ROUTE
+    kinds = {link.kind for link in links}
+    return Route(next(kind for kind in ROUTE_PRIORITY if kind in kinds), tuple(links))
+
+def route_message(message) -> Route:
+    """
+    The message's Route, parsed on first use and then kept on the message.
+    """
+    route = getattr(message, "route", None)
+    if route is None:
+        route = route_text(message.text) if message.content_type == "text" else NO_ROUTE
+        message.route = route
+    return route
+
+def routed(*kinds):
+    """
+    Handler filter: func=routed(POST, REEL) matches messages routed to one of those kinds.
+    """
+    return lambda message: route_message(message).kind in kinds
+
+def route_shortcodes(route: Route, limit: int = None) -> list:
+    """
+    Distinct shortcodes of a route's post/reel/tv links, in order, at most limit of them.
+    """
+    shortcodes = []
+    for link in route.links:
+        if link.kind in MEDIA_KINDS and link.value not in shortcodes:
+            shortcodes.append(link.value)
+            if len(shortcodes) == limit:
+                break
+    return shortcodes
+
+def route_post_count(route, limit: int = None) -> int:
+    """
+    How many posts share_resolver.route_post_shortcodes would return at most, without resolving any
+    share link.
+    """
+    count = len({link.value for link in route.links if link.kind in MEDIA_KINDS or link.kind == SHARE})
+    return min(count, limit) if limit else count
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+
+import requests
+
+# telegram message text limit
+MAX_MESSAGE_LENGTH = 4096
+BATCH_SEPARATOR = "\n\n- - -\n\n"
+
+
+def retry_after(response, default: float = 5.0) -> float:
+    """
+    Seconds telegram asks to wait in a 429 response, default when the body doesn't say.
+    """
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return default
+
+
+class LogShipper:
+    """
+    Sends log lines to a telegram chat from a background thread.
+
+    Lines are buffered and coalesced into as few messages as fit in 4096 chars, sent over one
+    keep-alive session no more often than min_interval. When the buffer is full new lines are
+    dropped (and counted), so callers never wait on telegram.
+    """
+    def __init__(self, bot_token: str, chat_id: int, max_queue: int = 1000, min_interval: float = 3.0,
+                 api_url: str = "https://api.telegram.org"):
+        self.url = f"{api_url}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock() # worker and flush() take turns on the buffer
+        self._thread = None
+        self._pending = None # line taken from the queue that didn't fit in the last batch
+        self.dropped = 0
+        self.sent = 0
+
+    def ship(self, text: str):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self, timeout: float = None):
+        """
+        Joins queued lines into one message of at most MAX_MESSAGE_LENGTH chars.
+        Returns None if nothing arrived within timeout (None means don't wait at all).
+        """
+        if self._pending is not None:
+            first, self._pending = self._pending, None
+        else:
+            try:
+                first = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+            except queue.Empty:
+                return None
+
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        parts = [f"({dropped} log messages dropped)"] if dropped else []
+        parts.append(first[:MAX_MESSAGE_LENGTH])
+        length = sum(len(p) for p in parts) + len(BATCH_SEPARATOR) * (len(parts) - 1)
+
+        while True:
+            try:
+                text = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if length + len(BATCH_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH:
+                self._pending = text
+                break
+            parts.append(text)
+            length += len(BATCH_SEPARATOR) + len(text)
+
+        return BATCH_SEPARATOR.join(parts)[:MAX_MESSAGE_LENGTH]
+
+    def _send(self, text: str):
+        for _ in range(3):
+            try:
+                response = self._session.post(self.url, data={"chat_id": self.chat_id, "text": text}, timeout=(5, 15))
+            except requests.RequestException as e:
+                print("Error in registering log:", repr(e))
+                return
+            if response.status_code == 200:
+                self.sent += 1
+                return
+            if response.status_code == 429:
+                time.sleep(retry_after(response))
+                continue
+            print("Error in registering log:", response.status_code)
+            return
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            with self._send_lock:
+                text = self._next_batch(timeout=1.0)
+                if text is None:
+                    continue
+                try:
+                    self._send(text)
+                except Exception as e:
+                    # a bad batch is dropped, the thread has to keep shipping the next ones
+                    print("Error in registering log:", repr(e))
+            # stay under telegram's per-chat limit, lines keep piling up into the next batch meanwhile
+            time.sleep(max(0.0, self.min_interval - (time.monotonic() - started)))
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Best-effort send of whatever is still buffered, used at exit.
+        """
+        deadline = time.monotonic() + timeout
+        if not self._send_lock.acquire(timeout=timeout):
+            return
+        try:
+            while time.monotonic() < deadline:
+                text = self._next_batch()
+                if text is None:
+                    return
+                self._send(text)
+        finally:
+            self._send_lock.release()
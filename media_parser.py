@@ -0,0 +1,130 @@
+import json
+import re
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None # optional, parses graphql bodies several times faster (pip install orjson)
+
+# A post payload is mostly comments, owner and related profiles; the download only needs each
+# media's type and url and the caption. Bodies are parsed straight from the response bytes
+# (orjson when installed) and the wanted fields are read into compact tuple records, so nothing
+# of the payload outlives the parse. Each item keeps its renditions, the one sent is picked per
+# user by renditions.select_rendition.
+
+IMAGE = "image"
+VIDEO = "video"
+
+# size estimates when instagram doesn't say
+IMAGE_BYTES_PER_PIXEL = 0.2 # instagram jpegs, 1080x1350 is ~280 KB
+VIDEO_BITS_PER_PIXEL_SECOND = 2.2 # h264 at 30 fps, 720x1280 is ~2 Mbit/s
+AUDIO_BITRATE = 128000
+
+# size: estimated bytes, None when unknown
+Rendition = namedtuple("Rendition", "url width height size")
+# namedtuple: __slots__ = (), serializes to a [type, url, renditions] list in the sqlite cache tier.
+# url is the largest rendition, renditions is () for items cached before they were kept
+MediaItem = namedtuple("MediaItem", "type url renditions", defaults=((),))
+
+REPRESENTATION_REG = re.compile(r'<Representation\b([^>]*)>')
+HEIGHT_REG = re.compile(r'\bheight="(\d+)"')
+BANDWIDTH_REG = re.compile(r'\bbandwidth="(\d+)"')
+
+
+def dash_video_bandwidths(manifest: str) -> dict:
+    """
+    {height: bits per second} of the video representations in a DASH manifest (dash_info).
+    """
+    bandwidths = {}
+    for match in REPRESENTATION_REG.finditer(manifest or ""):
+        attributes = match.group(1)
+        height = HEIGHT_REG.search(attributes)
+        bandwidth = BANDWIDTH_REG.search(attributes)
+        if height and bandwidth and 'mimeType="audio' not in attributes:
+            bandwidths[int(height.group(1))] = int(bandwidth.group(1))
+    return bandwidths
+
+def image_size(width: int, height: int):
+    return int(width * height * IMAGE_BYTES_PER_PIXEL) if width and height else None
+
+def video_size(width: int, height: int, duration, bandwidths: dict):
+    """
+    Estimated bytes of a progressive (video + audio) rendition: the DASH bitrate of the same height
+    when instagram gave one, else a bitrate for its resolution.
+    """
+    if not duration:
+        return None
+    bitrate = bandwidths.get(height)
+    if bitrate is None:
+        if not (width and height):
+            return None
+        bitrate = width * height * VIDEO_BITS_PER_PIXEL_SECOND
+    return int(duration * (bitrate + AUDIO_BITRATE) / 8)
+
+def image_renditions(node: dict) -> tuple:
+    return tuple(
+        Rendition(resource["src"], resource.get("config_width") or 0, resource.get("config_height") or 0,
+                  image_size(resource.get("config_width"), resource.get("config_height")))
+        for resource in node.get("display_resources") or ()
+    )
+
+def video_renditions(node: dict) -> tuple:
+    """
+    video_versions (when the payload has them) and video_url, the latter at the post's dimensions.
+    """
+    candidates = [(version.get("url"), version.get("width") or 0, version.get("height") or 0) for version in node.get("video_versions") or ()]
+    dimensions = node.get("dimensions") or {}
+    candidates.append((node.get("video_url"), dimensions.get("width") or 0, dimensions.get("height") or 0))
+    candidates = list({url: (url, width, height) for url, width, height in candidates if url}.values())
+    if len(candidates) < 2:
+        # nothing to choose from, the size wouldn't change what is sent
+        return tuple(Rendition(url, width, height, None) for url, width, height in candidates)
+
+    duration = node.get("video_duration")
+    bandwidths = dash_video_bandwidths((node.get("dash_info") or {}).get("video_dash_manifest")) if duration else {}
+    return tuple(Rendition(url, width, height, video_size(width, height, duration, bandwidths)) for url, width, height in candidates)
+
+
+def loads(body):
+    """
+    json.loads for response bodies, bytes taken as they are.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def media_item(node: dict) -> MediaItem:
+    if node.get("is_video"):
+        return MediaItem(VIDEO, node.get("video_url"), video_renditions(node))
+    resources = node.get("display_resources")
+    # the last display resource is the largest
+    return MediaItem(IMAGE, resources[-1]["src"] if resources else node.get("display_url"), image_renditions(node))
+
+def extract_media(json_response: dict):
+    """
+    (media items, caption) of a parsed graphql post response. Raises on unexpected payloads.
+    """
+    media = json_response["data"]["xdt_shortcode_media"]
+    caption_edges = (media.get("edge_media_to_caption") or {}).get("edges")
+    caption = caption_edges[0]["node"].get("text", "") if caption_edges else ""
+
+    if media.get("__typename") == "XDTGraphSidecar" and "edge_sidecar_to_children" in media:
+        return [media_item(edge["node"]) for edge in media["edge_sidecar_to_children"]["edges"]], caption
+    return [media_item(media)], caption
+
+def as_media_items(media_links: list) -> list:
+    """
+    Media items back from the cache: the sqlite tier gives [type, url, renditions] lists, and entries
+    written before MediaItem are {"type", "url"} dicts.
+    """
+    if not media_links or isinstance(media_links[0], MediaItem):
+        return media_links
+    items = []
+    for item in media_links:
+        if isinstance(item, dict):
+            items.append(MediaItem(item["type"], item["url"]))
+        else:
+            renditions = tuple(Rendition(*rendition) for rendition in item[2]) if len(item) > 2 else ()
+            items.append(MediaItem(item[0], item[1], renditions))
+    return items
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from variables import bot, caption_trail, bulk_lookup_workers, bulk_per_user_lookups
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from caching import file_id_cache
+from riad_azz import lookup_media_links
+from media_upload import upload_media_items, is_url_fetch_error
+from send_scheduler import send_scheduler
+from metrics import timed
+from renditions import HIGH, covers, select_rendition, user_quality
+from ledger import FILE_ID, CACHE_HIT, CACHE_MISS, OK, EMPTY, ERROR, record_request
+
+
+def build_caption(caption) -> str:
+    caption = caption or ""
+    # telegram media captions are limited to 1024 chars
+    if len(caption) + len(caption_trail) > 1024:
+        caption = caption[:1024 - len(caption_trail)]
+    return caption + caption_trail
+
+def message_file_id(message):
+    """
+    Returns the file_id telegram assigned to the media of a sent message, or None.
+    """
+    if message.photo:
+        return message.photo[-1].file_id # largest size
+    for attr in ("video", "animation", "document"):
+        media = getattr(message, attr, None)
+        if media:
+            return media.file_id
+    return None
+
+def build_input_media(items, caption: str):
+    input_media = []
+    for i, (media_type, media) in enumerate(items):
+        if media_type == "video":
+            input_media.append(types.InputMediaVideo(media, caption if i == 0 else None))
+        else:
+            input_media.append(types.InputMediaPhoto(media, caption if i == 0 else None))
+    return input_media
+
+def _send_media_chunk(chat_id: int, items, caption: str, by_url: bool):
+    try:
+        if len(items) == 1:
+            media_type, media = items[0]
+            if media_type == "video":
+                return [bot.send_video(chat_id, media, caption=caption)]
+            return [bot.send_photo(chat_id, media, caption=caption)]
+        return bot.send_media_group(chat_id, build_input_media(items, caption))
+    except ApiTelegramException as e:
+        if not (by_url and is_url_fetch_error(e)):
+            raise
+        print("Telegram couldn't fetch media urls, uploading them instead:", e.description)
+        return upload_media_items(chat_id, items, caption)
+
+@timed("send_media")
+def send_media_chunk(chat_id: int, items, caption: str, by_url: bool):
+    """
+    Sends up to 10 (type, media) pairs, paced by the send scheduler. When telegram can't fetch
+    cdn urls itself, the media is streamed through us and uploaded instead.
+    """
+    return send_scheduler.call(chat_id, _send_media_chunk, chat_id, items, caption, by_url)
+
+def send_media_items(chat_id: int, items, caption: str, by_url: bool = True, messages: list = None):
+    """
+    Sends (type, media) pairs, media being a url (by_url) or a telegram file_id, in groups of 10.
+    Returns the sent messages in order. A messages list passed in is filled as groups go out, so
+    after a failure it tells how many items were sent.
+    """
+    if messages is None:
+        messages = []
+    for i in range(0, len(items), 10):
+        # only the first message of a post carries the caption
+        messages.extend(send_media_chunk(chat_id, items[i:i + 10], caption if i == 0 else None, by_url))
+    return messages
+
+def remember_file_ids(shortcode: str, items, messages, caption, quality: str = HIGH):
+    file_ids = [message_file_id(m) for m in messages]
+    if len(file_ids) != len(items) or not all(file_ids):
+        return # partial results are useless for a resend
+    file_id_cache.set(shortcode, {
+        "media": [[media_type, file_id] for (media_type, _), file_id in zip(items, file_ids)],
+        "caption": caption,
+        "quality": quality,
+    })
+
+def cached_post(shortcode: str, quality: str = HIGH):
+    """
+    The file_id_cache entry of a post, None unless it was uploaded at quality or better.
+    """
+    cached = file_id_cache.get(shortcode)
+    if cached and covers(cached.get("quality"), quality):
+        return cached
+    return None
+
+def send_cached_post(chat_id: int, shortcode: str, wait_for=None, quality: str = HIGH):
+    """
+    Re-sends a post that was uploaded before, by telegram file_id.
+    Returns (number of media sent, whether that was all of them): (0, False) on a miss, and when
+    a resend fails partway the media before the failed group were sent and shouldn't be again.
+    """
+    cached = cached_post(shortcode, quality)
+    if not cached:
+        return 0, False
+    if wait_for is not None:
+        futures.wait([wait_for])
+    items = [tuple(item) for item in cached["media"]]
+    messages = []
+    try:
+        send_media_items(chat_id, items, build_caption(cached["caption"]), by_url=False, messages=messages)
+    except ApiTelegramException as e:
+        # file_ids can get invalidated on telegram's side, fall back to a fresh upload
+        print("Cached file_id send failed:", repr(e))
+        file_id_cache.delete(shortcode)
+        return len(messages), False
+    return len(items), True
+
+def timed_lookup(shortcode: str):
+    """
+    Looks up a post's media links. Returns (media_links, caption, ledger cache status, lookup ms).
+    """
+    started = time.perf_counter()
+    media_links, caption, cache_hit = lookup_media_links(shortcode)
+    return media_links, caption, CACHE_HIT if cache_hit else CACHE_MISS, (time.perf_counter() - started) * 1000
+
+def deliver_post(chat_id: int, shortcode: str, wait_for=None, lookup=None, user_id: int = None, source: str = "bot") -> int:
+    """
+    Sends all media of a post to chat_id, by cached file_id when possible, else by cdn url.
+    Returns number of media sent, 0 when instagram returned nothing.
+    wait_for is a future (e.g. the guide message being sent) that must finish before the first send,
+    the lookup itself doesn't wait for it. lookup is an already started timed_lookup (future) to use.
+    Every call is recorded in the request ledger, under user_id and source.
+    Media is sent in user_id's /quality.
+    """
+    count, cache, upstream_ms, send_ms, outcome, error = 0, FILE_ID, None, None, ERROR, None
+    quality = user_quality(user_id)
+    try:
+        started = time.perf_counter()
+        sent, complete = send_cached_post(chat_id, shortcode, wait_for, quality)
+        if complete:
+            count, send_ms, outcome = sent, (time.perf_counter() - started) * 1000, OK
+            return sent
+
+        cache = CACHE_MISS # until the lookup says otherwise
+        media_links, caption, cache, upstream_ms = lookup.result() if lookup is not None else timed_lookup(shortcode)
+        if not media_links:
+            outcome = EMPTY
+            return 0
+
+        if wait_for is not None:
+            futures.wait([wait_for])
+        started = time.perf_counter()
+        items = [(item.type, select_rendition(item, quality)) for item in media_links]
+        if sent:
+            # the first groups already went out by file_id (caption included) before the resend failed,
+            # the rest is uploaded; the post is cached again once a whole upload of it happens
+            send_media_items(chat_id, items[sent:], None)
+        else:
+            messages = send_media_items(chat_id, items, build_caption(caption))
+            remember_file_ids(shortcode, items, messages, caption, quality)
+        send_ms = (time.perf_counter() - started) * 1000
+        count, outcome = len(items), OK
+        return count
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record_request(source, user_id, chat_id, shortcode, count, cache, upstream_ms, send_ms, outcome, error)
+
+# ----------------------------
+# Several posts at once
+# ----------------------------
+class UserLookups:
+    """
+    Per-user gate in front of a shared pool: a user has at most per_user lookups on the pool, the
+    rest wait in that user's queue and are handed to the pool as theirs finish. Pool threads only
+    ever run lookups, none sits blocked on one user's limit.
+    """
+    def __init__(self, pool: ThreadPoolExecutor, per_user: int):
+        self.pool = pool
+        self.per_user = max(1, per_user)
+        self._users = {} # user id -> [lookups on the pool, deque of (future, fn, args) waiting]
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: int, fn, *args) -> futures.Future:
+        future = futures.Future()
+        with self._lock:
+            state = self._users.setdefault(user_id, [0, deque()])
+            if state[0] >= self.per_user:
+                state[1].append((future, fn, args))
+                return future
+            state[0] += 1
+        self._start(user_id, future, fn, args)
+        return future
+
+    def _start(self, user_id: int, future, fn, args):
+        def run():
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                self._finished(user_id)
+        self.pool.submit(run)
+
+    def _finished(self, user_id: int):
+        with self._lock:
+            state = self._users[user_id]
+            if not state[1]:
+                state[0] -= 1
+                if not state[0]:
+                    del self._users[user_id]
+                return
+            future, fn, args = state[1].popleft()
+        self._start(user_id, future, fn, args)
+
+
+lookup_pool = ThreadPoolExecutor(max_workers=bulk_lookup_workers, thread_name_prefix="lookup")
+# caps each user's concurrent lookups, across all their messages
+user_lookups = UserLookups(lookup_pool, bulk_per_user_lookups)
+
+def start_lookups(user_id: int, shortcodes):
+    """
+    Starts looking up posts (timed_lookup) on the shared pool, counted against user_id's concurrent
+    lookups. Returns a future per shortcode, None for posts already in file_id_cache (at user_id's quality).
+    """
+    quality = user_quality(user_id)
+    return [
+        None if cached_post(shortcode, quality) else user_lookups.submit(user_id, timed_lookup, shortcode)
+        for shortcode in shortcodes
+    ]
+
+def deliver_posts(chat_id: int, user_id: int, shortcodes, wait_for=None, source: str = "bot"):
+    """
+    Looks up several posts concurrently (at most bulk_per_user_lookups at a time per user)
+    and sends them in input order. Returns a list with, per shortcode, the number of media
+    sent or the exception it failed with.
+    """
+    lookups = start_lookups(user_id, shortcodes)
+    results = []
+    for shortcode, lookup in zip(shortcodes, lookups):
+        try:
+            results.append(deliver_post(chat_id, shortcode, wait_for, lookup, user_id, source))
+        except Exception as e:
+            results.append(e)
+    return results
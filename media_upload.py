@@ -0,0 +1,170 @@
+import json
+import threading
+import uuid
+
+from telebot import apihelper, types
+
+from variables import (
+    bot_token,
+    upload_max_bytes,
+    upload_concurrency,
+    http_connect_timeout,
+    http_read_timeout,
+)
+from http_client import session
+
+# telegram refuses to upload photos above this size
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# descriptions telegram answers with when it couldn't fetch a media url itself
+URL_FETCH_ERRORS = (
+    "failed to get http url content",
+    "wrong file identifier/http url specified",
+    "wrong type of the web page content",
+    "webpage_curl_failed",
+    "webpage_media_empty",
+)
+
+# uploads hold a cdn connection and a telegram connection open for their whole duration
+upload_slots = threading.BoundedSemaphore(upload_concurrency)
+
+
+class UploadError(Exception):
+    pass
+
+
+def is_url_fetch_error(e) -> bool:
+    description = (getattr(e, "description", None) or "").lower()
+    return any(error in description for error in URL_FETCH_ERRORS)
+
+
+class MultipartStream:
+    """
+    multipart/form-data body that pulls file contents from streaming http responses while it is sent.
+    Has a length, so requests sends a Content-Length instead of chunked encoding, and never holds
+    more than one chunk of a file in memory.
+    """
+    def __init__(self, fields: dict, files: list):
+        self.boundary = uuid.uuid4().hex
+        self._parts = [] # bytes, or (response, size) for file contents
+        for name, value in fields.items():
+            if value is None:
+                continue
+            self._parts.append(self._header(name) + str(value).encode() + b"\r\n")
+        for name, file_name, response, size in files:
+            self._parts.append(self._header(name, file_name))
+            self._parts.append((response, size))
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+        self._length = sum(part[1] if isinstance(part, tuple) else len(part) for part in self._parts)
+        self._buffer = b""
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _header(self, name: str, file_name: str = None) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if file_name:
+            disposition += f'; filename="{file_name}"'
+            return f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\nContent-Type: application/octet-stream\r\n\r\n".encode()
+        return f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        while len(self._buffer) < size and self._parts:
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                self._buffer += part
+                self._parts.pop(0)
+                continue
+            response, remaining = part
+            chunk = response.raw.read(min(CHUNK_SIZE, remaining), decode_content=False) if remaining else b""
+            if remaining and not chunk:
+                raise UploadError("media stream ended early")
+            remaining -= len(chunk)
+            if remaining:
+                self._parts[0] = (response, remaining)
+            else:
+                self._parts.pop(0)
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+
+def open_media(url: str, media_type: str):
+    """
+    Starts streaming a cdn file. Returns (response, size); the size must be known up front.
+    """
+    limit = upload_max_bytes if media_type == "video" else min(upload_max_bytes, PHOTO_MAX_BYTES)
+    # identity encoding, so Content-Length is exactly the number of bytes we forward
+    response = session.get(url, stream=True, headers={"Accept-Encoding": "identity"}, timeout=(http_connect_timeout, http_read_timeout))
+    try:
+        response.raise_for_status()
+        size = int(response.headers.get("Content-Length") or 0)
+        if not size:
+            raise UploadError("media size unknown")
+        if size > limit:
+            raise UploadError(f"media is {size} bytes, over the {limit} bytes upload limit")
+    except Exception:
+        response.close()
+        raise
+    return response, size
+
+def api_request(method_name: str, fields: dict, files: list):
+    """
+    Calls a telegram bot api method with a streamed multipart body and returns its result.
+    """
+    url = (apihelper.API_URL or "https://api.telegram.org/bot{0}/{1}").format(bot_token, method_name)
+    body = MultipartStream(fields, files)
+    response = session.post(url, data=body, headers={"Content-Type": body.content_type}, timeout=(http_connect_timeout, 300))
+    result = response.json()
+    if not result.get("ok"):
+        raise apihelper.ApiTelegramException(method_name, response, result)
+    return result["result"]
+
+def upload_media_items(chat_id: int, items, caption: str):
+    """
+    Downloads (type, url) items from the cdn and uploads them to telegram as files, chunk by chunk.
+    Same contract as media_sender.send_media_items (10 items at most here).
+    """
+    with upload_slots:
+        opened = []
+        try:
+            for i, (media_type, url) in enumerate(items):
+                response, size = open_media(url, media_type)
+                extension = "mp4" if media_type == "video" else "jpg"
+                opened.append((f"file{i}", f"file{i}.{extension}", response, size))
+
+            if len(items) == 1:
+                media_type = items[0][0]
+                field = "video" if media_type == "video" else "photo"
+                name, file_name, response, size = opened[0]
+                fields = {"chat_id": chat_id, "caption": caption, "parse_mode": "HTML"}
+                result = api_request("sendVideo" if media_type == "video" else "sendPhoto", fields, [(field, file_name, response, size)])
+                return [types.Message.de_json(result)]
+
+            media = []
+            for i, (media_type, _) in enumerate(items):
+                entry = {"type": "video" if media_type == "video" else "photo", "media": f"attach://file{i}"}
+                if i == 0 and caption:
+                    entry.update(caption=caption, parse_mode="HTML")
+                media.append(entry)
+            fields = {"chat_id": chat_id, "media": json.dumps(media)}
+            result = api_request("sendMediaGroup", fields, opened)
+            return [types.Message.de_json(message) for message in result]
+        finally:
+            for _, _, response, _ in opened:
+                response.close()
@@ -0,0 +1,55 @@
+from variables import (
+    bot,
+    bot_username,
+    membership_cache_size,
+    membership_joined_ttl,
+    membership_not_joined_ttl,
+)
+from functions import log
+from caching import TTLCache
+from metrics import timed
+
+# ----------------------------
+# Join-gate configuration
+# ----------------------------
+UPDATES_CHANNEL = "@quickgram_downloader"  # TODO: set your channel username (must start with @)
+UPDATES_CHANNEL_URL = "https://t.me/quickgram_downloader"  # TODO: set your channel URL
+
+JOINED_STATUSES = ("member", "administrator", "creator")
+
+# user id -> joined (bool). "not joined" entries expire fast so joining is picked up quickly
+membership_cache = TTLCache(membership_cache_size, membership_joined_ttl)
+
+def remember_membership(user_id: int, status):
+    joined = status in JOINED_STATUSES
+    ttl = membership_joined_ttl if joined else membership_not_joined_ttl
+    membership_cache.set(user_id, joined, ttl)
+    return joined
+
+@timed("gate_check")
+def is_user_joined_updates_channel(user_id: int, use_cache: bool = True) -> bool:
+    """
+    Returns True if user is a member/admin/creator in the updates channel.
+    Note: For reliable checks, the bot should be an admin in the channel.
+    Shared by the bot handlers and the mini app api.
+    """
+    if use_cache:
+        joined = membership_cache.get(user_id)
+        if joined is not None:
+            return joined
+
+    try:
+        member = bot.get_chat_member(UPDATES_CHANNEL, user_id)
+        return remember_membership(user_id, getattr(member, "status", None))
+    except Exception as e:
+        # If we can't verify, treat as not joined (safe default), but don't cache it
+        try:
+            log(f"{bot_username} log:\n\njoin-check error: {repr(e)}\nuser: {user_id}")
+        except:
+            pass
+        return False
+
+# Telegram only sends these when the bot is a channel admin and "chat_member" is in allowed_updates
+@bot.chat_member_handler(func=lambda update: (update.chat.username or "").lower() == UPDATES_CHANNEL.lstrip("@").lower())
+def updates_channel_member_handler(update):
+    remember_membership(update.new_chat_member.user.id, update.new_chat_member.status)
@@ -0,0 +1,177 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Minimal prometheus text-format metrics. Recording a sample only appends to a deque (atomic, no lock),
+# samples are folded into the totals in batches, by whoever records the FOLD_EVERY-th one or by a scrape.
+# That keeps a sample well under a microsecond, so hooks can sit on every download. Series whose value
+# already lives elsewhere (cache stats, scheduler stats...) are read at scrape time through collectors.
+
+# seconds, from a cache hit to a slow upload
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FOLD_EVERY = 1024
+
+_metrics = []
+_collectors = []
+
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._pending = deque()
+        self._series = {} # label values -> folded state
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _record(self, label_values, value):
+        self._pending.append((label_values, value))
+        if len(self._pending) > FOLD_EVERY:
+            self._fold()
+
+    def _fold(self):
+        with self._lock:
+            pending = self._pending
+            while pending:
+                label_values, value = pending.popleft()
+                self._add(label_values, value)
+
+    def _add(self, label_values, value):
+        self._series[label_values] = self._series.get(label_values, 0) + value
+
+    def _samples(self):
+        for label_values, value in self._series.items():
+            yield f"{self.name}{_label_text(self.label_names, label_values)} {value}"
+
+    def render(self):
+        self._fold()
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            yield from list(self._samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        self._record(label_values, amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *label_values, amount: float = 1):
+        self._record(label_values, amount)
+
+    def dec(self, *label_values, amount: float = 1):
+        self._record(label_values, -amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        self._record(label_values, value)
+
+    def _add(self, label_values, value):
+        # [per-bucket counts (last one is +Inf), sum]
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self):
+        names = self.label_names + ("le",)
+        for label_values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_label_text(names, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.label_names, label_values)} {total}"
+            yield f"{self.name}_count{_label_text(self.label_names, label_values)} {cumulative}"
+
+
+def collector(fn):
+    """
+    Registers fn, called at scrape time, yielding (name, type, help, [(labels dict, value), ...]).
+    """
+    _collectors.append(fn)
+    return fn
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = list(fn())
+        except Exception as e:
+            print("Metrics collector error:", repr(e))
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_label_text(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# Download pipeline metrics
+# ----------------------------
+stage_seconds = Histogram("downloader_stage_seconds", "Time spent per download pipeline stage.", ["stage"])
+in_flight = Gauge("downloader_in_flight", "Calls currently running per pipeline stage.", ["stage"])
+upstream_responses = Counter("downloader_upstream_responses_total", "Instagram responses by status code.", ["status"])
+
+def timed(stage: str, track_in_flight: bool = False):
+    """
+    Decorator recording a function's duration under stage (also when it raises),
+    and optionally how many calls of it are running.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if track_in_flight:
+                in_flight.inc(stage)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stage_seconds.observe(time.perf_counter() - started, stage)
+                if track_in_flight:
+                    in_flight.dec(stage)
+        return wrapper
+    return decorator
+
+class StageTimer:
+    """
+    with StageTimer("json_parse"): ... for stages that aren't a whole function.
+    """
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        stage_seconds.observe(time.perf_counter() - self.started, self.stage)
@@ -0,0 +1,30 @@
+from caching import media_cache, file_id_cache
+from riad_azz import media_fetches
+from proxy_pool import proxy_pool
+from share_resolver import share_cache
+import metrics
+
+# /metrics series of the download pipeline. The webhook server imports this with the bot handlers,
+# after it's up, so its own import doesn't load the pipeline.
+
+@metrics.collector
+def collect_pipeline_stats():
+    caches = {"media": media_cache, "file_id": file_id_cache, "share_links": share_cache}
+    lookups = [({"cache": name, "result": result}, value) for name, cache in caches.items() for result, value in cache.stats.items()]
+    ratios = []
+    for name, cache in caches.items():
+        hits = cache.stats["memory_hits"] + cache.stats["disk_hits"]
+        total = hits + cache.stats["misses"]
+        ratios.append(({"cache": name}, hits / total if total else 0.0))
+    yield "downloader_cache_requests_total", "counter", "Cache lookups by tier answered (or missed).", lookups
+    yield "downloader_cache_hit_ratio", "gauge", "Share of cache lookups answered by either tier.", ratios
+
+    yield "downloader_media_fetches_in_flight", "gauge", "Instagram lookups currently running (after coalescing).", [({}, media_fetches.in_flight())]
+    yield "downloader_media_fetches_coalesced_total", "counter", "Lookups that joined a running fetch.", [({}, media_fetches.stats["coalesced"])]
+
+    proxies = proxy_pool.stats()
+    yield "downloader_proxy_in_flight", "gauge", "Instagram requests running through each proxy.", [({"proxy": p["name"]}, p["in_flight"]) for p in proxies]
+    yield "downloader_proxy_health", "gauge", "Each proxy's recent success rate, 0 to 1.", [({"proxy": p["name"]}, p["health"]) for p in proxies]
+    yield "downloader_proxy_requests_total", "counter", "Instagram requests made through each proxy.", [({"proxy": p["name"]}, p["requests"]) for p in proxies]
+    yield "downloader_proxy_failures_total", "counter", "Failed instagram requests through each proxy.", [({"proxy": p["name"]}, p["failures"]) for p in proxies]
+
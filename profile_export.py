@@ -0,0 +1,355 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from variables import (
+    bot_username,
+    profile_export_db,
+    profile_export_max_posts,
+    profile_done_msg,
+    profile_more_msg,
+    profile_not_found_msg,
+    fail_msg,
+)
+from functions import log
+from http_client import request_with_retries
+from proxy_pool import proxy_pool
+from media_parser import loads
+from media_sender import (
+    build_caption,
+    cached_post,
+    send_media_chunk,
+    remember_file_ids,
+    start_lookups,
+    timed_lookup,
+)
+from renditions import select_rendition, user_quality
+from send_scheduler import send_scheduler
+from ledger import FILE_ID, CACHE_MISS, OK, EMPTY, ERROR, record_request
+from jobs import job_queue
+
+# /profile <username>: sends every post of a public profile, newest first, a page at a time.
+# Progress is kept per chat and profile, so an interrupted export picks up where it stopped and
+# a later export only sends the posts that came out since the last one.
+
+PROFILE_INFO_URL = "https://www.instagram.com/api/v1/users/web_profile_info/"
+PROFILE_POSTS_URL = "https://www.instagram.com/graphql/query/"
+PROFILE_POSTS_QUERY_HASH = "69cba40317214236af40e7efa697781d"
+PAGE_SIZE = 12
+# instagram usernames: letters, digits, dots and underscores
+USERNAME_REG = r'^@?(?:(?:https?://)?(?:www\.)?instagram\.com/)?([A-Za-z0-9._]{1,30})/?$'
+
+PROFILE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'X-IG-App-ID': '936619743392459',
+    'X-ASBD-ID': '359341',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+}
+
+
+class ProfileNotFound(Exception):
+    pass
+
+
+def parse_username(text: str):
+    """
+    Returns the username from "/profile <username>" arguments (also @username or a profile link), or None.
+    """
+    match = re.match(USERNAME_REG, (text or "").strip())
+    return match.group(1).lower() if match else None
+
+def parse_timeline(timeline: dict):
+    """
+    Returns (posts, next cursor or None) from an edge_owner_to_timeline_media object,
+    posts being newest first {"shortcode", "taken_at", "pinned"} dicts.
+    """
+    posts = []
+    for edge in timeline.get("edges", []):
+        node = edge["node"]
+        posts.append({
+            "shortcode": node["shortcode"],
+            "taken_at": node.get("taken_at_timestamp") or 0,
+            # pinned posts are listed first whatever their age
+            "pinned": bool(node.get("pinned_for_users")),
+        })
+    page_info = timeline.get("page_info") or {}
+    return posts, page_info.get("end_cursor") if page_info.get("has_next_page") else None
+
+def fetch_profile_page(username: str, user_id=None, cursor=None):
+    """
+    Fetches one page of a profile's posts. The first page (no cursor) also resolves the user id,
+    later pages need it. Returns (user_id, posts, next cursor or None).
+    """
+    if cursor is None:
+        response = request_with_retries(
+            "GET", PROFILE_INFO_URL, params={"username": username},
+            headers={**PROFILE_HEADERS, "Referer": f"https://www.instagram.com/{username}/"}, proxy_pool=proxy_pool,
+        )
+        if response.status_code == 404:
+            raise ProfileNotFound(username)
+        response.raise_for_status()
+        user = (loads(response.content).get("data") or {}).get("user")
+        if not user:
+            raise ProfileNotFound(username)
+        posts, next_cursor = parse_timeline(user["edge_owner_to_timeline_media"])
+        return user["id"], posts, next_cursor
+
+    variables = json.dumps({"id": user_id, "first": PAGE_SIZE, "after": cursor})
+    response = request_with_retries(
+        "GET", PROFILE_POSTS_URL, params={"query_hash": PROFILE_POSTS_QUERY_HASH, "variables": variables},
+        headers={**PROFILE_HEADERS, "Referer": f"https://www.instagram.com/{username}/"}, proxy_pool=proxy_pool,
+    )
+    response.raise_for_status()
+    posts, next_cursor = parse_timeline(loads(response.content)["data"]["user"]["edge_owner_to_timeline_media"])
+    return user_id, posts, next_cursor
+
+
+class ProfileCursorStore:
+    """
+    Export progress per (chat, profile) in a sqlite file, so it survives restarts.
+
+    newest: taken_at of the newest post a finished export sent, later exports stop there.
+    cursor, top, floor: an export in progress, the page to continue from, the newest post it sent
+    so far and the newest of the export before it (where this one stops).
+    page_sent: the posts of that page already sent, so an export interrupted halfway through a
+    page doesn't send them again.
+    """
+    COLUMNS = ("user_id", "newest", "cursor", "top", "floor", "page_sent")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None # opened on first use, importing the module doesn't create the file
+
+    def _connection(self):
+        # called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS profile_exports ("
+                    "chat_id INTEGER, username TEXT, user_id TEXT, newest INTEGER, cursor TEXT, top INTEGER, floor INTEGER, "
+                    "updated_at REAL, PRIMARY KEY (chat_id, username))"
+                )
+                # files from before page_sent was kept
+                if "page_sent" not in {row[1] for row in conn.execute("PRAGMA table_info(profile_exports)")}:
+                    conn.execute("ALTER TABLE profile_exports ADD COLUMN page_sent TEXT")
+            self._conn = conn
+        return self._conn
+
+    def get(self, chat_id: int, username: str) -> dict:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT user_id, newest, cursor, top, floor, page_sent FROM profile_exports WHERE chat_id = ? AND username = ?",
+                (chat_id, username),
+            ).fetchone()
+        state = dict(zip(self.COLUMNS, row)) if row is not None else dict.fromkeys(self.COLUMNS)
+        state["page_sent"] = json.loads(state["page_sent"]) if state["page_sent"] else []
+        return state
+
+    def save(self, chat_id: int, username: str, state: dict):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO profile_exports (chat_id, username, user_id, newest, cursor, top, floor, page_sent, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, username, state["user_id"], state["newest"], state["cursor"], state["top"], state["floor"],
+                     json.dumps(state["page_sent"]), time.time()),
+                )
+
+
+def pack_chunks(posts):
+    """
+    Packs consecutive (shortcode, items, by_url) posts into media groups of at most 10 items,
+    never splitting a post unless it alone has more than 10. file_id and url items aren't mixed,
+    so a group whose urls telegram can't fetch can still fall back to an upload.
+    """
+    chunks = []
+    for shortcode, items, by_url in posts:
+        for i in range(0, len(items), 10):
+            part = items[i:i + 10]
+            last = chunks[-1] if chunks else None
+            if last and last["by_url"] == by_url and len(last["items"]) + len(part) <= 10:
+                last["items"].extend(part)
+                last["posts"].append((shortcode, len(part)))
+            else:
+                chunks.append({"items": list(part), "posts": [(shortcode, len(part))], "by_url": by_url})
+    return chunks
+
+def post_link(shortcode: str) -> str:
+    return f"https://www.instagram.com/p/{shortcode}/"
+
+def send_posts_batched(chat_id: int, user_id: int, shortcodes, on_sent=None) -> int:
+    """
+    Resolves posts concurrently and sends them in order, several posts per media group.
+    Every group is captioned with the links of the posts in it. on_sent(shortcode) is called as
+    each post has been sent. Returns the number of posts sent.
+    """
+    lookups = start_lookups(user_id, shortcodes)
+    quality = user_quality(user_id)
+    posts = []
+    captions = {}
+    # shortcode -> [media count, cache status, lookup ms, send ms] for the request ledger
+    ledger = {}
+    for shortcode, lookup in zip(shortcodes, lookups):
+        cached = cached_post(shortcode, quality) if lookup is None else None
+        if cached:
+            posts.append((shortcode, [tuple(item) for item in cached["media"]], False))
+            ledger[shortcode] = [len(cached["media"]), FILE_ID, None, 0.0]
+            continue
+        try:
+            media_links, caption, cache, upstream_ms = lookup.result() if lookup is not None else timed_lookup(shortcode)
+        except Exception as e:
+            print(f"Profile export lookup of {shortcode} failed:", repr(e))
+            record_request("profile", user_id, chat_id, shortcode, 0, CACHE_MISS, None, None, ERROR, repr(e))
+            continue
+        if not media_links:
+            record_request("profile", user_id, chat_id, shortcode, 0, cache, upstream_ms, None, EMPTY)
+            continue
+        posts.append((shortcode, [(item.type, select_rendition(item, quality)) for item in media_links], True))
+        captions[shortcode] = caption
+        ledger[shortcode] = [len(media_links), cache, upstream_ms, 0.0]
+
+    chunks = pack_chunks(posts)
+    # a post over 10 items spans several chunks, it's recorded once its last one is sent
+    chunks_left = {}
+    for chunk in chunks:
+        for shortcode, _ in chunk["posts"]:
+            chunks_left[shortcode] = chunks_left.get(shortcode, 0) + 1
+    sent = []
+    try:
+        for chunk in chunks:
+            links = "\n".join(post_link(shortcode) for shortcode in dict.fromkeys(shortcode for shortcode, _ in chunk["posts"]))
+            started = time.perf_counter()
+            messages = send_media_chunk(chat_id, chunk["items"], build_caption(links), chunk["by_url"])
+            send_ms = (time.perf_counter() - started) * 1000
+            # map the group's messages back to their posts, to remember file_ids per post
+            offset = 0
+            for shortcode, count in chunk["posts"]:
+                if chunk["by_url"]:
+                    items = chunk["items"][offset:offset + count]
+                    remember_file_ids(shortcode, items, messages[offset:offset + count], captions.get(shortcode), quality)
+                offset += count
+                # a group's send time is split between its posts by their share of the items
+                ledger[shortcode][3] += send_ms * count / len(chunk["items"])
+                chunks_left[shortcode] -= 1
+                if not chunks_left[shortcode]:
+                    sent.append(shortcode)
+                    record_request("profile", user_id, chat_id, shortcode, *ledger[shortcode], OK)
+                    if on_sent is not None:
+                        on_sent(shortcode)
+    except Exception as e:
+        for shortcode, left in chunks_left.items():
+            if left:
+                _, cache, upstream_ms, send_ms = ledger[shortcode]
+                record_request("profile", user_id, chat_id, shortcode, 0, cache, upstream_ms, send_ms or None, ERROR, repr(e))
+        raise
+    return len(sent)
+
+
+class ProfileExporter:
+    """
+    Runs /profile exports. One export per chat at a time; each run sends at most max_posts posts
+    and leaves a cursor behind, so sending /profile again continues the same export.
+    """
+    def __init__(self, store: ProfileCursorStore, max_posts: int):
+        self.store = store
+        self.max_posts = max_posts
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def try_start(self, chat_id: int) -> bool:
+        with self._lock:
+            if chat_id in self._running:
+                return False
+            self._running.add(chat_id)
+            return True
+
+    def finish(self, chat_id: int):
+        with self._lock:
+            self._running.discard(chat_id)
+
+    def export(self, chat_id: int, user_id: int, username: str):
+        """
+        Sends the next posts of username's export to chat_id.
+        Returns (posts sent, whether the export is complete).
+        """
+        state = self.store.get(chat_id, username)
+        if state["cursor"] is None and state["top"] is None:
+            # a new pass, from the newest post down to what the last pass sent
+            state.update(floor=state["newest"] or 0, top=state["newest"] or 0)
+            cursor = None
+        else:
+            cursor = state["cursor"]
+
+        sent = 0
+        while True:
+            state["user_id"], posts, next_cursor = fetch_profile_page(username, state["user_id"], cursor)
+            # everything older than the floor was sent by an earlier export
+            reached_floor = any(post["taken_at"] <= state["floor"] and not post["pinned"] for post in posts)
+            new_posts = [post for post in posts if post["taken_at"] > state["floor"] and post["shortcode"] not in state["page_sent"]]
+
+            taken_at = {post["shortcode"]: post["taken_at"] for post in new_posts}
+
+            def post_sent(shortcode):
+                # saved after every post, a restart halfway through the page skips what was sent
+                state["page_sent"].append(shortcode)
+                state["top"] = max(state["top"], taken_at[shortcode])
+                self.store.save(chat_id, username, state)
+
+            sent += send_posts_batched(chat_id, user_id, [post["shortcode"] for post in new_posts], post_sent)
+            state["top"] = max([state["top"]] + [post["taken_at"] for post in new_posts])
+
+            if reached_floor or next_cursor is None:
+                state.update(newest=state["top"], cursor=None, top=None, floor=None, page_sent=[])
+                self.store.save(chat_id, username, state)
+                return sent, True
+
+            # saved after every page, a restart resumes with the next one
+            cursor = state["cursor"] = next_cursor
+            state["page_sent"] = []
+            self.store.save(chat_id, username, state)
+            if sent >= self.max_posts:
+                return sent, False
+
+
+profile_exporter = ProfileExporter(ProfileCursorStore(profile_export_db), profile_export_max_posts)
+
+def profile_export_job(chat_id: int, user_id: int, username: str):
+    """
+    Job queue entry point for /profile, reports the outcome to the chat.
+    """
+    try:
+        sent, complete = profile_exporter.export(chat_id, user_id, username)
+    except ProfileNotFound:
+        send_scheduler.send_message(chat_id, profile_not_found_msg.format(username=username))
+        return
+    except Exception as e:
+        log(f"{bot_username} log:\n\nuser: {chat_id}\n\n🛑 profile export of {username} failed: {repr(e)}")
+        send_scheduler.send_message(chat_id, fail_msg, parse_mode="HTML", disable_web_page_preview=True)
+        raise
+    finally:
+        profile_exporter.finish(chat_id)
+
+    log(f"{bot_username} log:\n\nuser: {chat_id}\n\nprofile export of {username}: {sent} posts, complete: {complete}")
+    message = profile_done_msg if complete else profile_more_msg
+    send_scheduler.send_message(chat_id, message.format(username=username, sent=sent))
+
+def submit_profile_export(chat_id: int, user_id: int, username: str):
+    """
+    Hands a started export (see ProfileExporter.try_start) to the job pool, right away or once
+    admission lets it through. Releases the chat when that fails, the job won't run to do it.
+    """
+    try:
+        job_queue.submit(user_id, profile_export_job, chat_id, user_id, username)
+    except Exception:
+        profile_exporter.finish(chat_id)
+        raise
@@ -0,0 +1,147 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+from variables import warp_proxies, proxy_cooldown, proxy_failure_threshold
+
+# instagram answers these when an egress ip is rate-limited or flagged
+CIRCUIT_BREAKING_STATUSES = (401, 429)
+MAX_COOLDOWN_DOUBLINGS = 5
+
+
+def redacted_url(url: str) -> str:
+    """
+    scheme://host:port of a proxy url, credentials left out (the name shows up on /metrics).
+    """
+    parts = urlsplit(url)
+    host = parts.netloc.rpartition("@")[2]
+    return f"{parts.scheme}://{host}" if host else "proxy"
+
+
+class Proxy:
+    def __init__(self, proxies: dict, weight: float = 1.0, name: str = None):
+        self.proxies = proxies # requests-style {"http": ..., "https": ...}
+        self.weight = weight
+        self.name = name or redacted_url(proxies.get("https") or proxies.get("http") or "")
+        self.in_flight = 0
+        self.health = 1.0 # moving average of successes, 0..1
+        self.consecutive_failures = 0
+        self.trips = 0 # circuit breaks in a row, each one doubles the cooldown
+        self.cooldown_until = 0.0
+        self.probing = False # half-open after a cooldown, one request tries the proxy before the rest
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until and not self.probing
+
+    def load(self):
+        # lower is better: busy, unhealthy or low-weight proxies get picked less,
+        # ties go to the one with the fewest requests per weight (weighted round-robin)
+        capacity = self.weight * max(self.health, 0.05)
+        return (self.in_flight / capacity, self.requests / capacity)
+
+
+class ProxyPool:
+    """
+    Spreads upstream requests over several egress proxies.
+
+    Picks the least loaded healthy proxy (load weighted by configured weight and health score).
+    A 401/429 opens the proxy's circuit for a cooldown that doubles on repeated trips; repeated
+    connection errors/5xx do the same after failure_threshold in a row. Once the cooldown is over
+    the circuit is half-open: a single request probes the proxy, a success closes the circuit and
+    any failure opens it again.
+    """
+    def __init__(self, proxies, cooldown: float, failure_threshold: int):
+        self.proxies = list(proxies)
+        self.cooldown = cooldown
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns a Proxy to use (release it afterwards), or None when no proxies are configured.
+        """
+        if not self.proxies:
+            return None
+        now = time.time()
+        with self._lock:
+            candidates = [p for p in self.proxies if p.available(now)]
+            if candidates:
+                proxy = min(candidates, key=Proxy.load)
+                # a proxy that tripped before is only trusted again after this request succeeds
+                proxy.probing = proxy.trips > 0
+            else:
+                # everything is cooling down, the one that recovers first is the best bet
+                proxy = min(self.proxies, key=lambda p: p.cooldown_until)
+            proxy.in_flight += 1
+            proxy.requests += 1
+        return proxy
+
+    def release(self, proxy, status_code: int = None, error: Exception = None):
+        if proxy is None:
+            return
+        now = time.time()
+        with self._lock:
+            proxy.in_flight -= 1
+            probe, proxy.probing = proxy.probing, False
+            if status_code in CIRCUIT_BREAKING_STATUSES:
+                self._fail(proxy, now, trip=True)
+            elif error is not None or (status_code or 0) >= 500:
+                self._fail(proxy, now, trip=probe or proxy.consecutive_failures + 1 >= self.failure_threshold)
+            else:
+                proxy.health = proxy.health * 0.8 + 0.2
+                proxy.consecutive_failures = 0
+                proxy.trips = 0
+
+    def abandon(self, proxy):
+        """
+        Releases a proxy whose request was cancelled, without counting it for or against the proxy.
+        """
+        if proxy is None:
+            return
+        with self._lock:
+            proxy.in_flight -= 1
+            proxy.probing = False
+
+    def _fail(self, proxy, now, trip: bool):
+        proxy.failures += 1
+        proxy.consecutive_failures += 1
+        proxy.health *= 0.8
+        if trip:
+            proxy.cooldown_until = now + self.cooldown * 2 ** min(proxy.trips, MAX_COOLDOWN_DOUBLINGS)
+            proxy.trips += 1
+            proxy.consecutive_failures = 0
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return [{
+                "name": p.name,
+                "in_flight": p.in_flight,
+                "health": round(p.health, 3),
+                "requests": p.requests,
+                "failures": p.failures,
+                "cooling_down_for": max(0.0, round(p.cooldown_until - now, 1)),
+            } for p in self.proxies]
+
+
+def parse_proxies(raw) -> list:
+    """
+    WARP_PROXIES can be a single requests proxies dict (old format), or a list of
+    proxy urls, proxies dicts, or {"url": ..., "weight": ...} objects.
+    """
+    if isinstance(raw, dict):
+        raw = [raw] if raw else []
+    proxies = []
+    for entry in raw or []:
+        if isinstance(entry, str):
+            proxies.append(Proxy({"http": entry, "https": entry}))
+        elif "url" in entry:
+            proxies.append(Proxy({"http": entry["url"], "https": entry["url"]}, float(entry.get("weight", 1)), entry.get("name")))
+        else:
+            proxies.append(Proxy(entry))
+    return proxies
+
+
+proxy_pool = ProxyPool(parse_proxies(warp_proxies), proxy_cooldown, proxy_failure_threshold)
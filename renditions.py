@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from variables import user_settings_db, default_quality
+from caching import TTLCache
+
+# Instagram lists every media in several renditions. Telegram fetches a url by itself only up to
+# 5 MB for photos and 20 MB for videos, and big files are the slow (or timed out) ones, so the
+# rendition sent is picked per user quality tier: the largest one within the tier's size and
+# resolution limits, or the smallest one when none fits. Photos come in several sizes
+# (display_resources); graphql post payloads carry a single video_url, so videos only have a
+# choice when a payload lists video_versions.
+
+PHOTO_URL_LIMIT = 5 * 1024 * 1024
+VIDEO_URL_LIMIT = 20 * 1024 * 1024
+
+HIGH = "high"
+BALANCED = "balanced"
+FAST = "fast"
+QUALITIES = (HIGH, BALANCED, FAST)
+QUALITY_RANK = {FAST: 0, BALANCED: 1, HIGH: 2}
+
+# max_side: limit on the shorter side in pixels (None: any), *_bytes: estimated file size limits
+Tier = namedtuple("Tier", "max_side image_bytes video_bytes")
+QUALITY_TIERS = {
+    HIGH: Tier(None, PHOTO_URL_LIMIT, VIDEO_URL_LIMIT),
+    BALANCED: Tier(1080, 2 * 1024 * 1024, 8 * 1024 * 1024),
+    FAST: Tier(640, 512 * 1024, 3 * 1024 * 1024),
+}
+
+
+def select_rendition(item, quality: str) -> str:
+    """
+    The url of a media_parser.MediaItem to send for quality, item.url when it has no renditions.
+    """
+    if not item.renditions:
+        return item.url
+    tier = QUALITY_TIERS.get(quality) or QUALITY_TIERS[HIGH]
+    max_bytes = tier.video_bytes if item.type == "video" else tier.image_bytes
+    fitting = [
+        rendition for rendition in item.renditions
+        if (tier.max_side is None or min(rendition.width, rendition.height) <= tier.max_side)
+        and (rendition.size is None or rendition.size <= max_bytes)
+    ]
+    if fitting:
+        return max(fitting, key=lambda rendition: rendition.width * rendition.height).url
+    # sizes are estimates and not always there, pixel area is known for every rendition
+    return min(item.renditions, key=lambda rendition: rendition.width * rendition.height).url
+
+def covers(cached_quality, quality: str) -> bool:
+    """
+    Whether media uploaded at cached_quality can be resent for quality. Uploads from before
+    quality tiers were the largest renditions.
+    """
+    return QUALITY_RANK.get(cached_quality, QUALITY_RANK[HIGH]) >= QUALITY_RANK.get(quality, QUALITY_RANK[HIGH])
+
+
+class QualityStore:
+    """
+    /quality choice per user in a sqlite file, read through a memory cache.
+    """
+    def __init__(self, path: str, default: str = HIGH, cache_size: int = 50000):
+        self.default = default if default in QUALITIES else HIGH
+        self.path = path
+        self._cache = TTLCache(cache_size, 3600)
+        self._lock = threading.Lock()
+        self._conn = None # opened on first use, importing the module doesn't create the file
+
+    def _connection(self):
+        # called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS user_quality (user_id INTEGER PRIMARY KEY, quality TEXT, updated_at REAL)"
+                )
+            self._conn = conn
+        return self._conn
+
+    def get(self, user_id) -> str:
+        if user_id is None:
+            return self.default
+        quality = self._cache.get(user_id)
+        if quality is None:
+            with self._lock:
+                row = self._connection().execute("SELECT quality FROM user_quality WHERE user_id = ?", (user_id,)).fetchone()
+            quality = row[0] if row and row[0] in QUALITIES else self.default
+            self._cache.set(user_id, quality)
+        return quality
+
+    def set(self, user_id: int, quality: str):
+        if quality not in QUALITIES:
+            raise ValueError(f"Unknown quality {quality!r}")
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO user_quality VALUES (?, ?, ?)", (user_id, quality, time.time()))
+        self._cache.set(user_id, quality)
+
+
+quality_store = QualityStore(user_settings_db, default_quality)
+
+def user_quality(user_id) -> str:
+    return quality_store.get(user_id)
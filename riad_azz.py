@@ -1,4 +1,11 @@
 from variables import *
+from caching import media_cache, cdn_links_ttl
+from http_client import request_with_retries
+from debug_capture import debug_capture
+from proxy_pool import proxy_pool
+from singleflight import SingleFlight
+from metrics import timed, StageTimer
+from media_parser import loads, extract_media, as_media_items
 
 def generate_request_body(shortcode):
     return urllib.parse.urlencode({
@@ -34,9 +41,10 @@ def generate_request_body(shortcode):
         'doc_id': '8845758582119845',
     })
 
-def get_instagram_media_links(shortcode):
-    url = "https://www.instagram.com/graphql/query"
-    headers = {
+GRAPHQL_URL = instagram_graphql_url
+
+def generate_request_headers(shortcode):
+    return {
         'User-Agent': 'Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile Safari/537.36',
         'Accept': '*/*',
         'Accept-Language': 'en-US,en;q=0.5',
@@ -55,50 +63,67 @@ def get_instagram_media_links(shortcode):
         'Cache-Control': 'no-cache',
         'Referer': f'https://www.instagram.com/p/{shortcode}/',
     }
+
+def fetch_instagram_media_links(shortcode):
+    headers = generate_request_headers(shortcode)
     data = generate_request_body(shortcode)
-    response = requests.post(url, headers=headers, data=data, proxies=warp_proxies)
+    with StageTimer("graphql_fetch"):
+        response = request_with_retries("POST", GRAPHQL_URL, headers=headers, data=data, proxy_pool=proxy_pool)
     response.raise_for_status()
-    json_response = response.json()
-
-    # debug - to view json view pretty
-    with open(f"instagram_response.json", "w") as f:
-        json.dump(json_response, f, indent=2)
 
     media_links = []
     caption = None
+    json_response = None
     try:
-        media = json_response['data']['xdt_shortcode_media']
-        # caption
-        caption = media.get('edge_media_to_caption', {}).get('edges', [{}])[0].get('node', {}).get('text', '')
-        # Check if it's a sidecar (multiple media)
-        if media.get('__typename') == 'XDTGraphSidecar' and 'edge_sidecar_to_children' in media:
-            edges = media['edge_sidecar_to_children']['edges']
-            for edge in edges:
-                node = edge['node']
-                media_type = 'video' if node.get('is_video', False) else 'image'
-                if media_type == 'video':
-                    url = node.get('video_url')
-                else:
-                    display_resources = node.get('display_resources', [])
-                    if display_resources:
-                        url = display_resources[-1]['src']
-                    else:
-                        url = node.get('display_url')
-                media_links.append({'type': media_type, 'url': url})
-        else:
-            media_type = 'video' if media.get('is_video', False) else 'image'
-            if media_type == 'video':
-                url = media.get('video_url')
-            else:
-                display_resources = media.get('display_resources', [])
-                if display_resources:
-                    url = display_resources[-1]['src']
-                else:
-                    url = media.get('display_url')
-            media_links.append({'type': media_type, 'url': url})
+        with StageTimer("json_parse"):
+            json_response = loads(response.content)
+        media_links, caption = extract_media(json_response)
     except Exception as e:
+        # debug - opt-in, see DEBUG_CAPTURE_* settings
+        debug_capture.capture(shortcode, response.content, failed=True)
+        if json_response is None:
+            # not json at all (a login or challenge page), the lookup fails
+            raise
         print(f"Error extracting media info: {e}")
         # return "error", f"{e}"
+    else:
+        debug_capture.capture(shortcode, response.content)
+    return media_links, caption
+
+# concurrent lookups of the same shortcode share one upstream request
+media_fetches = SingleFlight()
+
+def cache_media_links(shortcode, media_links, caption):
+    # only cache real results, a failed parse should be retried next time
+    if media_links:
+        ttl = cdn_links_ttl(media_links)
+        if ttl > 0:
+            media_cache.set(shortcode, [media_links, caption], ttl)
+
+def fetch_and_cache_media_links(shortcode):
+    media_links, caption = fetch_instagram_media_links(shortcode)
+    cache_media_links(shortcode, media_links, caption)
+    return media_links, caption
+
+@timed("lookup", track_in_flight=True)
+def lookup_media_links(shortcode):
+    """
+    get_instagram_media_links that also tells whether the cache answered: (media_links, caption, cache_hit).
+    """
+    cached = media_cache.get(shortcode)
+    if cached is not None:
+        media_links, caption = cached
+        return as_media_items(media_links), caption, True
+
+    media_links, caption = media_fetches.do(shortcode, fetch_and_cache_media_links, shortcode)
+    return media_links, caption, False
+
+def get_instagram_media_links(shortcode):
+    """
+    Cached front of fetch_instagram_media_links. Entries live until their cdn urls expire,
+    and concurrent misses for the same shortcode are coalesced into one fetch.
+    """
+    media_links, caption, _ = lookup_media_links(shortcode)
     return media_links, caption
 
 # # Example usage:
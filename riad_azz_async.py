@@ -0,0 +1,61 @@
+import asyncio
+
+from caching import media_cache
+from debug_capture import debug_capture
+from proxy_pool import proxy_pool
+from singleflight import AsyncSingleFlight
+from async_http_client import request_with_retries_async
+from riad_azz import (
+    GRAPHQL_URL,
+    generate_request_headers,
+    generate_request_body,
+    cache_media_links,
+)
+from media_parser import loads, extract_media, as_media_items
+
+# asyncio mode counterpart of riad_azz, sharing its cache, proxy pool and parsing
+
+media_fetches_async = AsyncSingleFlight()
+
+async def fetch_instagram_media_links_async(shortcode):
+    headers = generate_request_headers(shortcode)
+    data = generate_request_body(shortcode)
+    status, _, body = await request_with_retries_async("POST", GRAPHQL_URL, headers=headers, data=data, proxy_pool=proxy_pool)
+    if status >= 400:
+        raise Exception(f"instagram answered {status}")
+
+    media_links = []
+    caption = None
+    json_response = None
+    try:
+        json_response = loads(body)
+        media_links, caption = extract_media(json_response)
+    except Exception as e:
+        # debug - opt-in, see DEBUG_CAPTURE_* settings
+        debug_capture.capture(shortcode, body, failed=True)
+        if json_response is None:
+            # not json at all (a login or challenge page), the lookup fails
+            raise
+        print(f"Error extracting media info: {e}")
+    else:
+        debug_capture.capture(shortcode, body)
+    return media_links, caption
+
+async def fetch_and_cache_media_links_async(shortcode):
+    media_links, caption = await fetch_instagram_media_links_async(shortcode)
+    await asyncio.to_thread(cache_media_links, shortcode, media_links, caption)
+    return media_links, caption
+
+async def lookup_media_links_async(shortcode):
+    # media_cache has a sqlite tier, kept off the event loop
+    cached = await asyncio.to_thread(media_cache.get, shortcode)
+    if cached is not None:
+        media_links, caption = cached
+        return as_media_items(media_links), caption, True
+
+    media_links, caption = await media_fetches_async.do(shortcode, fetch_and_cache_media_links_async, shortcode)
+    return media_links, caption, False
+
+async def get_instagram_media_links_async(shortcode):
+    media_links, caption, _ = await lookup_media_links_async(shortcode)
+    return media_links, caption
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from variables import (
+    bot,
+    telegram_global_rate,
+    telegram_chat_rate,
+    telegram_chat_burst,
+    send_pipeline_workers,
+)
+from metrics import StageTimer
+
+MAX_429_RETRIES = 5
+MAX_TRACKED_CHATS = 10000
+
+
+class TokenBucket:
+    """
+    Reservation based token bucket: reserve() always succeeds and says how long to wait first,
+    so callers queue up in arrival order instead of failing. wait_time()/take() are for callers
+    that keep their own queue (admission control).
+    """
+    def __init__(self, rate: float, burst: float):
+        if rate <= 0:
+            raise ValueError(f"token bucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        # now can be a little older than a bucket created after the caller read the clock
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def wait_time(self, now: float, cost: float = 1) -> float:
+        """
+        Seconds until cost tokens are available, 0 when they are. Doesn't take them.
+        """
+        self._refill(now)
+        wait = (cost - self.tokens) / self.rate if self.tokens < cost else 0.0
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float, cost: float = 1):
+        self._refill(now)
+        self.tokens -= cost
+
+    def pause(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+
+
+class SendScheduler:
+    """
+    Paces bot api calls under telegram's global (~30/s) and per-chat limits.
+
+    call() waits for its turn, runs the call, and on a 429 honors retry_after (pausing that chat)
+    and tries again, so bursts get queued instead of failing. submit() does the same on a small
+    pool, for independent calls that can run alongside the main flow (e.g. deleting a message).
+    """
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, workers: int):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send")
+        self.stats = {"calls": 0, "waited": 0, "wait_seconds": 0.0, "rate_limited": 0, "waiting": 0}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > MAX_TRACKED_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _sleep_for(self, reserve) -> float:
+        with self._lock:
+            wait = reserve(time.monotonic())
+            if wait > 0:
+                self.stats["wait_seconds"] += wait
+                self.stats["waiting"] += 1
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self.stats["waiting"] -= 1
+        return wait
+
+    def _wait_turn(self, chat_id):
+        # the chat's own turn comes first and only then a global token is taken, so the calls
+        # queued behind one busy chat don't hold the tokens every other chat is waiting for
+        chat_wait = self._sleep_for(lambda now: self._chat_bucket(chat_id).reserve(now))
+        global_wait = self._sleep_for(self._global.reserve)
+        with self._lock:
+            self.stats["calls"] += 1
+            if chat_wait > 0 or global_wait > 0:
+                self.stats["waited"] += 1
+
+    def call(self, chat_id, fn, *args, **kwargs):
+        for attempt in range(MAX_429_RETRIES + 1):
+            self._wait_turn(chat_id)
+            try:
+                return fn(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == MAX_429_RETRIES:
+                    raise
+                retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                with self._lock:
+                    self.stats["rate_limited"] += 1
+                    self._chat_bucket(chat_id).pause(time.monotonic() + retry_after)
+
+    def submit(self, chat_id, fn, *args, **kwargs):
+        return self._executor.submit(self.call, chat_id, fn, *args, **kwargs)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.call(chat_id, bot.send_message, chat_id, text, **kwargs)
+
+    def submit_message(self, chat_id, text, **kwargs):
+        """
+        Sends a message in the background, returns a future of the sent Message.
+        """
+        return self.submit(chat_id, bot.send_message, chat_id, text, **kwargs)
+
+    def delete_later(self, chat_id, message_future):
+        """
+        Deletes a message (given as a future of it) in the background once it has been sent,
+        ignoring errors, e.g. when the user has already deleted it.
+        """
+        def delete(message_id):
+            try:
+                with StageTimer("guide_delete"):
+                    self.call(chat_id, bot.delete_message, chat_id, message_id)
+            except Exception:
+                pass
+
+        def schedule(done):
+            # chained with a callback so no worker sits blocked on another pending send
+            if done.exception() is None:
+                self._executor.submit(delete, done.result().message_id)
+
+        message_future.add_done_callback(schedule)
+
+
+send_scheduler = SendScheduler(telegram_global_rate, telegram_chat_rate, telegram_chat_burst, send_pipeline_workers)
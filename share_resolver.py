@@ -0,0 +1,119 @@
+import urllib.parse
+
+from variables import (
+    share_cache_size,
+    share_cache_ttl,
+    media_cache_db,
+)
+from caching import TTLCache, SQLiteCache, TieredCache
+from http_client import request_with_retries
+from proxy_pool import proxy_pool
+from singleflight import SingleFlight
+from link_router import MEDIA_KINDS, SHARE, route_text, route_shortcodes, route_post_count
+
+# instagram.com/share/... links only redirect to the real post url. The redirect is followed
+# with HEAD requests (no page body), and the token -> shortcode mapping never changes, so it is
+# cached and repeated shares of the same link resolve without any request.
+
+INSTAGRAM_URL = "https://www.instagram.com/"
+MAX_REDIRECTS = 5
+# a shortcode instagram couldn't resolve is cached like this, so it isn't asked again right away
+NOT_FOUND = ""
+NOT_FOUND_TTL = 600
+
+RESOLVE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+# share token -> shortcode (NOT_FOUND when the link led nowhere)
+share_cache = TieredCache(
+    TTLCache(share_cache_size, share_cache_ttl),
+    SQLiteCache(media_cache_db, "share_links") if media_cache_db else None,
+)
+# concurrent resolves of the same token share one redirect walk
+share_resolves = SingleFlight()
+
+
+class LoginRequired(Exception):
+    """
+    Instagram answered with its login wall, which says nothing about whether the link works.
+    """
+
+
+def location_shortcode(url: str):
+    """
+    The post shortcode a redirect target points to, also through login redirects (?next=/p/...), or None.
+    """
+    parts = urllib.parse.urlsplit(url)
+    next_path = urllib.parse.parse_qs(parts.query).get("next")
+    path = urllib.parse.urlsplit(next_path[0]).path if next_path else parts.path
+    # only the path matters, whatever instagram host redirected here
+    shortcodes = route_shortcodes(route_text("instagram.com" + path), 1)
+    return shortcodes[0] if shortcodes else None
+
+def follow_share_link(url: str) -> str:
+    """
+    Walks the redirects of a share link until one points at a post. Returns its shortcode or NOT_FOUND.
+    Raises when instagram blocks the request (401, login wall, 429, 5xx), so that isn't cached.
+    """
+    for _ in range(MAX_REDIRECTS):
+        response = request_with_retries("HEAD", url, headers=RESOLVE_HEADERS, allow_redirects=False, proxy_pool=proxy_pool)
+        if response.status_code == 405:
+            # no HEAD support, only the headers of a GET are read
+            response.close()
+            response = request_with_retries("GET", url, headers=RESOLVE_HEADERS, allow_redirects=False, stream=True, proxy_pool=proxy_pool)
+        response.close()
+        if response.status_code == 401 or response.status_code >= 429:
+            response.raise_for_status() # blocked, rate limited or down, not cached as a dead link
+        location = response.headers.get("Location")
+        if not response.is_redirect or not location:
+            return NOT_FOUND
+        url = urllib.parse.urljoin(url, location)
+        shortcode = location_shortcode(url)
+        if shortcode:
+            return shortcode
+        if urllib.parse.urlsplit(url).path.startswith("/accounts/login"):
+            # the login wall without a post to go back to: this egress ip is blocked for now
+            raise LoginRequired(url)
+    return NOT_FOUND
+
+def resolve_and_cache(token: str, url: str) -> str:
+    shortcode = follow_share_link(url)
+    share_cache.set(token, shortcode, None if shortcode else NOT_FOUND_TTL)
+    return shortcode
+
+def resolve_share_link(link):
+    """
+    Shortcode of a link_router SHARE link, from the cache when it was resolved before. None if it leads nowhere.
+    """
+    shortcode = share_cache.get(link.value)
+    if shortcode is None:
+        # link.url starts at the host, the walk starts from the canonical www host
+        url = urllib.parse.urljoin(INSTAGRAM_URL, link.url.split("/", 1)[1])
+        shortcode = share_resolves.do(link.value, resolve_and_cache, link.value, url)
+    return shortcode or None
+
+def route_post_shortcodes(route, limit: int = None) -> list:
+    """
+    link_router.route_shortcodes that also resolves share links, in message order. Share links
+    that can't be resolved are left out.
+    """
+    shortcodes = []
+    for link in route.links:
+        if link.kind in MEDIA_KINDS:
+            shortcode = link.value
+        elif link.kind == SHARE:
+            try:
+                shortcode = resolve_share_link(link)
+            except Exception as e:
+                print(f"Resolving {link.url} failed:", repr(e))
+                continue
+        else:
+            continue
+        if shortcode and shortcode not in shortcodes:
+            shortcodes.append(shortcode)
+            if len(shortcodes) == limit:
+                break
+    return shortcodes
@@ -0,0 +1,79 @@
+import base64
+import re
+
+# instagram shortcodes are media ids written in base 64. The digits are the url-safe base64 alphabet,
+# so batches can go through the C base64 codec instead of a per-character python loop.
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+# character -> digit value, precomputed once
+DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+SHORTCODE_REG = re.compile(r'[A-Za-z0-9_-]+')
+# media ids fit in 64 bits, i.e. 11 shortcode characters (padded to 12 for base64)
+SHORTCODE_LENGTH = 11
+CODE_WIDTH = 12
+ID_BYTES = CODE_WIDTH // 4 * 3
+# largest integer sqlite can store
+MAX_KEY = 2 ** 63 - 1
+
+
+def code_to_media_id(code: str) -> int:
+    if not code:
+        raise ValueError("empty shortcode")
+    media_id = 0
+    try:
+        for char in code:
+            media_id = media_id << 6 | DIGITS[char]
+    except KeyError:
+        raise ValueError(f"invalid shortcode: {code!r}") from None
+    return media_id
+
+def media_id_to_code(media_id: int) -> str:
+    if media_id < 0:
+        raise ValueError(f"invalid media id: {media_id}")
+    # 3 bytes per 4 characters, so the encoding lines up with the digits
+    size = max(ID_BYTES, -(-media_id.bit_length() // 24) * 3)
+    # leading zero digits are dropped, id 0 is the single digit "A"
+    return base64.urlsafe_b64encode(media_id.to_bytes(size, "big")).decode().lstrip("A") or "A"
+
+def codes_to_media_ids(codes) -> list:
+    """
+    Batch code_to_media_id: all codes are padded to one width and decoded in a single call.
+    """
+    codes = list(codes)
+    if not codes:
+        return []
+    if not min(map(len, codes)) or not SHORTCODE_REG.fullmatch("".join(codes)):
+        raise ValueError("invalid shortcode in batch")
+    # leading "A"s are zero digits, so left padding doesn't change the values
+    width = max(CODE_WIDTH, -(-max(map(len, codes)) // 4) * 4)
+    size = width // 4 * 3
+    raw = base64.urlsafe_b64decode("".join(code.rjust(width, "A") for code in codes))
+    return [int.from_bytes(raw[i:i + size], "big") for i in range(0, len(raw), size)]
+
+def media_ids_to_codes(media_ids) -> list:
+    """
+    Batch media_id_to_code: all ids are written at one width and encoded in a single call.
+    """
+    media_ids = list(media_ids)
+    if not media_ids:
+        return []
+    if min(media_ids) < 0:
+        raise ValueError("invalid media id in batch")
+    size = max(ID_BYTES, -(-max(media_ids).bit_length() // 24) * 3)
+    width = size // 3 * 4
+    encoded = base64.urlsafe_b64encode(b"".join(media_id.to_bytes(size, "big") for media_id in media_ids)).decode()
+    return [encoded[i:i + width].lstrip("A") or "A" for i in range(0, len(encoded), width)]
+
+def shortcode_key(code: str):
+    """
+    Cache key for a shortcode: its media id, an int that is smaller than the string in memory
+    and stored as a native integer by sqlite. Only codes of the usual 11 characters are converted:
+    leading "A"s are zero digits, so a shorter code can have the same id as a different post.
+    Other codes, and 11 character ones that don't map to a 64 bit id, stay strings.
+    """
+    if not isinstance(code, str) or len(code) != SHORTCODE_LENGTH:
+        return code
+    try:
+        media_id = code_to_media_id(code)
+    except ValueError:
+        return code
+    return media_id if media_id <= MAX_KEY else code
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller runs fn,
+    everyone else arriving before it finishes waits and gets the same result (or exception).
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines running on one event loop.
+    """
+    def __init__(self):
+        self._calls = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key, fn, *args):
+        self.stats["calls"] += 1
+        future = self._calls.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # shield so one cancelled waiter doesn't cancel the shared fetch
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.ensure_future(fn(*args))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._calls.pop(key, None)
+            else:
+                future.add_done_callback(lambda _: self._calls.pop(key, None))
+
+    def in_flight(self) -> int:
+        return len(self._calls)
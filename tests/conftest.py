@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# the modules read their settings when imported: a placeholder bot token, no log channel, and the
+# sqlite files they keep in a temporary directory instead of the working tree
+TMP_DIR = tempfile.mkdtemp(prefix="downloader-tests-")
+os.environ["BEST_INSTAGRAM_DOWNLOADER_BOT_API"] = "123456:test"
+os.environ["INSTAGRAM_DOWNLOADER_LOG_CHANNEL_ID"] = ""
+os.environ["MEDIA_CACHE_DB"] = ""
+os.environ["JOB_STORE_DB"] = ""
+os.environ["LEDGER_DB"] = os.path.join(TMP_DIR, "ledger.db")
+os.environ["PROFILE_EXPORT_DB"] = os.path.join(TMP_DIR, "profile_exports.db")
+os.environ["USER_SETTINGS_DB"] = os.path.join(TMP_DIR, "user_settings.db")
+os.environ["DEBUG_CAPTURE_DIR"] = os.path.join(TMP_DIR, "debug_captures")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def controller(**kwargs):
+    settings = dict(user_rate=0, user_burst=1, global_rate=0, global_burst=1, max_queued_per_user=20, max_queued=100)
+    settings.update(kwargs)
+    return AdmissionController(**settings)
+
+
+class Recorder:
+    def __init__(self, expected: int):
+        self.order = []
+        self._expected = expected
+        self._done = threading.Event()
+
+    def run_later(self, name):
+        def run():
+            self.order.append(name)
+            if len(self.order) == self._expected:
+                self._done.set()
+        return run
+
+    def wait(self):
+        assert self._done.wait(5), f"only {self.order} ran"
+        return self.order
+
+
+def test_no_limits():
+    admission = controller()
+    assert all(admission.admit(1, 10, None) == 0 for _ in range(100))
+    assert admission.stats == {"admitted": 100, "queued": 0, "rejected": 0}
+
+
+def test_users_take_turns():
+    # one download at a time over everyone, 50 per second
+    admission = controller(global_rate=50, global_burst=1)
+    recorder = Recorder(4)
+    assert admission.admit("heavy", 1, recorder.run_later("unused")) == 0
+    positions = [admission.admit("heavy", 1, recorder.run_later(f"heavy{i}")) for i in range(1, 4)]
+    assert positions == [1, 2, 3]
+    # the light user waits for one download of the heavy user, not for all of them
+    assert admission.admit("light", 1, recorder.run_later("light")) == 2
+    assert recorder.wait() == ["heavy1", "light", "heavy2", "heavy3"]
+    assert admission.queued() == 0
+
+
+def test_user_rate_only_delays_that_user():
+    admission = controller(user_rate=50, user_burst=1)
+    recorder = Recorder(1)
+    assert admission.admit(1, 1, None) == 0
+    assert admission.admit(1, 1, recorder.run_later("second")) == 1
+    # another user still has their own tokens
+    assert admission.admit(2, 1, None) == 0
+    assert recorder.wait() == ["second"]
+
+
+def test_new_downloads_queue_behind_waiting_ones():
+    admission = controller(user_rate=10, user_burst=5)
+    recorder = Recorder(2)
+    assert admission.admit(1, 5, None) == 0
+    # waits for the bucket to hold 5 tokens again
+    assert admission.admit(1, 5, recorder.run_later("queued")) == 1
+    time.sleep(0.15)
+    # there is a token for this one by now, but it doesn't skip the queue
+    assert admission.admit(1, 1, recorder.run_later("later")) == 2
+    assert recorder.wait() == ["queued", "later"]
+
+
+def test_full_queues_refuse():
+    admission = controller(global_rate=0.001, global_burst=1, max_queued_per_user=2, max_queued=3)
+    admission.admit(1, 1, None)
+    admission.admit(1, 1, lambda: None)
+    admission.admit(1, 1, lambda: None)
+    with pytest.raises(AdmissionRejected):
+        admission.admit(1, 1, lambda: None)
+    admission.admit(2, 1, lambda: None)
+    # everyone's queue is full now
+    with pytest.raises(AdmissionRejected):
+        admission.admit(3, 1, lambda: None)
+    assert admission.stats == {"admitted": 1, "queued": 3, "rejected": 2}
+    assert admission.queued() == 3
+
+
+def test_cost_over_the_burst_still_runs():
+    admission = controller(global_rate=100, global_burst=5)
+    recorder = Recorder(1)
+    assert admission.admit(1, 5, None) == 0
+    # costs more than the bucket holds, it waits for a full bucket instead of forever
+    assert admission.admit(1, 50, recorder.run_later("big")) == 1
+    assert recorder.wait() == ["big"]
+
+
+def test_newcomers_dont_starve_a_queued_download():
+    # 20 tokens per second over everyone, a newcomer every 40ms
+    admission = controller(global_rate=20, global_burst=5)
+    ran = threading.Event()
+    assert admission.admit("heavy", 5, None) == 0
+    assert admission.admit("heavy", 5, ran.set) == 1
+    started = time.monotonic()
+    for newcomer in range(75):
+        if ran.is_set():
+            break
+        admission.admit(newcomer, 1, lambda: None)
+        time.sleep(0.04)
+    # 5 tokens take 0.25s to refill, the newcomers arriving meanwhile wait behind it
+    assert ran.wait(0)
+    assert time.monotonic() - started < 1
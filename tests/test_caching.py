@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+
+import caching
+from caching import CDN_EXPIRY_MARGIN, SQLiteCache, TieredCache, TTLCache, cdn_links_ttl, cdn_url_expiry
+from media_parser import IMAGE, VIDEO, MediaItem
+from shortcode import shortcode_key
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A settable time.time() for the cache module.
+    """
+    clock = SimpleNamespace(now=NOW)
+    clock.time = lambda: clock.now
+    monkeypatch.setattr(caching, "time", clock)
+    return clock
+
+
+def cdn_url(expires_at, name="a.jpg"):
+    return f"https://scontent.cdninstagram.com/v/{name}?stp=dst&oe={int(expires_at):X}&oh=00_x"
+
+
+def test_cdn_url_expiry():
+    assert cdn_url_expiry(cdn_url(NOW)) == int(NOW)
+    assert cdn_url_expiry("https://cdn/a.jpg") is None
+    assert cdn_url_expiry("https://cdn/a.jpg?oe=zz") is None
+
+
+def test_ttl_from_the_first_expiring_url(clock):
+    items = [MediaItem(IMAGE, cdn_url(NOW + 3000)), MediaItem(VIDEO, cdn_url(NOW + 2000, "b.mp4"))]
+    assert cdn_links_ttl(items, max_ttl=86400) == 2000 - CDN_EXPIRY_MARGIN
+
+
+def test_ttl_limits(clock):
+    assert cdn_links_ttl([MediaItem(IMAGE, cdn_url(NOW + 86400))], max_ttl=3600) == 3600
+    # expired, or about to
+    assert cdn_links_ttl([MediaItem(IMAGE, cdn_url(NOW + 60))], max_ttl=3600) == 0
+    assert cdn_links_ttl([MediaItem(IMAGE, "https://cdn/a.jpg")], max_ttl=3600) == 3600
+
+
+def test_memory_entries_expire(clock):
+    cache = TTLCache(10, 60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=300)
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_memory_evicts_least_recently_used(clock):
+    cache = TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_disk_hits_are_promoted_with_their_expiry(tmp_path, clock):
+    memory = TTLCache(10, 3600)
+    cache = TieredCache(memory, SQLiteCache(str(tmp_path / "cache.db"), "media_links"))
+    cache.set("post", ["links", "caption"], ttl=600)
+    # a restart: the memory tier is empty
+    memory.clear()
+
+    clock.now += 100
+    assert cache.get("post") == ["links", "caption"]
+    assert cache.get("post") == ["links", "caption"]
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+    # promoted with what was left of the disk entry's ttl, not the memory default
+    clock.now += 501
+    assert memory.get("post") is None
+    assert cache.get("post") is None
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_survives_a_new_cache(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    TieredCache(TTLCache(10, 3600), SQLiteCache(path, "file_ids")).set("post", {"media": []})
+    assert TieredCache(TTLCache(10, 3600), SQLiteCache(path, "file_ids")).get("post") == {"media": []}
+
+
+def test_keys_are_mapped(tmp_path, clock):
+    disk = SQLiteCache(str(tmp_path / "cache.db"), "media_links")
+    cache = TieredCache(TTLCache(10, 3600), disk, key=shortcode_key)
+    cache.set("DRLGWvMDj1C", "value")
+    assert disk.get(shortcode_key("DRLGWvMDj1C")) == "value"
+    cache.delete("DRLGWvMDj1C")
+    assert cache.get("DRLGWvMDj1C") is None
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+from telebot import apihelper
+
+import riad_azz
+from media_parser import VIDEO, extract_media
+from variables import bot
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fake_services import FakeServices, post_payload
+
+
+@pytest.fixture
+def services():
+    services = FakeServices(done_texts={"all done": "ok"}).start()
+    yield services
+    services.stop()
+
+
+def test_generated_payloads():
+    assert post_payload("ABCDEFGHIJK") == post_payload("ABCDEFGHIJK")
+    items, caption = extract_media(post_payload("ABCDEFGHIJK", "sidecar"))
+    assert len(items) > 1 and "ABCDEFGHIJK" in caption
+    items, _ = extract_media(post_payload("ABCDEFGHIJK", "video"))
+    assert items[0].type == VIDEO and items[0].url
+
+
+def test_lookup_against_the_instagram_stand_in(services, monkeypatch):
+    monkeypatch.setattr(riad_azz, "GRAPHQL_URL", services.url + "/graphql/query")
+    items, caption = riad_azz.fetch_instagram_media_links("ABCDEFGHIJK")
+    assert (items, caption) == extract_media(post_payload("ABCDEFGHIJK"))
+    assert services.stats["instagram"] == 1
+
+
+def test_bot_against_the_telegram_stand_in(services, monkeypatch):
+    monkeypatch.setattr(apihelper, "API_URL", services.url + "/bot{0}/{1}")
+    services.expect(42)
+    assert bot.send_message(42, "working on it").text == "working on it"
+    bot.send_message(42, "all done")
+    assert services.wait_done(42, 5) == "ok"
@@ -0,0 +1,44 @@
+import time
+
+from jobs import JobQueue, MemoryJobStore, SQLiteJobStore, QUEUED, DONE, FAILED
+
+
+def wait_finished(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} didn't finish")
+
+
+def test_job_runs_and_finishes():
+    queue = JobQueue(MemoryJobStore(), 2)
+    calls = []
+    job_id = queue.submit(7, calls.append, "link")
+    job = wait_finished(queue, job_id)
+    assert job["status"] == DONE and job["user_id"] == 7
+    assert calls == ["link"]
+
+
+def test_failed_job_keeps_its_error():
+    def fail():
+        raise ValueError("instagram said no")
+
+    queue = JobQueue(MemoryJobStore(), 1)
+    job = wait_finished(queue, queue.submit(7, fail))
+    assert job["status"] == FAILED
+    assert "instagram said no" in job["error"]
+
+
+def test_created_job_waits_for_start(tmp_path):
+    queue = JobQueue(SQLiteJobStore(str(tmp_path / "jobs.db")), 1)
+    job_id = queue.create(7)
+    assert queue.get(job_id)["status"] == QUEUED
+    queue.start(job_id, lambda: None)
+    assert wait_finished(queue, job_id)["status"] == DONE
+
+
+def test_unknown_job():
+    assert JobQueue(MemoryJobStore(), 1).get("missing") is None
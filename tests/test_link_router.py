@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from link_router import (
+    NO_ROUTE,
+    POST,
+    REEL,
+    SHARE,
+    SPOTIFY,
+    STORY,
+    TV,
+    route_message,
+    route_shortcodes,
+    route_text,
+    routed,
+)
+
+
+@pytest.mark.parametrize("text, kind, value", [
+    ("https://www.instagram.com/p/DFx_jLuACs3/?utm_source=ig_web_copy_link", POST, "DFx_jLuACs3"),
+    ("https://www.instagram.com/reel/C59DWpvOpgF/?igsh=MWQ1ZGUxMzBkMA==", REEL, "C59DWpvOpgF"),
+    ("instagram.com/reels/C59DWpvOpgF", REEL, "C59DWpvOpgF"),
+    ("https://instagram.com/tv/C59DWpvOpgF/", TV, "C59DWpvOpgF"),
+    ("https://www.instagram.com/some.user/p/DFx_jLuACs3/", POST, "DFx_jLuACs3"),
+    ("https://instagr.am/p/DFx_jLuACs3/", POST, "DFx_jLuACs3"),
+    ("https://www.instagram.com/share/reel/BAF2x9q1Yx/", SHARE, "BAF2x9q1Yx"),
+    ("https://www.instagram.com/stories/some.user/3412345678901234567/", STORY, "some.user/3412345678901234567"),
+    ("https://open.spotify.com/intl-de/track/4uLU6hMCjMI75M1A2tKUQC", SPOTIFY, "track/4uLU6hMCjMI75M1A2tKUQC"),
+])
+def test_link_kinds(text, kind, value):
+    route = route_text(text)
+    assert route.kind == kind
+    assert [link.value for link in route.links] == [value]
+
+
+@pytest.mark.parametrize("text", [
+    "Instagram.com/p/ABCDEFGHIJK/",
+    "https://www.Instagram.com/reel/ABCDEFGHIJK/",
+    "HTTPS://WWW.INSTAGRAM.COM/P/ABCDEFGHIJK",
+    "https://www.instagram.com/Reel/ABCDEFGHIJK/",
+])
+def test_hosts_and_paths_match_in_any_case(text):
+    route = route_text(text)
+    assert route.kind in (POST, REEL)
+    assert route_shortcodes(route) == ["ABCDEFGHIJK"]
+
+
+def test_shortcodes_keep_their_case():
+    assert route_shortcodes(route_text("instagram.com/p/AbCdEfGhIjK")) == ["AbCdEfGhIjK"]
+
+
+@pytest.mark.parametrize("text", [
+    "hello",
+    "",
+    None,
+    "https://www.instagram.com/some.user/",
+    "https://example.com/p/ABCDEFGHIJK/",
+])
+def test_no_links(text):
+    assert route_text(text) is NO_ROUTE
+
+
+def test_several_links():
+    route = route_text(
+        "look https://www.instagram.com/reel/AAAAAAAAAAA/ and instagram.com/p/BBBBBBBBBBB/ "
+        "and again instagram.com/reel/AAAAAAAAAAA/ plus instagram.com/stories/someone/"
+    )
+    # posts come first whatever their place in the message
+    assert route.kind == POST
+    assert route_shortcodes(route) == ["AAAAAAAAAAA", "BBBBBBBBBBB"]
+    assert route_shortcodes(route, 1) == ["AAAAAAAAAAA"]
+
+
+def test_route_is_parsed_once():
+    message = SimpleNamespace(content_type="text", text="instagram.com/p/ABCDEFGHIJK")
+    assert routed(POST, REEL)(message)
+    message.text = "changed"
+    assert route_message(message).kind == POST
+    photo = SimpleNamespace(content_type="photo", text=None)
+    assert not routed(POST)(photo)
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import media_sender
+import riad_azz
+from caching import TieredCache, TTLCache
+from media_parser import IMAGE, MediaItem
+from media_sender import UserLookups, start_lookups
+from singleflight import SingleFlight
+
+
+class Gate:
+    """
+    fn for lookups that blocks until opened, counting calls and how many run at once.
+    """
+    def __init__(self):
+        self.opened = threading.Event()
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            self.calls.append(value)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        assert self.opened.wait(5)
+        with self._lock:
+            self.running -= 1
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def run_concurrently(count, fn):
+    pool = ThreadPoolExecutor(max_workers=count)
+    started = [pool.submit(fn) for _ in range(count)]
+    pool.shutdown(wait=False)
+    return started
+
+
+def test_single_flight_runs_once_per_key():
+    flight = SingleFlight()
+    gate = Gate()
+    waiting = run_concurrently(8, lambda: flight.do("abc", gate, "result"))
+    time.sleep(0.1)
+    assert flight.in_flight() == 1
+    gate.opened.set()
+    assert [f.result() for f in waiting] == ["result"] * 8
+    assert gate.calls == ["result"]
+    assert flight.stats == {"calls": 8, "coalesced": 7}
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_shares_errors_then_retries():
+    flight = SingleFlight()
+    gate = Gate()
+    waiting = run_concurrently(4, lambda: flight.do("abc", gate, ValueError("gone")))
+    time.sleep(0.1)
+    gate.opened.set()
+    for future in waiting:
+        with pytest.raises(ValueError):
+            future.result()
+    # a failed call isn't remembered
+    assert flight.do("abc", gate, "second try") == "second try"
+
+
+def test_concurrent_misses_fetch_a_post_once(monkeypatch):
+    fetches = []
+
+    def fetch(shortcode):
+        fetches.append(shortcode)
+        time.sleep(0.1)
+        return [MediaItem(IMAGE, "https://cdn/a.jpg")], "caption"
+
+    monkeypatch.setattr(riad_azz, "fetch_instagram_media_links", fetch)
+    monkeypatch.setattr(riad_azz, "media_cache", TieredCache(TTLCache(10, 3600)))
+    results = [f.result() for f in run_concurrently(6, lambda: riad_azz.lookup_media_links("DRLGWvMDj1C"))]
+    assert fetches == ["DRLGWvMDj1C"]
+    assert all(result == ([MediaItem(IMAGE, "https://cdn/a.jpg")], "caption", False) for result in results)
+    # later lookups are answered by the cache
+    assert riad_azz.lookup_media_links("DRLGWvMDj1C")[2] is True
+    assert fetches == ["DRLGWvMDj1C"]
+
+
+def test_user_lookups_cap_each_user():
+    gate = Gate()
+    lookups = UserLookups(ThreadPoolExecutor(max_workers=8), per_user=2)
+    heavy = [lookups.submit(1, gate, i) for i in range(6)]
+    light = lookups.submit(2, gate, "light")
+    time.sleep(0.1)
+    # two of the heavy user's lookups run, the light user's isn't stuck behind the other four
+    assert sorted(gate.calls, key=str) == [0, 1, "light"]
+    gate.opened.set()
+    assert [f.result(5) for f in heavy] == list(range(6))
+    assert light.result(5) == "light"
+    assert gate.max_running == 3
+    assert lookups._users == {}
+
+
+def test_user_lookups_pass_errors_on():
+    gate = Gate()
+    gate.opened.set()
+    lookups = UserLookups(ThreadPoolExecutor(max_workers=2), per_user=1)
+    failed = lookups.submit(1, gate, ValueError("nope"))
+    after = lookups.submit(1, gate, "after")
+    with pytest.raises(ValueError):
+        failed.result(5)
+    # the failure still frees the user's slot
+    assert after.result(5) == "after"
+
+
+def test_start_lookups_skips_cached_posts(monkeypatch):
+    started = []
+    monkeypatch.setattr(media_sender, "user_quality", lambda user_id: "high")
+    monkeypatch.setattr(media_sender, "cached_post", lambda shortcode, quality: {"media": []} if shortcode == "cached" else None)
+    monkeypatch.setattr(media_sender, "timed_lookup", lambda shortcode: started.append(shortcode) or shortcode)
+    lookups = start_lookups(1, ["new", "cached", "other"])
+    assert lookups[1] is None
+    assert [lookups[0].result(5), lookups[2].result(5)] == ["new", "other"]
+    assert sorted(started) == ["new", "other"]
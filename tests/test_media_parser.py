@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import media_parser
+from media_parser import IMAGE, VIDEO, MediaItem, Rendition, as_media_items, dash_video_bandwidths, extract_media, loads
+
+DASH_MANIFEST = (
+    '<MPD><Period><AdaptationSet mimeType="video/mp4">'
+    '<Representation id="1" bandwidth="900000" width="540" height="960"/>'
+    '<Representation id="2" bandwidth="2000000" width="720" height="1280"/>'
+    '</AdaptationSet><AdaptationSet>'
+    '<Representation id="3" mimeType="audio/mp4" bandwidth="128000" height="0"/>'
+    '</AdaptationSet></Period></MPD>'
+)
+
+
+def image_node(name):
+    return {
+        "is_video": False,
+        "display_url": f"https://cdn/{name}-1080.jpg",
+        "display_resources": [
+            {"src": f"https://cdn/{name}-640.jpg", "config_width": 640, "config_height": 800},
+            {"src": f"https://cdn/{name}-1080.jpg", "config_width": 1080, "config_height": 1350},
+        ],
+    }
+
+
+def video_node(name):
+    return {
+        "is_video": True,
+        "video_url": f"https://cdn/{name}.mp4",
+        "dimensions": {"width": 720, "height": 1280},
+        "video_duration": 10.0,
+        "dash_info": {"video_dash_manifest": DASH_MANIFEST},
+        "video_versions": [{"url": f"https://cdn/{name}-540.mp4", "width": 540, "height": 960}],
+    }
+
+
+def response(media, caption="a caption"):
+    media = dict(media, edge_media_to_caption={"edges": [{"node": {"text": caption}}]} if caption else {"edges": []})
+    return {"data": {"xdt_shortcode_media": media}}
+
+
+def test_single_image():
+    items, caption = extract_media(response(image_node("a")))
+    assert caption == "a caption"
+    assert [(item.type, item.url) for item in items] == [(IMAGE, "https://cdn/a-1080.jpg")]
+    assert [(r.width, r.height) for r in items[0].renditions] == [(640, 800), (1080, 1350)]
+
+
+def test_video_renditions():
+    items, caption = extract_media(response(video_node("v"), caption=None))
+    assert caption == ""
+    (item,) = items
+    assert (item.type, item.url) == (VIDEO, "https://cdn/v.mp4")
+    sizes = {r.height: r.size for r in item.renditions}
+    # the dash bitrate of the same height plus audio, over the duration
+    assert sizes[1280] == int(10.0 * (2000000 + 128000) / 8)
+    assert sizes[960] == int(10.0 * (900000 + 128000) / 8)
+
+
+def test_sidecar_keeps_order():
+    media = {
+        "__typename": "XDTGraphSidecar",
+        "edge_sidecar_to_children": {"edges": [{"node": image_node("a")}, {"node": video_node("v")}, {"node": image_node("b")}]},
+    }
+    items, _ = extract_media(response(media))
+    assert [(item.type, item.url) for item in items] == [
+        (IMAGE, "https://cdn/a-1080.jpg"),
+        (VIDEO, "https://cdn/v.mp4"),
+        (IMAGE, "https://cdn/b-1080.jpg"),
+    ]
+
+
+def test_unexpected_payload_raises():
+    with pytest.raises(KeyError):
+        extract_media({"data": {}})
+
+
+def test_dash_bandwidths_skip_audio():
+    assert dash_video_bandwidths(DASH_MANIFEST) == {960: 900000, 1280: 2000000}
+    assert dash_video_bandwidths(None) == {}
+
+
+@pytest.mark.parametrize("use_orjson", [False, True])
+def test_loads_takes_bytes(monkeypatch, use_orjson):
+    if use_orjson and media_parser.orjson is None:
+        pytest.skip("orjson isn't installed")
+    if not use_orjson:
+        monkeypatch.setattr(media_parser, "orjson", None)
+    assert loads(json.dumps(response(image_node("a"))).encode()) == response(image_node("a"))
+
+
+def test_cache_round_trip():
+    items, _ = extract_media(response(video_node("v")))
+    # the sqlite cache tier stores json, namedtuples come back as lists
+    stored = json.loads(json.dumps(items))
+    restored = as_media_items(stored)
+    assert restored == items
+    assert isinstance(restored[0], MediaItem) and isinstance(restored[0].renditions[0], Rendition)
+    assert as_media_items(items) is items
+
+
+def test_cache_entries_from_before_media_items():
+    restored = as_media_items([{"type": "image", "url": "https://cdn/a.jpg"}, ["video", "https://cdn/v.mp4"]])
+    assert restored == [MediaItem(IMAGE, "https://cdn/a.jpg"), MediaItem(VIDEO, "https://cdn/v.mp4")]
+    assert restored[0].renditions == ()
@@ -0,0 +1,37 @@
+import io
+from email.parser import BytesParser
+from types import SimpleNamespace
+
+import pytest
+
+from media_upload import MultipartStream, UploadError, is_url_fetch_error
+
+
+def fake_response(data: bytes):
+    # only response.raw.read(n, decode_content=False) is used
+    raw = io.BytesIO(data)
+    return SimpleNamespace(raw=SimpleNamespace(read=lambda n, decode_content=False: raw.read(n)))
+
+
+def test_url_fetch_errors():
+    assert is_url_fetch_error(SimpleNamespace(description="Bad Request: failed to get HTTP URL content"))
+    assert is_url_fetch_error(SimpleNamespace(description="Bad Request: WEBPAGE_CURL_FAILED"))
+    assert not is_url_fetch_error(SimpleNamespace(description="Forbidden: bot was blocked by the user"))
+    assert not is_url_fetch_error(ValueError("no description"))
+
+
+def test_multipart_body_matches_its_length():
+    photo = bytes(range(256)) * 1000
+    body = MultipartStream({"chat_id": 42, "caption": None}, [("photo", "file0.jpg", fake_response(photo), len(photo))])
+    data = b"".join(body)
+    assert len(data) == len(body)
+
+    message = BytesParser().parsebytes(b"Content-Type: " + body.content_type.encode() + b"\r\n\r\n" + data)
+    parts = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True) for part in message.get_payload()}
+    assert parts == {"chat_id": b"42", "photo": photo}
+
+
+def test_multipart_short_stream():
+    body = MultipartStream({}, [("photo", "file0.jpg", fake_response(b"abc"), 10)])
+    with pytest.raises(UploadError):
+        b"".join(body)
@@ -0,0 +1,64 @@
+import pytest
+
+import metrics
+
+
+def sample_lines(name):
+    return [line for line in metrics.render().splitlines() if line.startswith(name) and not line.startswith("#")]
+
+
+def test_counter_and_gauge():
+    counter = metrics.Counter("test_requests_total", "Requests.", ["status"])
+    gauge = metrics.Gauge("test_running", "Running.")
+    counter.inc("200")
+    counter.inc("200")
+    counter.inc("429", amount=3)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert sorted(sample_lines("test_requests_total")) == [
+        'test_requests_total{status="200"} 2',
+        'test_requests_total{status="429"} 3',
+    ]
+    assert sample_lines("test_running") == ["test_running 1"]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "fetch")
+    assert sample_lines("test_seconds") == [
+        'test_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'test_seconds_bucket{stage="fetch",le="1.0"} 3',
+        'test_seconds_bucket{stage="fetch",le="+Inf"} 4',
+        'test_seconds_sum{stage="fetch"} 6.05',
+        'test_seconds_count{stage="fetch"} 4',
+    ]
+
+
+def test_timed_records_failures_too():
+    @metrics.timed("test_stage", track_in_flight=True)
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+    assert 'downloader_stage_seconds_count{stage="test_stage"} 1' in sample_lines("downloader_stage_seconds_count")
+    assert 'downloader_in_flight{stage="test_stage"} 0' in sample_lines("downloader_in_flight")
+
+
+def test_collectors():
+    @metrics.collector
+    def broken():
+        raise RuntimeError("stats went away")
+        yield
+
+    @metrics.collector
+    def queue_depth():
+        yield "test_queue_depth", "gauge", "Queued.", [({"queue": "a"}, 3)]
+
+    try:
+        assert sample_lines("test_queue_depth") == ['test_queue_depth{queue="a"} 3']
+    finally:
+        metrics._collectors.remove(broken)
+        metrics._collectors.remove(queue_depth)
@@ -0,0 +1,128 @@
+import pytest
+
+import profile_export
+from profile_export import ProfileCursorStore, ProfileExporter, pack_chunks
+
+
+class FakeProfile:
+    """
+    A profile's posts, newest first, served a page at a time like fetch_profile_page.
+    """
+    def __init__(self, count: int, page_size: int = 12):
+        self.page_size = page_size
+        self.posts = [{"shortcode": f"post{i}", "taken_at": 1000 + i, "pinned": False} for i in reversed(range(count))]
+
+    def add_posts(self, count: int):
+        newest = self.posts[0]["taken_at"] - 1000 + 1
+        self.posts[:0] = [{"shortcode": f"post{i}", "taken_at": 1000 + i, "pinned": False} for i in reversed(range(newest, newest + count))]
+
+    def fetch(self, username, user_id=None, cursor=None):
+        start = int(cursor) if cursor else 0
+        end = start + self.page_size
+        return "42", self.posts[start:end], str(end) if end < len(self.posts) else None
+
+
+class FakeSender:
+    def __init__(self, fail_at=None):
+        self.sent = []
+        self.fail_at = fail_at
+
+    def send(self, chat_id, user_id, shortcodes, on_sent=None):
+        count = 0
+        for shortcode in shortcodes:
+            if shortcode == self.fail_at:
+                self.fail_at = None
+                raise ConnectionError("telegram went away")
+            self.sent.append(shortcode)
+            count += 1
+            if on_sent is not None:
+                on_sent(shortcode)
+        return count
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    profile = FakeProfile(30)
+    monkeypatch.setattr(profile_export, "fetch_profile_page", profile.fetch)
+    return profile
+
+
+def exporter(tmp_path, max_posts=100):
+    return ProfileExporter(ProfileCursorStore(str(tmp_path / "exports.db")), max_posts)
+
+
+def test_interrupted_export_resumes_without_duplicates(tmp_path, monkeypatch, profile):
+    sender = FakeSender(fail_at="post12")
+    monkeypatch.setattr(profile_export, "send_posts_batched", sender.send)
+    # stops halfway through the second page
+    with pytest.raises(ConnectionError):
+        exporter(tmp_path).export(1, 1, "someone")
+    assert len(sender.sent) == 17
+
+    # a restart, with a new store on the same file
+    assert exporter(tmp_path).export(1, 1, "someone") == (13, True)
+    assert sender.sent == [post["shortcode"] for post in profile.posts]
+
+
+def test_interrupted_first_page_resumes(tmp_path, monkeypatch, profile):
+    sender = FakeSender(fail_at="post25")
+    monkeypatch.setattr(profile_export, "send_posts_batched", sender.send)
+    with pytest.raises(ConnectionError):
+        exporter(tmp_path).export(1, 1, "someone")
+    assert exporter(tmp_path).export(1, 1, "someone") == (26, True)
+    assert sender.sent == [post["shortcode"] for post in profile.posts]
+
+
+def test_export_continues_after_max_posts(tmp_path, monkeypatch, profile):
+    sender = FakeSender()
+    monkeypatch.setattr(profile_export, "send_posts_batched", sender.send)
+    assert exporter(tmp_path, max_posts=12).export(1, 1, "someone") == (12, False)
+    assert exporter(tmp_path, max_posts=12).export(1, 1, "someone") == (12, False)
+    assert exporter(tmp_path, max_posts=12).export(1, 1, "someone") == (6, True)
+    assert sender.sent == [post["shortcode"] for post in profile.posts]
+
+
+def test_next_export_sends_only_new_posts(tmp_path, monkeypatch, profile):
+    sender = FakeSender()
+    monkeypatch.setattr(profile_export, "send_posts_batched", sender.send)
+    assert exporter(tmp_path).export(1, 1, "someone") == (30, True)
+    profile.add_posts(3)
+    assert exporter(tmp_path).export(1, 1, "someone") == (3, True)
+    assert sender.sent[30:] == ["post32", "post31", "post30"]
+    # progress is per chat
+    assert exporter(tmp_path).export(2, 1, "someone") == (33, True)
+
+
+def test_pinned_posts_dont_end_the_export(tmp_path, monkeypatch, profile):
+    sender = FakeSender()
+    monkeypatch.setattr(profile_export, "send_posts_batched", sender.send)
+    assert exporter(tmp_path).export(1, 1, "someone") == (30, True)
+    profile.add_posts(2)
+    # an old post pinned on top of the newer ones
+    profile.posts.insert(0, {"shortcode": "pinned", "taken_at": 500, "pinned": True})
+    assert exporter(tmp_path).export(1, 1, "someone") == (2, True)
+    assert sender.sent[30:] == ["post31", "post30"]
+
+
+def test_pack_chunks_limits():
+    posts = [
+        ("a", ["a"] * 3, True),
+        ("b", ["b"] * 4, True),
+        ("c", ["c"] * 5, True),
+        ("d", ["d"] * 12, True),
+        ("e", ["e"] * 2, False),
+        ("f", ["f"] * 1, True),
+    ]
+    chunks = pack_chunks(posts)
+    assert [chunk["posts"] for chunk in chunks] == [
+        [("a", 3), ("b", 4)],
+        [("c", 5)],
+        # over 10 items, split over two groups
+        [("d", 10)],
+        [("d", 2)],
+        # file_ids and urls aren't mixed
+        [("e", 2)],
+        [("f", 1)],
+    ]
+    assert all(len(chunk["items"]) <= 10 for chunk in chunks)
+    assert [item for chunk in chunks for item in chunk["items"]] == [item for _, items, _ in posts for item in items]
@@ -0,0 +1,74 @@
+from media_parser import IMAGE, VIDEO, MediaItem, Rendition
+from renditions import BALANCED, FAST, HIGH, QualityStore, covers, select_rendition
+
+MB = 1024 * 1024
+
+PHOTO = MediaItem(IMAGE, "https://cdn/1080.jpg", (
+    Rendition("https://cdn/320.jpg", 320, 400, None),
+    Rendition("https://cdn/640.jpg", 640, 800, None),
+    Rendition("https://cdn/750.jpg", 750, 938, None),
+    Rendition("https://cdn/1080.jpg", 1080, 1350, None),
+))
+
+VIDEO_ITEM = MediaItem(VIDEO, "https://cdn/1080.mp4", (
+    Rendition("https://cdn/1080.mp4", 1080, 1920, 12 * MB),
+    Rendition("https://cdn/720.mp4", 720, 1280, 5 * MB),
+    Rendition("https://cdn/480.mp4", 480, 854, 2 * MB),
+))
+
+
+def test_item_without_renditions():
+    item = MediaItem(VIDEO, "https://cdn/only.mp4")
+    assert all(select_rendition(item, quality) == "https://cdn/only.mp4" for quality in (HIGH, BALANCED, FAST))
+
+
+def test_photo_tiers_by_side():
+    assert select_rendition(PHOTO, HIGH) == "https://cdn/1080.jpg"
+    assert select_rendition(PHOTO, BALANCED) == "https://cdn/1080.jpg"
+    assert select_rendition(PHOTO, FAST) == "https://cdn/640.jpg"
+
+
+def test_video_tiers_by_size():
+    assert select_rendition(VIDEO_ITEM, HIGH) == "https://cdn/1080.mp4"
+    # 12 MB is over balanced's 8 MB
+    assert select_rendition(VIDEO_ITEM, BALANCED) == "https://cdn/720.mp4"
+    assert select_rendition(VIDEO_ITEM, FAST) == "https://cdn/480.mp4"
+
+
+def test_size_caps_apply_when_known():
+    item = MediaItem(VIDEO, "https://cdn/big.mp4", (
+        Rendition("https://cdn/big.mp4", 720, 1280, 30 * MB),
+        Rendition("https://cdn/unknown.mp4", 540, 960, None),
+    ))
+    # over telegram's url limit, the rendition without a size estimate is taken
+    assert select_rendition(item, HIGH) == "https://cdn/unknown.mp4"
+
+
+def test_falls_back_to_the_smallest_rendition():
+    item = MediaItem(VIDEO, "https://cdn/a.mp4", (
+        Rendition("https://cdn/a.mp4", 1080, 1920, 40 * MB),
+        Rendition("https://cdn/b.mp4", 720, 1280, 25 * MB),
+        Rendition("https://cdn/c.mp4", 1440, 2560, 60 * MB),
+    ))
+    assert select_rendition(item, HIGH) == "https://cdn/b.mp4"
+    assert select_rendition(item, FAST) == "https://cdn/b.mp4"
+
+
+def test_unknown_tier_is_high():
+    assert select_rendition(VIDEO_ITEM, "best") == select_rendition(VIDEO_ITEM, HIGH)
+
+
+def test_covers():
+    assert covers(HIGH, FAST) and covers(BALANCED, BALANCED)
+    assert not covers(FAST, BALANCED)
+    # uploads from before tiers were the largest renditions
+    assert covers(None, HIGH)
+
+
+def test_quality_store(tmp_path):
+    store = QualityStore(str(tmp_path / "settings.db"), default=BALANCED)
+    assert store.get(1) == BALANCED
+    store.set(1, FAST)
+    assert store.get(1) == FAST
+    # read back from the file by a new store
+    assert QualityStore(str(tmp_path / "settings.db")).get(1) == FAST
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from send_scheduler import SendScheduler, TokenBucket
+
+
+def too_many_requests(retry_after):
+    return ApiTelegramException("sendMessage", None, {
+        "error_code": 429,
+        "description": f"Too Many Requests: retry after {retry_after}",
+        "parameters": {"retry_after": retry_after},
+    })
+
+
+def test_bucket_needs_a_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0, 1)
+
+
+def test_bucket_reservations_queue_up():
+    bucket = TokenBucket(10, 2)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(4)] == [0.0, 0.0, pytest.approx(0.1), pytest.approx(0.2)]
+
+
+def test_calls_to_a_chat_are_paced():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=20, chat_burst=1, workers=1)
+    times = [scheduler.call(1, time.monotonic) for _ in range(5)]
+    # one call right away, then one every 50ms
+    assert times[-1] - times[0] >= 0.19
+    assert scheduler.stats["calls"] == 5
+    assert scheduler.stats["waited"] == 4
+
+
+def test_retry_after_pauses_the_chat():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=10, workers=1)
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise too_many_requests(0.2)
+        return "sent"
+
+    assert scheduler.call(1, send) == "sent"
+    assert attempts[1] - attempts[0] >= 0.19
+    assert scheduler.stats["rate_limited"] == 1
+    # the pause is for that chat only
+    started = time.monotonic()
+    scheduler.call(2, lambda: None)
+    assert time.monotonic() - started < 0.1
+
+
+def test_other_errors_are_not_retried():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=10, workers=1)
+    attempts = []
+
+    def send():
+        attempts.append(1)
+        raise ApiTelegramException("sendMessage", None, {"error_code": 400, "description": "Bad Request"})
+
+    with pytest.raises(ApiTelegramException):
+        scheduler.call(1, send)
+    assert len(attempts) == 1
+
+
+def test_one_chat_doesnt_use_up_the_global_budget():
+    scheduler = SendScheduler(global_rate=10, chat_rate=2, chat_burst=1, workers=1)
+    # a flood of calls to one chat, each waiting for that chat's turn
+    flood = [threading.Thread(target=scheduler.call, args=(1, lambda: None), daemon=True) for _ in range(20)]
+    for thread in flood:
+        thread.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    scheduler.call(2, lambda: None)
+    assert time.monotonic() - started < 0.1
+    assert scheduler.stats["calls"] == 2
+    assert scheduler.stats["waiting"] == 19
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import share_resolver
+from link_router import route_text
+from share_resolver import (
+    NOT_FOUND,
+    LoginRequired,
+    follow_share_link,
+    location_shortcode,
+    route_post_count,
+    resolve_share_link,
+    route_post_shortcodes,
+    share_cache,
+)
+
+
+class Response(SimpleNamespace):
+    def __init__(self, status_code, location=None):
+        super().__init__(status_code=status_code, is_redirect=location is not None,
+                         headers={"Location": location} if location else {}, closed=False)
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+def redirect(location):
+    return SimpleNamespace(status_code=302, is_redirect=True, headers={"Location": location}, close=lambda: None)
+
+
+def test_location_shortcode():
+    assert location_shortcode("https://www.instagram.com/reel/ABCDEFGHIJK/?igsh=x") == "ABCDEFGHIJK"
+    assert location_shortcode("https://www.instagram.com/accounts/login/?next=/p/ABCDEFGHIJK/") == "ABCDEFGHIJK"
+    assert location_shortcode("https://www.instagram.com/accounts/login/") is None
+
+
+def test_redirects_are_followed(monkeypatch):
+    hops = iter([redirect("/share/hop/"), redirect("https://www.instagram.com/p/ABCDEFGHIJK/")])
+    monkeypatch.setattr(share_resolver, "request_with_retries", lambda *args, **kwargs: next(hops))
+    assert follow_share_link("https://www.instagram.com/share/TOKEN1/") == "ABCDEFGHIJK"
+
+
+def test_dead_link(monkeypatch):
+    response = SimpleNamespace(status_code=200, is_redirect=False, headers={}, close=lambda: None)
+    monkeypatch.setattr(share_resolver, "request_with_retries", lambda *args, **kwargs: response)
+    assert follow_share_link("https://www.instagram.com/share/TOKEN2/") == NOT_FOUND
+
+
+def test_cached_share_links_resolve_without_requests(monkeypatch):
+    def no_requests(*args, **kwargs):
+        raise AssertionError("resolved again")
+
+    monkeypatch.setattr(share_resolver, "request_with_retries", no_requests)
+    share_cache.set("CachedTok", "BBBBBBBBBBB")
+    share_cache.set("DeadTok", NOT_FOUND)
+    route = route_text(
+        "https://www.instagram.com/share/CachedTok/ instagram.com/p/AAAAAAAAAAA/ "
+        "instagram.com/share/DeadTok/ instagram.com/p/BBBBBBBBBBB/"
+    )
+    assert route_post_shortcodes(route) == ["BBBBBBBBBBB", "AAAAAAAAAAA"]
+    assert route_post_shortcodes(route, 1) == ["BBBBBBBBBBB"]
+    # counted before resolving: every distinct post or share link
+    assert route_post_count(route) == 4
+    assert route_post_count(route, 2) == 2
+
+
+def test_get_when_head_isnt_allowed(monkeypatch):
+    responses = [Response(405), Response(302, "https://www.instagram.com/p/ABCDEFGHIJK/")]
+    methods = []
+
+    def request(method, *args, **kwargs):
+        methods.append(method)
+        return responses[len(methods) - 1]
+
+    monkeypatch.setattr(share_resolver, "request_with_retries", request)
+    assert follow_share_link("https://www.instagram.com/share/TOKEN3/") == "ABCDEFGHIJK"
+    assert methods == ["HEAD", "GET"]
+    # the HEAD response gives its connection back before the GET
+    assert all(response.closed for response in responses)
+
+
+@pytest.mark.parametrize("response", [
+    Response(401),
+    Response(429),
+    Response(302, "https://www.instagram.com/accounts/login/"),
+])
+def test_blocks_are_not_cached_as_dead_links(monkeypatch, response):
+    monkeypatch.setattr(share_resolver, "request_with_retries", lambda *args, **kwargs: response)
+    link = route_text("https://www.instagram.com/share/BlockTok/").links[0]
+    with pytest.raises((requests.HTTPError, LoginRequired)):
+        resolve_share_link(link)
+    assert share_cache.get("BlockTok") is None
+    assert route_post_shortcodes(route_text(link.url)) == []
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from shortcode import (
+    code_to_media_id,
+    codes_to_media_ids,
+    media_id_to_code,
+    media_ids_to_codes,
+    shortcode_key,
+)
+
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+def reference_media_id(code):
+    # archived_codes.code_to_media_id
+    media_id = 0
+    for letter in code:
+        media_id = media_id * 64 + ALPHABET.index(letter)
+    return media_id
+
+
+def test_known_post():
+    media_id = reference_media_id("C0KuSEuI_JU")
+    assert code_to_media_id("C0KuSEuI_JU") == media_id
+    assert media_id_to_code(media_id) == "C0KuSEuI_JU"
+
+
+def test_round_trip():
+    rng = random.Random(17)
+    media_ids = [0, 1, 63, 64, 2 ** 63 - 1, 2 ** 64 - 1] + [rng.getrandbits(63) for _ in range(500)]
+    codes = [media_id_to_code(media_id) for media_id in media_ids]
+    assert [code_to_media_id(code) for code in codes] == media_ids
+    assert media_ids_to_codes(media_ids) == codes
+    assert codes_to_media_ids(codes) == media_ids
+
+
+def test_zero_is_a():
+    assert media_id_to_code(0) == "A"
+    assert media_ids_to_codes([0, 1]) == ["A", "B"]
+
+
+@pytest.mark.parametrize("code", ["", "ABC DEF", "ABC+DEF"])
+def test_invalid_codes(code):
+    with pytest.raises(ValueError):
+        code_to_media_id(code)
+    with pytest.raises(ValueError):
+        codes_to_media_ids([code])
+
+
+def test_keys_keep_leading_a():
+    # the same media id, but two different shortcodes
+    assert code_to_media_id("ABCDEFGHIJK") == code_to_media_id("BCDEFGHIJK")
+    assert shortcode_key("ABCDEFGHIJK") != shortcode_key("BCDEFGHIJK")
+
+
+def test_keys_are_injective():
+    rng = random.Random(18)
+    codes = {"A" * 11, "A" * 10 + "B", "B", "AB", "_" * 11}
+    for length in (8, 10, 11, 12, 40):
+        for _ in range(200):
+            codes.add("".join(rng.choice("AB" if rng.random() < 0.3 else ALPHABET) for _ in range(length)))
+    keys = {shortcode_key(code) for code in codes}
+    assert len(keys) == len(codes)
+
+
+def test_key_types():
+    assert isinstance(shortcode_key("C0KuSEuI_JU"), int)
+    # too large for a sqlite integer
+    assert shortcode_key("_" * 11) == "_" * 11
+    assert shortcode_key("C0KuSEuI") == "C0KuSEuI"
@@ -0,0 +1,68 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from update_dispatcher import UpdateDispatcher, update_chat_key
+
+
+def message_update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)))
+
+
+def wait_processed(dispatcher, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while dispatcher.stats()["processed"] < count:
+        assert time.monotonic() < deadline, "updates weren't processed"
+        time.sleep(0.01)
+
+
+def test_chat_key():
+    assert update_chat_key(message_update(1, 42)) == 42
+    callback = SimpleNamespace(update_id=2, callback_query=SimpleNamespace(message=None, from_user=SimpleNamespace(id=7)))
+    assert update_chat_key(callback) == 7
+
+
+def test_updates_of_a_chat_keep_their_order():
+    seen = []
+    dispatcher = UpdateDispatcher(lambda updates: seen.extend(u.update_id for u in updates), 4, 400)
+    for update_id in range(100):
+        assert dispatcher.submit(message_update(update_id, update_id % 3))
+    wait_processed(dispatcher, 100)
+    for chat_id in range(3):
+        ids = [update_id for update_id in seen if update_id % 3 == chat_id]
+        assert ids == sorted(ids)
+
+
+def test_redelivered_updates_are_dropped():
+    dispatcher = UpdateDispatcher(lambda updates: None, 1, 10)
+    assert dispatcher.submit(message_update(1, 5))
+    assert dispatcher.submit(message_update(1, 5))
+    wait_processed(dispatcher, 1)
+    stats = dispatcher.stats()
+    assert stats["accepted"] == 1 and stats["duplicates"] == 1
+
+
+def test_full_queue_refuses_updates():
+    release = threading.Event()
+    dispatcher = UpdateDispatcher(lambda updates: release.wait(), 1, 1)
+    try:
+        assert dispatcher.submit(message_update(1, 5)) # taken by the worker
+        deadline = time.monotonic() + 5
+        while dispatcher.stats()["queue_depth"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert dispatcher.submit(message_update(2, 5)) # waits in the queue
+        assert not dispatcher.submit(message_update(3, 5))
+        assert dispatcher.stats()["rejected"] == 1
+    finally:
+        release.set()
+
+
+def test_handler_errors_are_counted():
+    def fail(updates):
+        raise RuntimeError("handler bug")
+
+    dispatcher = UpdateDispatcher(fail, 1, 10)
+    dispatcher.submit(message_update(1, 5))
+    wait_processed(dispatcher, 1)
+    assert dispatcher.stats()["errors"] == 1
@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+def update_chat_key(update) -> int:
+    """
+    Chat an update belongs to. Updates of the same chat always land on the same worker, in order.
+    """
+    for attr in ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member", "chat_member"):
+        obj = getattr(update, attr, None)
+        if obj is not None and getattr(obj, "chat", None) is not None:
+            return obj.chat.id
+    callback = getattr(update, "callback_query", None)
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    """
+    Processes webhook updates on a fixed set of worker threads, one bounded queue per worker.
+
+    - per-chat ordering: a chat is always routed to the same worker
+    - backpressure: submit() returns False when the worker queue is full
+    - redelivered updates (same update_id) are dropped
+    """
+    def __init__(self, process, workers: int, queue_size: int, dedup_size: int = 10000):
+        self.process = process
+        self.dedup_size = dedup_size
+        per_worker = max(1, queue_size // workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {
+            "accepted": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "processed": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i, q in enumerate(self._queues):
+            threading.Thread(target=self._worker, args=(q,), name=f"update-worker-{i}", daemon=True).start()
+
+    def submit(self, update) -> bool:
+        """
+        Queues an update. Returns False if it couldn't be accepted right now (caller should ask for a retry).
+        """
+        self.start()
+        q = self._queues[update_chat_key(update) % len(self._queues)]
+        with self._lock:
+            if update.update_id in self._seen:
+                self._stats["duplicates"] += 1
+                return True
+            try:
+                q.put_nowait((time.monotonic(), update))
+            except queue.Full:
+                self._stats["rejected"] += 1
+                return False
+            self._seen[update.update_id] = None
+            if len(self._seen) > self.dedup_size:
+                self._seen.popitem(last=False)
+            self._stats["accepted"] += 1
+        return True
+
+    def _worker(self, q):
+        while True:
+            queued_at, update = q.get()
+            try:
+                self.process([update])
+            except Exception as e:
+                print("Update processing error:", repr(e))
+                with self._lock:
+                    self._stats["errors"] += 1
+            # time from acknowledging telegram to finishing the handler
+            latency = time.monotonic() - queued_at
+            with self._lock:
+                self._stats["processed"] += 1
+                self._stats["latency_total"] += latency
+                self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+            q.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        latency_total = stats.pop("latency_total")
+        stats["latency_avg"] = latency_total / stats["processed"] if stats["processed"] else 0.0
+        stats["queue_depth"] = sum(q.qsize() for q in self._queues)
+        stats["queue_depth_per_worker"] = [q.qsize() for q in self._queues]
+        stats["workers"] = len(self._queues)
+        return stats
@@ -1,9 +1,6 @@
 import os
 from dotenv import load_dotenv
 
-import instaloader
-from instaloader import *
-
 import re
 import requests
 import traceback # to print error traceback
@@ -25,6 +22,16 @@ if not bot_token:
 
 log_channel_id_raw = (os.getenv("INSTAGRAM_DOWNLOADER_LOG_CHANNEL_ID") or "").strip()
 log_channel_id = int(log_channel_id_raw) if log_channel_id_raw.lstrip("-").isdigit() else None
+log_queue_size = int(os.getenv("LOG_QUEUE_SIZE", "1000")) # log lines buffered before new ones get dropped
+log_min_interval = float(os.getenv("LOG_MIN_INTERVAL", "3")) # seconds between log messages, channels allow ~20/min
+
+# bot api server, e.g. a local telegram-bot-api server, empty uses api.telegram.org
+telegram_api_url = (os.getenv("TELEGRAM_API_URL") or "").strip().rstrip("/")
+telegram_file_url = telegram_api_url + "/file/bot{0}/{1}" if telegram_api_url else None
+if telegram_api_url:
+    # async_bot.py points telebot.asyncio_helper at the same server
+    telebot.apihelper.API_URL = telegram_api_url + "/bot{0}/{1}"
+    telebot.apihelper.FILE_URL = telegram_file_url
 
 # initialize bot
 bot = telebot.TeleBot(bot_token, parse_mode="HTML")
@@ -34,13 +41,89 @@ bot_username = "@quick_instagram_bot"
 caption_trail = "\n\n\n" + bot_username
 session_file_name = "session" # any name change should apply to .gitignore too
 
-# warp socks proxy
+# warp socks proxy, or a list of egress proxies (see proxy_pool.parse_proxies)
 warp_proxies_raw = os.environ.get("WARP_PROXIES", "[]").strip()
 warp_proxies = json.loads(warp_proxies_raw or "[]")
-
-# regex
-insta_post_or_reel_reg = r'(?:https?://www\.)?instagram\.com\S*?/(p|reel)/([a-zA-Z0-9_-]{11})/?'
-spotify_link_reg = r'(?:https?://)?open\.spotify\.com/(track|album|playlist|artist)/[a-zA-Z0-9]+'
+proxy_cooldown = float(os.getenv("PROXY_COOLDOWN", "60")) # seconds a proxy rests after a 401/429, doubles on repeats
+proxy_failure_threshold = int(os.getenv("PROXY_FAILURE_THRESHOLD", "3")) # errors in a row before a proxy rests
+
+# instagram post lookups, only pointed elsewhere by tests and benchmarks/bench_offline.py
+instagram_graphql_url = (os.getenv("INSTAGRAM_GRAPHQL_URL") or "https://www.instagram.com/graphql/query").strip()
+
+# pooled http client for instagram
+http_pool_size = int(os.getenv("HTTP_POOL_SIZE", "16")) # keep-alive connections per host
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")) # seconds
+http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "20")) # seconds
+http_max_retries = int(os.getenv("HTTP_MAX_RETRIES", "2")) # extra attempts on 429/5xx/connection errors
+
+# debug capture of raw instagram responses (off by default, no disk writes in production)
+debug_capture_dir = (os.getenv("DEBUG_CAPTURE_DIR") or "debug_captures").strip()
+debug_capture_sample = int(os.getenv("DEBUG_CAPTURE_SAMPLE", "0")) # keep 1 in N responses, 0 disables sampling
+debug_capture_on_failure = os.getenv("DEBUG_CAPTURE_ON_FAILURE", "0").strip().lower() in ("1", "true", "yes")
+debug_capture_max_files = int(os.getenv("DEBUG_CAPTURE_MAX_FILES", "50"))
+debug_capture_max_bytes = int(os.getenv("DEBUG_CAPTURE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# several links in one message
+max_links_per_message = int(os.getenv("MAX_LINKS_PER_MESSAGE", "10"))
+bulk_lookup_workers = int(os.getenv("BULK_LOOKUP_WORKERS", "16")) # lookup threads shared by everyone
+bulk_per_user_lookups = int(os.getenv("BULK_PER_USER_LOOKUPS", "3")) # concurrent lookups one user can have
+
+# /profile exports
+profile_export_db = (os.getenv("PROFILE_EXPORT_DB") or "profile_exports.db").strip() # sqlite file keeping export cursors
+profile_export_max_posts = int(os.getenv("PROFILE_EXPORT_MAX_POSTS", "60")) # posts sent per /profile, the next one continues
+
+# media quality, the rendition sent is picked per user (/quality) within telegram's url fetch limits
+user_settings_db = (os.getenv("USER_SETTINGS_DB") or "user_settings.db").strip() # sqlite file keeping /quality choices
+default_quality = (os.getenv("DEFAULT_QUALITY") or "high").strip().lower() # high, balanced or fast
+
+# instagram.com/share/... links (share token -> shortcode), shares the media cache sqlite file
+share_cache_size = int(os.getenv("SHARE_CACHE_SIZE", "10000"))
+share_cache_ttl = int(os.getenv("SHARE_CACHE_TTL", str(30 * 24 * 3600))) # seconds, a share link always leads to the same post
+
+# download admission, token buckets in front of instagram lookups (one token per post)
+admission_user_rate = float(os.getenv("ADMISSION_USER_RATE", "0.2")) # posts per second one user can download, 0 for no limit
+admission_user_burst = float(os.getenv("ADMISSION_USER_BURST", "10")) # posts one user can download at once before pacing
+admission_global_rate = float(os.getenv("ADMISSION_GLOBAL_RATE", "5")) # posts per second over all users, 0 for no limit
+admission_global_burst = float(os.getenv("ADMISSION_GLOBAL_BURST", "50"))
+admission_max_queued_per_user = int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "20")) # downloads one user can have waiting
+admission_max_queued = int(os.getenv("ADMISSION_MAX_QUEUED", "2000")) # downloads waiting over all users
+admission_workers = int(os.getenv("ADMISSION_WORKERS", "8")) # threads running bot downloads let through after queueing
+
+# telegram send pacing
+telegram_global_rate = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")) # bot api calls per second, all chats
+telegram_chat_rate = float(os.getenv("TELEGRAM_CHAT_RATE", "1")) # calls per second to one chat
+telegram_chat_burst = float(os.getenv("TELEGRAM_CHAT_BURST", "5")) # calls one chat can get at once before pacing
+send_pipeline_workers = int(os.getenv("SEND_PIPELINE_WORKERS", "8")) # threads for background sends/deletes
+
+# streamed uploads, used when telegram can't fetch a cdn url by itself
+upload_max_bytes = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024))) # bot api upload limit
+upload_concurrency = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+# media resolution cache (shortcode -> media links and caption)
+media_cache_size = int(os.getenv("MEDIA_CACHE_SIZE", "2048"))
+media_cache_max_ttl = int(os.getenv("MEDIA_CACHE_MAX_TTL", "3600")) # seconds, cdn url expiry can only shorten it
+media_cache_db = (os.getenv("MEDIA_CACHE_DB") or "").strip() # sqlite file path, empty disables the disk tier
+
+# telegram file_id cache (shortcode -> already uploaded media), shares the sqlite file above
+file_id_cache_size = int(os.getenv("FILE_ID_CACHE_SIZE", "4096"))
+file_id_cache_ttl = int(os.getenv("FILE_ID_CACHE_TTL", str(30 * 24 * 3600)))
+
+# join-gate membership cache
+membership_cache_size = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "50000"))
+membership_joined_ttl = int(os.getenv("MEMBERSHIP_JOINED_TTL", "3600")) # seconds
+membership_not_joined_ttl = int(os.getenv("MEMBERSHIP_NOT_JOINED_TTL", "15")) # seconds, keep short so joining unlocks fast
+
+# mini app download jobs
+job_workers = int(os.getenv("JOB_WORKERS", "4"))
+job_store_db = (os.getenv("JOB_STORE_DB") or "").strip() # sqlite file shared by gunicorn workers, empty keeps jobs in memory
+
+# request ledger, one row per downloaded post for sizing caches and capacity
+ledger_db = os.getenv("LEDGER_DB", "ledger.db").strip() # sqlite file, empty disables the ledger
+ledger_queue_size = int(os.getenv("LEDGER_QUEUE_SIZE", "10000")) # rows waiting for the writer before new ones get dropped
+
+# webhook update processing
+update_workers = int(os.getenv("UPDATE_WORKERS", "8"))
+update_queue_size = int(os.getenv("UPDATE_QUEUE_SIZE", "256")) # split evenly between the workers
 
 # messages
 start_msg = '''Send an instagram link to download.
@@ -76,6 +159,9 @@ Private links may work only if the bot’s current session has access to view th
 - If it fails, try again later or send a different link
 - This bot does not claim video support in its current version
 
+<b>Quality</b>
+Send /quality to choose between the best quality, balanced or the fastest (smallest) files.
+
 <b>Support</b>
 If you run into issues or have questions, contact @asteriasmoons
 
@@ -91,11 +177,48 @@ end_msg = '''If you like the bot you can support me by giving a star <a href="ht
 
 You can also check out my other bot too: @lystaria_bot for more info use /lystaria'''
 
+join_gate_msg = '''<b>Join Gate Entry</b>
+
+Please join the updates channel. After joining, tap Refresh to unlock the bot.
+'''
+
 fail_msg = '''Sorry, my process wasn't successful. But you can try again another time or with another link.'''
 
+bulk_partial_fail_msg = '''{failed} of {total} links couldn't be downloaded. You can try those again another time.'''
+
+profile_usage_msg = '''Send /profile followed by a public instagram username, like this:
+/profile instagram'''
+
+profile_started_msg = '''Getting the posts of {username}, they will arrive in a few moments...'''
+
+profile_busy_msg = '''A profile download is already running for you. Wait for it to finish first.'''
+
+profile_done_msg = '''Done, {sent} posts of {username} sent. Send the same command later to get only the new ones.'''
+
+profile_more_msg = '''{sent} posts of {username} sent. Send the same command again to get the next ones.'''
+
+profile_not_found_msg = '''Couldn't find a public instagram profile named {username}.'''
+
+queued_msg = '''Lots of downloads are running right now, yours is number {position} in the queue. It starts by itself, no need to send the link again.'''
+
+rate_limited_msg = '''You've sent a lot of links in a short time. Wait a minute for the queued ones to arrive before sending more.'''
+
+quality_msg = '''Your download quality is <b>{quality}</b>.
+
+Change it with one of:
+/quality high - best quality telegram can fetch
+/quality balanced - up to 1080p, smaller files
+/quality fast - small files that arrive quickest
+
+Photos are sent in the size you pick, videos as instagram serves them.'''
+
+quality_set_msg = '''Download quality set to <b>{quality}</b>.'''
+
 wrong_pattern_msg = '''Wrong pattern.
 You should send an instagram post or reel link.'''
 
+unsupported_link_msg = '''Story links aren't supported yet. You can send post and reel links instead.'''
+
 reel_msg = '''Reel links are not supported at the moment. You can send post links instead.'''
 
 lystaria_msg = '''<b>Lystaria Bot</b>
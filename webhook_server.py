@@ -2,13 +2,19 @@ import os
 import json
 import hmac
 import hashlib
+import threading
+import traceback
 import urllib.parse
 from api import api
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, Response, request, send_from_directory
 
 from variables import bot  # uses your existing bot instance from variables.py
 
-import best_instagram_downloader  # ensures all @bot.message_handler decorators run
+from update_dispatcher import UpdateDispatcher
+from variables import update_workers, update_queue_size
+from send_scheduler import send_scheduler
+from admission import admission
+import metrics
 
 app = Flask(__name__)
 app.register_blueprint(api)
@@ -67,10 +73,64 @@ PUBLIC_URL = (os.getenv("PUBLIC_URL") or "").strip()          # Render service U
 WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
 WEBHOOK_URL = f"{PUBLIC_URL}{WEBHOOK_PATH}" if PUBLIC_URL else ""
 
+# chat_member is opt-in on telegram's side, it keeps the join-gate cache fresh
+ALLOWED_UPDATES = ["message", "edited_message", "callback_query", "chat_member"]
+
+# the dispatcher owns concurrency in webhook mode, handlers run inline on its workers
+bot.threaded = False
+
+# bot handlers are registered in the background so the server can answer right after boot,
+# updates that arrive earlier wait in the dispatcher queues
+handlers_ready = threading.Event()
+handlers_error = None # set when the handler module failed to import, / then fails the health check
+
+def load_handlers():
+    global handlers_error
+    try:
+        import best_instagram_downloader  # ensures all @bot.message_handler decorators run
+        # the rest of the download pipeline, not needed to answer before the handlers are in
+        import api_downloads
+        import pipeline_metrics
+    except BaseException as e:
+        traceback.print_exc()
+        handlers_error = repr(e)
+    finally:
+        handlers_ready.set()
+
+def process_updates(updates):
+    handlers_ready.wait()
+    if handlers_error is not None:
+        raise RuntimeError(f"bot handlers failed to load: {handlers_error}")
+    bot.process_new_updates(updates)
+
+update_dispatcher = UpdateDispatcher(process_updates, update_workers, update_queue_size)
+threading.Thread(target=load_handlers, name="load-handlers", daemon=True).start()
+
 @app.get("/")
 def health():
+    if handlers_error is not None:
+        return "bot handlers failed to load", 503
     return "ok"
 
+@metrics.collector
+def collect_stats():
+    updates = update_dispatcher.stats()
+    yield "downloader_update_queue_depth", "gauge", "Webhook updates waiting for a worker.", [({}, updates["queue_depth"])]
+    yield "downloader_updates_rejected_total", "counter", "Webhook updates refused with 503 because queues were full.", [({}, updates["rejected"])]
+
+    yield "downloader_admission_total", "counter", "Downloads let through (right away or after queueing), queued or refused.", [
+        ({"result": result}, value) for result, value in admission.stats.items()
+    ]
+    yield "downloader_admission_waiting", "gauge", "Downloads waiting in the admission queue.", [({}, admission.queued())]
+
+    yield "downloader_telegram_calls_total", "counter", "Bot api calls made through the send scheduler.", [({}, send_scheduler.stats["calls"])]
+    yield "downloader_telegram_rate_limited_total", "counter", "Bot api calls answered with 429.", [({}, send_scheduler.stats["rate_limited"])]
+    yield "downloader_telegram_waiting", "gauge", "Bot api calls waiting for their turn.", [({}, send_scheduler.stats["waiting"])]
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.post(WEBHOOK_PATH)
 def telegram_webhook():
     update = request.get_json(silent=True)
@@ -80,9 +140,14 @@ def telegram_webhook():
     from telebot.types import Update
     try:
         update_obj = Update.de_json(update)
-        bot.process_new_updates([update_obj])
     except Exception as e:
         print("Webhook processing error:", repr(e))
+        return "ok", 200
+
+    # acknowledge right away, the download happens on the dispatcher workers
+    if not update_dispatcher.submit(update_obj):
+        # queues are full, a non-200 makes telegram redeliver later
+        return "busy", 503
 
     return "ok", 200
 
@@ -100,9 +165,9 @@ def setup_webhook():
         bot.remove_webhook()
 
         if WEBHOOK_SECRET:
-            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
         else:
-            bot.set_webhook(url=WEBHOOK_URL)
+            bot.set_webhook(url=WEBHOOK_URL, allowed_updates=ALLOWED_UPDATES)
 
         print("Webhook set to:", WEBHOOK_URL)
 
@@ -118,9 +183,9 @@ def setup_webhook():
         bot.remove_webhook()
 
         if WEBHOOK_SECRET:
-            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
         else:
-            bot.set_webhook(url=WEBHOOK_URL)
+            bot.set_webhook(url=WEBHOOK_URL, allowed_updates=ALLOWED_UPDATES)
 
         print("Webhook set to:", WEBHOOK_URL)
 
@@ -131,5 +196,6 @@ def setup_webhook():
 if __name__ == "__main__":
     # Render provides PORT
     port = int(os.getenv("PORT", "10000"))
-    setup_webhook()
+    # talking to telegram shouldn't hold up the first response
+    threading.Thread(target=setup_webhook, name="setup-webhook", daemon=True).start()
     app.run(host="0.0.0.0", port=port)